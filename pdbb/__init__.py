@@ -19,6 +19,54 @@ import pyconfig
 # Default path to the dir with BDB, log, json and WHY NOT files
 pyconfig.set("BDB_FILE_DIR_PATH", ".")
 
+# TLSANL command (e.g. the offline stand-in pdbb.benchmarks.tlsanl_stub)
+pyconfig.set("TLSANL_CMD", ["tlsanl"])
+
 # TLSANL log file names
 pyconfig.set("TLSANL_LOG", "tlsanl.log")
 pyconfig.set("TLSANL_ERR", "tlsanl.err")
+
+# Directory for uncompressed copies of compressed input files that TLSANL
+# needs on disk (None: the system default temporary directory)
+pyconfig.set("SCRATCH_DIR", None)
+
+# TLSANL time limit in seconds (None: no limit)
+pyconfig.set("TLSANL_TIMEOUT", None)
+
+# Batch metrics file names (in the BDB root directory)
+pyconfig.set("METRICS_PROM", "bdb_metrics.prom")
+pyconfig.set("METRICS_JSON", "bdb_metrics.json")
+
+# Aggregate profile file names (in the BDB root directory)
+pyconfig.set("PROFILE_PSTATS", "bdb_profile.pstats")
+pyconfig.set("PROFILE_COLLAPSED", "bdb_profile.collapsed")
+
+# Parse the coordinates of files of at least this size (bytes) in parallel
+# (None: never) with this number of processes (None: number of CPUs)
+pyconfig.set("PARALLEL_PARSE_MIN_BYTES", 100 * 1024 * 1024)
+pyconfig.set("PARALLEL_PARSE_JOBS", None)
+
+# Batch read-ahead: number of files (None: twice the number of workers, 0:
+# none) and their total size (bytes)
+pyconfig.set("PREFETCH_FILES", None)
+pyconfig.set("PREFETCH_BYTES", 512 * 1024 * 1024)
+
+# Keep an index of the records of the PDB files for later runs, next to the
+# PDB files (RECORD_INDEX_DIR None) or in this directory
+pyconfig.set("RECORD_INDEX", False)
+pyconfig.set("RECORD_INDEX_DIR", None)
+
+# Directory of the atom table cache (None: no cache) and its size limit
+# (bytes, None: no limit)
+pyconfig.set("ATOM_CACHE_DIR", None)
+pyconfig.set("ATOM_CACHE_BYTES", 10 * 1024 * 1024 * 1024)
+
+# SQLite database of the refinement features of the entries (None: not
+# stored) and the report of bdb-batch --redecide (in the BDB root directory)
+pyconfig.set("FEATURE_STORE", None)
+pyconfig.set("REDECIDE_JSON", "bdb_redecide.json")
+
+# Count the hits of the branches of the refinement program logic (see
+# pdbb.branches) and the file bdb-batch writes them to (in the BDB root)
+pyconfig.set("BRANCH_PROFILE", False)
+pyconfig.set("BRANCH_PROFILE_JSON", "bdb_branches.json")
@@ -23,16 +23,25 @@ import argparse
 import json
 import os
 import pyconfig
-import shutil
 
 from pdbb.bdb_utils import (is_valid_directory, is_valid_file, is_valid_pdbid,
                             get_bdb_entry_outdir, write_whynot)
-from pdbb.check_beq import (determine_b_group, get_structure,
+from pdbb.check_beq import (determine_b_group, determine_b_group_chains,
+                            determine_b_segments, get_structure,
                             write_multiplied_8pipi)
 from pdbb.expdta import check_exp_methods
-from pdbb.pdb.parser import parse_pdb_file
-from pdbb.refprog import get_refi_data
+from pdbb.features import store_features
+from pdbb.pdb.atoms import read_atom_table
+from pdbb.pdb.files import copy_pdb_file
+from pdbb.pdb.parser import (PdbFileReader, parse_tls_groups,
+                             parse_tls_selection)
+from pdbb.profiling import profile_call
+from pdbb.refprog import decide_refi_data, extract_refi_features
 from pdbb.requirements import check_deps
+from pdbb.streaming import analyze_chains
+from pdbb.timings import NULL_TIMER, StageTimer
+from pdbb.tls import (check_tls_ranges, compile_tls_groups, residue_index,
+                      tls_group_masks, tls_group_stats)
 from pdbb.tlsanl_wrapper import parse_skttls_summ, run_tlsanl
 
 
@@ -52,80 +61,159 @@ def date_handler(obj):
     return obj.date().isoformat() if hasattr(obj, 'isoformat') else obj
 
 
-def create_bdb_entry(pdb_file_path, pdb_id, verbose=False):
+def create_bdb_entry(pdb_file_path, pdb_id, verbose=False, stage_timer=None,
+                     streaming=False):
     """Create a bdb entry.
 
+    With streaming, the coordinates are analyzed one chain at a time
+    (pdbb.streaming) instead of from a Biopython structure and an atom table
+    of the whole entry, which bounds the memory use by the largest chain.
+
+    If a pdbb.timings.StageTimer is given, the wall time, CPU time and peak
+    memory of the pipeline stages are recorded in it and written to the
+    "timings" section of the json file.
+
     Return True when a bdb has been created successfully.
     """
 
     _log.debug("Creating bdb entry...")
+    timer = stage_timer if stage_timer is not None else NULL_TIMER
 
-    # Parse the given pdb file into a dict...
-    pdb_records = parse_pdb_file(pdb_file_path)
-
-    # and a Biopython structure
-    structure = get_structure(pdb_file_path, pdb_id, verbose)
-
-    bdbd = {"pdb_id": pdb_id}
-    expdta = check_exp_methods(pdb_records, pdb_id)
-    bdbd.update(expdta)
-    created_bdb_file = False
-    if expdta["expdta_useful"]:
-        refi_data = get_refi_data(pdb_records, structure, pdb_id)
-        bdbd.update(refi_data)
-
-        # Info about B-factor group type
-        b_group = determine_b_group(structure)
-        bdbd.update(b_group)
-
-        # skttles outliers
-        skttls = {"skttls_tot": None,
-                  "skttls_95th": None,
-                  "skttls_99th": None}
-        bdbd.update(skttls)
-
-        if refi_data["is_bdb_includable"]:
-            bdb_file_dir = pyconfig.get("BDB_FILE_DIR_PATH")
-            bdb_file_path = os.path.join(bdb_file_dir, pdb_id + ".bdb")
-            if refi_data["req_tlsanl"]:
-                if run_tlsanl(
-                        pdb_file_path=pdb_file_path,
-                        xyzout=bdb_file_path,
-                        pdb_id=pdb_id,
-                        log_out_dir=bdb_file_dir):
-                    created_bdb_file = True
-                    tlsanl_log = os.path.join(bdb_file_dir,
-                                              pyconfig.get("TLSANL_LOG"))
-                    skttls = parse_skttls_summ(tlsanl_log=tlsanl_log)
-                    bdbd.update(skttls)
-
-            elif refi_data["b_msqav"]:
-                if write_multiplied_8pipi(
-                        pdb_file_path=pdb_file_path,
-                        xyzout=bdb_file_path,
-                        pdb_id=pdb_id,
-                        verbose=verbose):
-                    created_bdb_file = True
+    # The file is read (and decompressed) once for all stages
+    with PdbFileReader(pdb_file_path, keep=not streaming) as reader:
+        # Parse the header of the given pdb file into a dict...
+        with timer.stage("parse_pdb_file"):
+            pdb_records = reader.parse_header()
 
-            elif refi_data["assume_iso"]:
-                shutil.copy(pdb_file_path, bdb_file_path)
-                created_bdb_file = True
+        bdbd = {"pdb_id": pdb_id}
+        expdta = check_exp_methods(pdb_records, pdb_id)
+        bdbd.update(expdta)
+        created_bdb_file = False
+        if expdta["expdta_useful"]:
+            # ...and the rest of the records (only needed for useful entries)
+            with timer.stage("parse_pdb_file"):
+                pdb_records = reader.parse()
 
+            if streaming:
+                tls_selections = parse_tls_selection(pdb_records)
+                with timer.stage("analyze_chains"):
+                    analysis = analyze_chains(pdb_file_path,
+                                              parse_tls_groups(pdb_records),
+                                              tls_selections)
+                with timer.stage("get_refi_data"):
+                    features = extract_refi_features(pdb_records, None,
+                                                     pdb_id, stage_timer=timer,
+                                                     chain_analysis=analysis)
+                    refi_data = decide_refi_data(features, stage_timer=timer)
+                bdbd.update(refi_data)
+                bdbd.update(analysis.b_group())
+                bdbd["chain_b"] = analysis.chain_b()
+                bdbd.update(analysis.b_segments())
+                bdbd["tls_ranges"] = analysis.tls_ranges(tls_selections) \
+                    if tls_selections else None
+                bdbd["tls_atoms"] = analysis.tls_atoms()
             else:
-                message = "Unexpected bdb status"
-                write_whynot(pdb_id, message)
-                _log.error("{}.".format(message))
-
-        # Write the bdb metadata to a json file
-        try:
-            with open(os.path.join(pyconfig.get("BDB_FILE_DIR_PATH"),
-                      pdb_id + ".json"),
-                      "w") as f:
-                json.dump(bdbd, f, sort_keys=True, indent=4,
-                          default=date_handler)
-        except IOError as ex:
-            _log.error(ex)
-            return False
+                # ...and a Biopython structure (only needed for useful
+                # entries)
+                with timer.stage("get_structure"):
+                    structure = get_structure(pdb_file_path, pdb_id, verbose)
+
+                with timer.stage("get_refi_data"):
+                    features = extract_refi_features(pdb_records, structure,
+                                                     pdb_id, stage_timer=timer)
+                    refi_data = decide_refi_data(features, stage_timer=timer)
+                bdbd.update(refi_data)
+
+                # Info about B-factor group type
+                with timer.stage("determine_b_group"):
+                    b_group = determine_b_group(structure)
+                bdbd.update(b_group)
+
+                # ...and per chain, from all residues
+                with timer.stage("read_atom_table"):
+                    atoms = read_atom_table(pdb_file_path)
+                with timer.stage("determine_b_group_chains"):
+                    bdbd["chain_b"] = determine_b_group_chains(atoms)
+                with timer.stage("determine_b_segments"):
+                    bdbd.update(determine_b_segments(atoms))
+
+                # Residues in the TLS groups (REFMAC-style TLS specifications
+                # only)
+                with timer.stage("check_tls_ranges"):
+                    tls_selections = parse_tls_selection(pdb_records)
+                    bdbd["tls_ranges"] = check_tls_ranges(
+                        residue_index(atoms), tls_selections) \
+                        if tls_selections else None
+
+                # Atoms in the TLS groups (REFMAC and PHENIX-style selections)
+                with timer.stage("tls_group_masks"):
+                    tls_groups = parse_tls_groups(pdb_records)
+                    if tls_groups:
+                        compiled = compile_tls_groups(tls_groups)
+                        bdbd["tls_atoms"] = tls_group_stats(
+                            atoms, tls_group_masks(atoms, compiled),
+                            [g["error"] for g in compiled])
+                    else:
+                        bdbd["tls_atoms"] = None
+
+            # Keep the features to decide again after rule changes (--redecide)
+            if pyconfig.get("FEATURE_STORE") is not None:
+                store_features(features, refi_data)
+
+            # skttles outliers
+            skttls = {"skttls_tot": None,
+                      "skttls_95th": None,
+                      "skttls_99th": None}
+            bdbd.update(skttls)
+
+            if refi_data["is_bdb_includable"]:
+                bdb_file_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+                bdb_file_path = os.path.join(bdb_file_dir, pdb_id + ".bdb")
+                if refi_data["req_tlsanl"]:
+                    with timer.stage("run_tlsanl"):
+                        tlsanl_ok = run_tlsanl(
+                            pdb_file_path=pdb_file_path,
+                            xyzout=bdb_file_path,
+                            pdb_id=pdb_id,
+                            log_out_dir=bdb_file_dir)
+                    if tlsanl_ok:
+                        created_bdb_file = True
+                        tlsanl_log = os.path.join(bdb_file_dir,
+                                                  pyconfig.get("TLSANL_LOG"))
+                        skttls = parse_skttls_summ(tlsanl_log=tlsanl_log)
+                        bdbd.update(skttls)
+
+                elif refi_data["b_msqav"]:
+                    with timer.stage("write_multiplied_8pipi"):
+                        created_bdb_file = bool(write_multiplied_8pipi(
+                            pdb_file_path=pdb_file_path,
+                            xyzout=bdb_file_path,
+                            pdb_id=pdb_id,
+                            verbose=verbose))
+
+                elif refi_data["assume_iso"]:
+                    with timer.stage("copy_pdb_file"):
+                        copy_pdb_file(pdb_file_path, bdb_file_path)
+                    created_bdb_file = True
+
+                else:
+                    message = "Unexpected bdb status"
+                    write_whynot(pdb_id, message)
+                    _log.error("{}.".format(message))
+
+            if stage_timer is not None:
+                bdbd["timings"] = stage_timer.report()
+
+            # Write the bdb metadata to a json file
+            try:
+                with open(os.path.join(pyconfig.get("BDB_FILE_DIR_PATH"),
+                          pdb_id + ".json"),
+                          "w") as f:
+                    json.dump(bdbd, f, sort_keys=True, indent=4,
+                              default=date_handler)
+            except IOError as ex:
+                _log.error(ex)
+                return False
 
     return created_bdb_file
 
@@ -142,6 +230,42 @@ def main():
         "-v", "--verbose",
         help="show verbose output",
         action="store_true")
+    parser.add_argument(
+        "--profile",
+        help="save a cProfile profile (.pstats) next to the log file",
+        action="store_true")
+    parser.add_argument(
+        "--timings",
+        help="record the time and memory used per stage in the json file",
+        action="store_true")
+    parser.add_argument(
+        "--streaming",
+        help="analyze the coordinates one chain at a time to bound the "
+             "memory use",
+        action="store_true")
+    parser.add_argument(
+        "--index",
+        help="keep an index (.idx) of the records of the PDB files, so "
+             "that later runs do not scan unchanged files again "
+             "(only useful for uncompressed files)",
+        action="store_true")
+    parser.add_argument(
+        "--index-dir",
+        help="directory for the indexes (default: next to the PDB files; "
+             "implies --index)",
+        type=lambda x: is_valid_directory(parser, x))
+    parser.add_argument(
+        "--atom-cache",
+        help="directory to cache the parsed coordinates in for later runs",
+        type=lambda x: is_valid_directory(parser, x))
+    parser.add_argument(
+        "--atom-cache-mb",
+        help="size limit (MB) of the coordinate cache (default: 10240)",
+        type=float)
+    parser.add_argument(
+        "--features",
+        help="SQLite database to store the refinement features of the "
+             "entries in, to decide again after rule changes")
     parser.add_argument(
         "bdb_root_path",
         help="Root directory of the bdb data.",
@@ -159,11 +283,29 @@ def main():
     pyconfig.set("BDB_FILE_DIR_PATH", get_bdb_entry_outdir(args.bdb_root_path,
                                                            args.pdb_id))
     init_logger(args.pdb_id, args.verbose)
+    if args.index or args.index_dir is not None:
+        pyconfig.set("RECORD_INDEX", True)
+        pyconfig.set("RECORD_INDEX_DIR", args.index_dir)
+    if args.atom_cache is not None:
+        pyconfig.set("ATOM_CACHE_DIR", args.atom_cache)
+    if args.atom_cache_mb is not None:
+        pyconfig.set("ATOM_CACHE_BYTES", int(args.atom_cache_mb * 1024 * 1024))
+    if args.features is not None:
+        pyconfig.set("FEATURE_STORE", os.path.abspath(args.features))
 
     # Check that the system has the required programs and libraries installed
     check_deps()
 
-    if create_bdb_entry(pdb_file_path=args.pdb_file_path, pdb_id=args.pdb_id,
-                        verbose=args.verbose):
+    stage_timer = StageTimer() if args.timings else None
+    entry_args = {"pdb_file_path": args.pdb_file_path, "pdb_id": args.pdb_id,
+                  "verbose": args.verbose, "stage_timer": stage_timer,
+                  "streaming": args.streaming}
+    if args.profile:
+        pstats_path = os.path.join(pyconfig.get("BDB_FILE_DIR_PATH"),
+                                   args.pdb_id + ".pstats")
+        created = profile_call(pstats_path, create_bdb_entry, **entry_args)
+    else:
+        created = create_bdb_entry(**entry_args)
+    if created:
         _log.debug("Finished bdb entry.")
     # exit with status 0 when a BDB or a WHY NOT entry has been created
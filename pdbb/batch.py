@@ -0,0 +1,605 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from __future__ import print_function
+
+import logging
+_log = logging.getLogger(__name__)
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import pyconfig
+import re
+import shlex
+import tarfile
+import threading
+import time
+
+from collections import Counter, deque
+
+from pdbb.application import create_bdb_entry
+from pdbb.bdb_utils import (get_bdb_entry_outdir, get_pdb_id_from_file_name,
+                            is_valid_directory)
+from pdbb.branches import (branch_counts, reset_branch_counts,
+                           write_branch_counts)
+from pdbb.features import FeatureStore, redecide
+from pdbb.metrics import BatchMetrics
+from pdbb.pdb.files import preloaded
+from pdbb.profiling import merge_pstats, profile_call, write_collapsed_stacks
+from pdbb.requirements import check_deps
+from pdbb.timings import StageTimer, memory_mode
+from pdbb.tlsanl_wrapper import TLSANL_TIMEOUT_MSG
+
+
+TAR_FILE_NAME_PAT = re.compile(r"\.(?:tar|tar\.gz|tgz|tar\.bz2|tbz2?)$")
+
+
+def find_pdb_files(paths):
+    """Yield (pdb_file_path, pdb_id) for the PDB files in paths.
+
+    Directories are searched recursively. Files that do not have a PDB file
+    name are skipped.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    pdb_id = get_pdb_id_from_file_name(f)
+                    if pdb_id is not None:
+                        yield os.path.join(root, f), pdb_id
+        else:
+            pdb_id = get_pdb_id_from_file_name(path)
+            if pdb_id is None:
+                _log.warn("Skipping {0:s}: not a PDB file name".format(path))
+            else:
+                yield path, pdb_id
+
+
+def tar_members(tar_path):
+    """Yield (pdb_file_path, pdb_id, data) for the PDB files in a tar file.
+
+    The (compressed) archive is read as a stream and nothing is extracted to
+    disk. pdb_file_path is the member name below the archive path, the PDB ID
+    is derived from the member name (e.g. pdb1abc.ent.gz) and data are the
+    member contents. Other members are skipped.
+    """
+    with tarfile.open(tar_path, "r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            pdb_id = get_pdb_id_from_file_name(member.name)
+            if pdb_id is None:
+                _log.debug("Skipping {0:s} in {1:s}: not a PDB file "
+                           "name".format(member.name, tar_path))
+                continue
+            data = tar.extractfile(member).read()
+            yield os.path.join(tar_path, member.name), pdb_id, data
+
+
+def find_pdb_sources(paths):
+    """Yield the PDB files in paths for run_batch.
+
+    Tar files (.tar, .tar.gz, .tgz, .tar.bz2) yield their members (see
+    tar_members), other paths are searched with find_pdb_files.
+    """
+    for path in paths:
+        if TAR_FILE_NAME_PAT.search(path) and os.path.isfile(path):
+            for member in tar_members(path):
+                yield member
+        else:
+            for pdb_file in find_pdb_files([path]):
+                yield pdb_file
+
+
+class Prefetcher(object):
+    """Read the next PDB files into memory in a background thread.
+
+    pdb_files are (pdb_file_path, pdb_id) tuples or (pdb_file_path, pdb_id,
+    data) tuples of files that are in memory already (see tar_members).
+
+    Iterate over the prefetcher to get (key, pdb_file_path, pdb_id, data)
+    tuples in the order of pdb_files. At most max_files files of together at
+    most max_bytes are held (a larger file is read when no others are held)
+    until they are released with release(key). Keys are sequence numbers,
+    so that files with the same PDB ID (e.g. pdb1abc.ent and 1abc.pdb) are
+    held separately. The next file of pdb_files is only taken when the
+    budget allows. data is None if the file could not be read, in which
+    case the worker reports the error, or if read is False.
+    """
+
+    def __init__(self, pdb_files, max_files, max_bytes, read=True):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.read = read
+        self._pdb_files = pdb_files
+        self._ready = deque()
+        self._held = {}  # key: bytes
+        self._done = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _wait_for_budget(self, size):
+        with self._cond:
+            while self._held and (
+                    len(self._held) >= self.max_files or
+                    sum(self._held.values()) + size > self.max_bytes):
+                self._cond.wait()
+
+    def _read(self, pdb_file_path):
+        try:
+            size = os.path.getsize(pdb_file_path)
+        except OSError:
+            size = 0
+        self._wait_for_budget(size)
+        try:
+            with open(pdb_file_path, "rb") as f:
+                return f.read()
+        except IOError as ex:
+            _log.warn("Could not prefetch {0:s}: {1}".format(pdb_file_path,
+                                                             ex))
+            return None
+
+    def _run(self):
+        try:
+            pdb_files = iter(self._pdb_files)
+            for key in itertools.count():
+                self._wait_for_budget(0)
+                try:
+                    pdb_file = next(pdb_files)
+                except StopIteration:
+                    break
+                pdb_file_path, pdb_id = pdb_file[:2]
+                data = pdb_file[2] if len(pdb_file) > 2 else None
+                if data is None and self.read:
+                    data = self._read(pdb_file_path)
+                with self._cond:
+                    self._held[key] = len(data) if data is not None else 0
+                    self._ready.append((key, pdb_file_path, pdb_id, data))
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def __iter__(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._done:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                item = self._ready.popleft()
+            yield item
+
+    def release(self, key):
+        """Release the memory budget of a processed file."""
+        with self._cond:
+            self._held.pop(key, None)
+            self._cond.notify_all()
+
+
+def read_whynot(out_dir, pdb_id):
+    """Return the reason in the WHY NOT file of this entry or None."""
+    try:
+        with open(os.path.join(out_dir, pdb_id + ".whynot")) as f:
+            comment = f.readline()
+    except IOError:
+        return None
+    return comment[len("COMMENT: "):].rstrip("\n")
+
+
+def process_entry(job):
+    """Create a bdb entry in a batch worker.
+
+    The entry log is written to the entry directory, as by mkbdb. If profile
+    is True, a cProfile profile of the entry is saved next to the log.
+
+    Return a dict with the outcome, WHY NOT reason, TLSANL outcome and the
+    stage timings of the entry (see pdbb.metrics.BatchMetrics), the path
+    of the profile ("pstats", None if not profiled) and the branch hits of
+    the entry ("branches", None without BRANCH_PROFILE).
+
+    With streaming, the entry is created with streaming=True (see
+    create_bdb_entry). If data is not None, the PDB file is read from it
+    instead of from disk.
+    """
+    bdb_root, pdb_file_path, pdb_id, data, verbose, profile, streaming = job
+    out_dir = get_bdb_entry_outdir(bdb_root, pdb_id)
+    pyconfig.set("BDB_FILE_DIR_PATH", out_dir)
+
+    handler = logging.FileHandler(os.path.join(out_dir, pdb_id + ".log"),
+                                  mode="w")
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s | %(levelname)-7s | {0:4s} | %(message)s".format(pdb_id)))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    root_logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+
+    reset_branch_counts()
+    timer = StageTimer()
+    start = time.time()
+    outcome = "error"
+    pstats_path = None
+    entry_args = {"pdb_file_path": pdb_file_path, "pdb_id": pdb_id,
+                  "verbose": verbose, "stage_timer": timer,
+                  "streaming": streaming}
+    try:
+        with preloaded(pdb_file_path, data):
+            if profile:
+                pstats_path = os.path.join(out_dir, pdb_id + ".pstats")
+                created = profile_call(pstats_path, create_bdb_entry,
+                                       **entry_args)
+            else:
+                created = create_bdb_entry(**entry_args)
+        if created:
+            outcome = "bdb"
+        else:
+            outcome = "whynot"
+    except Exception as ex:
+        _log.exception("Could not create bdb entry: {0}".format(ex))
+    finally:
+        root_logger.removeHandler(handler)
+        handler.close()
+    wall = time.time() - start
+
+    whynot = read_whynot(out_dir, pdb_id) if outcome == "whynot" else None
+    tlsanl = None
+    if "run_tlsanl" in timer.stages:
+        if outcome == "bdb":
+            tlsanl = "success"
+        elif whynot == TLSANL_TIMEOUT_MSG:
+            tlsanl = "timeout"
+        else:
+            tlsanl = "failure"
+    stages = timer.report()["stages"]
+    return {
+        "pdb_id": pdb_id,
+        "outcome": outcome,
+        "whynot": whynot,
+        "tlsanl": tlsanl,
+        "wall": wall,
+        "peak_mem_kb": max([s["peak_mem_kb"] for s in stages.values()] or
+                           [0]),
+        "stages": dict((k, v["wall"]) for k, v in stages.items()),
+        "pstats": pstats_path,
+        "branches": branch_counts() if pyconfig.get("BRANCH_PROFILE")
+        else None,
+    }
+
+
+def _process_task(task):
+    key, job = task
+    return key, process_entry(job)
+
+
+class _NonDaemonProcess(multiprocessing.Process):
+    """A process that stays non-daemonic, so that it can start processes of
+    its own."""
+
+    @property
+    def daemon(self):
+        return False
+
+    @daemon.setter
+    def daemon(self, value):
+        pass
+
+
+class _NonDaemonPool(multiprocessing.pool.Pool):
+    """A pool of which the workers can parse large files in parallel (see
+    pdbb.pdb.atoms.read_atom_table)."""
+    Process = _NonDaemonProcess
+
+
+def _init_worker():
+    # Entry logs go to the entry directories only
+    root_logger = logging.getLogger()
+    for h in list(root_logger.handlers):
+        root_logger.removeHandler(h)
+
+
+def run_batch(bdb_root, pdb_files, jobs=None, verbose=False,
+              metrics_interval=60, top_n=10, profile=False,
+              streaming=False):
+    """Create bdb entries for (pdb_file_path, pdb_id) in pdb_files.
+
+    The batch metrics are written to the bdb root every metrics_interval
+    seconds and at the end of the batch.
+
+    If profile is True, every entry is profiled and the profiles are merged
+    into an aggregate profile and a collapsed-stack file (for flamegraph
+    tools) in the bdb root.
+
+    With streaming, the entries are analyzed one chain at a time (see
+    create_bdb_entry).
+
+    With BRANCH_PROFILE, the branch hits of the entries (see pdbb.branches)
+    are summed and written to BRANCH_PROFILE_JSON in the bdb root.
+
+    pdb_files may also contain (pdb_file_path, pdb_id, data) tuples of files
+    in memory (see find_pdb_sources), which are sent to the workers.
+
+    The next PREFETCH_FILES files (default: twice the number of workers, 0:
+    no prefetching) of together at most PREFETCH_BYTES are read into memory
+    by a Prefetcher while the current entries are processed. Without
+    prefetching, files in memory are still limited to twice the number of
+    workers.
+
+    If the peak memory of an entry can only be measured over the lifetime
+    of a process (see pdbb.timings.memory_mode), every entry is created by
+    a new worker process.
+
+    With PARALLEL_PARSE_MIN_BYTES, the workers are not daemonic, so that
+    they can parse large files in parallel.
+
+    Return the BatchMetrics.
+    """
+    metrics = BatchMetrics(top_n=top_n)
+    profiles = []
+    branches = Counter()
+
+    max_files = pyconfig.get("PREFETCH_FILES")
+    prefetcher = Prefetcher(
+        pdb_files, max_files or 2 * (jobs or multiprocessing.cpu_count()),
+        pyconfig.get("PREFETCH_BYTES"), read=max_files != 0)
+    tasks = ((key, (bdb_root, path, pdb_id, data, verbose, profile,
+                    streaming))
+             for key, path, pdb_id, data in prefetcher)
+
+    def write_metrics():
+        metrics.write(bdb_root, pyconfig.get("METRICS_PROM"),
+                      pyconfig.get("METRICS_JSON"))
+
+    maxtasks = 1 if memory_mode() == "ru_maxrss" else None
+    pool_class = _NonDaemonPool \
+        if pyconfig.get("PARALLEL_PARSE_MIN_BYTES") is not None \
+        else multiprocessing.Pool
+    pool = pool_class(jobs, initializer=_init_worker,
+                      maxtasksperchild=maxtasks)
+    try:
+        results = pool.imap_unordered(_process_task, tasks)
+        last_write = time.time()
+        while True:
+            try:
+                key, result = results.next(timeout=metrics_interval)
+            except multiprocessing.TimeoutError:
+                result = None
+            except StopIteration:
+                break
+            if result is not None:
+                prefetcher.release(key)
+                metrics.add(result)
+                if result["pstats"] is not None and \
+                        os.path.exists(result["pstats"]):
+                    profiles.append(result["pstats"])
+                if result["branches"] is not None:
+                    branches.update(result["branches"])
+                _log.info("{0:s}: {1:s} ({2:.2f} s)".format(
+                    result["pdb_id"], result["outcome"], result["wall"]))
+            if time.time() - last_write >= metrics_interval:
+                write_metrics()
+                last_write = time.time()
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        write_metrics()
+        if profiles:
+            write_profile(bdb_root, profiles)
+        if pyconfig.get("BRANCH_PROFILE"):
+            write_branch_counts(os.path.join(
+                bdb_root, pyconfig.get("BRANCH_PROFILE_JSON")), branches,
+                metrics.entries)
+    return metrics
+
+
+def write_profile(bdb_root, pstats_paths):
+    """Merge the profiles and write the aggregate profile files."""
+    _log.info("Merging {0:d} profiles...".format(len(pstats_paths)))
+    stats = merge_pstats(pstats_paths)
+    try:
+        stats.dump_stats(os.path.join(bdb_root,
+                                      pyconfig.get("PROFILE_PSTATS")))
+    except (IOError, OSError) as ex:
+        _log.error(ex)
+    write_collapsed_stacks(stats, os.path.join(
+        bdb_root, pyconfig.get("PROFILE_COLLAPSED")))
+
+
+def run_redecide(bdb_root, store_path):
+    """Decide again about all entries in the feature store at store_path
+    (see pdbb.features.redecide).
+
+    The entries with other decisions are written to REDECIDE_JSON in
+    bdb_root and, with BRANCH_PROFILE, the branch hits to
+    BRANCH_PROFILE_JSON. Return the number of entries and the changed
+    decisions.
+    """
+    start = time.time()
+    reset_branch_counts()
+    with FeatureStore(store_path) as store:
+        entries = len(store)
+        changed = redecide(store)
+    _log.info("Decided again about {0:d} entries in {1:.2f} s: {2:d} "
+              "changed".format(entries, time.time() - start, len(changed)))
+    for field, count in sorted(Counter(
+            f for changes in changed.values() for f, _, _ in changes).items()):
+        _log.info("{0:s} changed for {1:d} entries".format(field, count))
+    report_path = os.path.join(bdb_root, pyconfig.get("REDECIDE_JSON"))
+    try:
+        with open(report_path, "w") as f:
+            json.dump({"entries": entries, "changed": changed}, f,
+                      sort_keys=True, indent=4)
+    except (IOError, OSError) as ex:
+        _log.error(ex)
+    if pyconfig.get("BRANCH_PROFILE"):
+        write_branch_counts(os.path.join(
+            bdb_root, pyconfig.get("BRANCH_PROFILE_JSON")), branch_counts(),
+            entries)
+    return entries, changed
+
+
+def main():
+    """Create bdb entries for a batch of PDB files."""
+
+    parser = argparse.ArgumentParser(
+        description="Create BDB entries for a batch of PDB files in parallel.\
+        Entries are created as by mkbdb. Batch metrics are written to the\
+        BDB root directory as a Prometheus text file and a json summary.")
+    parser.add_argument(
+        "-v", "--verbose",
+        help="show verbose output",
+        action="store_true")
+    parser.add_argument(
+        "-j", "--jobs",
+        help="number of worker processes (default: number of CPUs)",
+        type=int)
+    parser.add_argument(
+        "--metrics-interval",
+        help="seconds between metrics file updates (default: 60)",
+        type=float, default=60)
+    parser.add_argument(
+        "--top",
+        help="number of slowest and largest entries to report (default: 10)",
+        type=int, default=10)
+    parser.add_argument(
+        "--profile-batch",
+        help="profile every entry (.pstats next to the log) and write an "
+             "aggregate profile and collapsed stacks to the BDB root",
+        action="store_true")
+    parser.add_argument(
+        "--tlsanl",
+        help="TLSANL command (default: tlsanl), e.g. \"python -m "
+             "pdbb.benchmarks.tlsanl_stub\" to load-test without CCP4",
+        type=shlex.split)
+    parser.add_argument(
+        "--tlsanl-timeout",
+        help="kill TLSANL runs after this many seconds",
+        type=float)
+    parser.add_argument(
+        "--prefetch-files",
+        help="number of PDB files to read ahead (default: twice the number "
+             "of workers, 0: none)",
+        type=int)
+    parser.add_argument(
+        "--prefetch-mb",
+        help="memory limit (MB) of the files read ahead (default: 512)",
+        type=float)
+    parser.add_argument(
+        "--streaming",
+        help="analyze the coordinates one chain at a time to bound the "
+             "memory use",
+        action="store_true")
+    parser.add_argument(
+        "--index",
+        help="keep an index (.idx) of the records of the PDB files, so "
+             "that later runs do not scan unchanged files again "
+             "(only useful for uncompressed files)",
+        action="store_true")
+    parser.add_argument(
+        "--index-dir",
+        help="directory for the indexes (default: next to the PDB files; "
+             "implies --index)",
+        type=lambda x: is_valid_directory(parser, x))
+    parser.add_argument(
+        "--atom-cache",
+        help="directory to cache the parsed coordinates in for later runs",
+        type=lambda x: is_valid_directory(parser, x))
+    parser.add_argument(
+        "--atom-cache-mb",
+        help="size limit (MB) of the coordinate cache (default: 10240)",
+        type=float)
+    parser.add_argument(
+        "--features",
+        help="SQLite database to store the refinement features of the "
+             "entries in, to decide again after rule changes")
+    parser.add_argument(
+        "--redecide",
+        help="only decide again about the entries in the --features store "
+             "and report the changed decisions in the BDB root (no PDB "
+             "files are read)",
+        action="store_true")
+    parser.add_argument(
+        "--branch-profile",
+        help="count the branches taken by the refinement program logic and "
+             "write the hits to the BDB root after the batch",
+        action="store_true")
+    parser.add_argument(
+        "bdb_root_path",
+        help="Root directory of the bdb data.",
+        type=lambda x: is_valid_directory(parser, x))
+    parser.add_argument(
+        "pdb_paths",
+        help="PDB files, directories with PDB files or tar files of PDB "
+             "files (read without extraction).",
+        nargs="*")
+    args = parser.parse_args()
+    if args.redecide and args.features is None:
+        parser.error("--redecide requires --features")
+    if not args.redecide and not args.pdb_paths:
+        parser.error("no PDB files given")
+
+    logging.basicConfig(
+        level=logging.INFO if not args.verbose else logging.DEBUG,
+        format="%(asctime)s | %(levelname)-7s | %(message)s")
+
+    if args.tlsanl is not None:
+        pyconfig.set("TLSANL_CMD", args.tlsanl)
+    if args.tlsanl_timeout is not None:
+        pyconfig.set("TLSANL_TIMEOUT", args.tlsanl_timeout)
+    if args.prefetch_files is not None:
+        pyconfig.set("PREFETCH_FILES", args.prefetch_files)
+    if args.prefetch_mb is not None:
+        pyconfig.set("PREFETCH_BYTES", int(args.prefetch_mb * 1024 * 1024))
+    if args.index or args.index_dir is not None:
+        pyconfig.set("RECORD_INDEX", True)
+        pyconfig.set("RECORD_INDEX_DIR", args.index_dir)
+    if args.atom_cache is not None:
+        pyconfig.set("ATOM_CACHE_DIR", args.atom_cache)
+    if args.atom_cache_mb is not None:
+        pyconfig.set("ATOM_CACHE_BYTES", int(args.atom_cache_mb * 1024 * 1024))
+    if args.features is not None:
+        pyconfig.set("FEATURE_STORE", os.path.abspath(args.features))
+    if args.branch_profile:
+        pyconfig.set("BRANCH_PROFILE", True)
+
+    if args.redecide:
+        if not args.verbose:
+            # Programs that can't be parsed would be logged for every entry
+            logging.getLogger("pdbb.refprog").setLevel(logging.ERROR)
+        run_redecide(args.bdb_root_path, pyconfig.get("FEATURE_STORE"))
+        return
+
+    # Check that the system has the required programs and libraries installed
+    check_deps()
+
+    metrics = run_batch(args.bdb_root_path,
+                        find_pdb_sources(args.pdb_paths),
+                        jobs=args.jobs, verbose=args.verbose,
+                        metrics_interval=args.metrics_interval,
+                        top_n=args.top, profile=args.profile_batch,
+                        streaming=args.streaming)
+    _log.info("Finished {0:d} entries ({1:.2f} entries/s).".format(
+        metrics.entries, metrics.entries_per_second()))
@@ -28,6 +28,8 @@ B_MSQAV_PAT = re.compile(r"(MEAN-SQUARE AMPLITUDE OF ATOMIC VIBRATION|"
                          "U\*\*2|UISO)")
 EXPDTA_PAT = re.compile(r"^EXPDTA")
 PDB_ID_PAT = re.compile(r"^[0-9a-zA-Z]{4}$")
+PDB_FILE_NAME_PAT = re.compile(r"^(?:pdb)?(?P<pdb_id>[0-9a-zA-Z]{4})"
+                               r"\.(?:pdb|ent)(?:\.(?:gz|bz2|xz))?$")
 PROGRAM_PAT = re.compile(r"^REMARK   3   PROGRAM     : "
                          "(?!NULL|NONE|NO REFINEMENT)")
 REMARK_3_PAT = re.compile(r"^REMARK   3")
@@ -43,6 +45,18 @@ def get_bdb_entry_outdir(root, pdb_id):
     return out_dir
 
 
+def get_pdb_id_from_file_name(file_name):
+    """Return the PDB ID (lower case) of a PDB file name.
+
+    Both wwPDB (pdb1abc.ent) and plain (1abc.pdb) file names are recognized,
+    also with a .gz, .bz2 or .xz extension.
+
+    Return None if the file name does not look like a PDB file name.
+    """
+    m = PDB_FILE_NAME_PAT.search(os.path.basename(file_name))
+    return m.group("pdb_id").lower() if m else None
+
+
 def is_valid_directory(parser, arg):
     """ Check if directory exists."""
     if not os.path.isdir(arg):
@@ -0,0 +1,20 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from pdbb.benchmarks.stages import main
+
+
+main()
@@ -0,0 +1,182 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from __future__ import division, print_function
+
+import logging
+_log = logging.getLogger(__name__)
+
+import argparse
+import json
+import random
+import sys
+
+from pdbb.benchmarks.stages import median
+
+
+# Stages that fail the comparison when they regress
+TRACKED_STAGES = ("check_beq", "parse_refprog", "parse_pdb_file",
+                  "create_bdb_entry")
+
+
+def bootstrap_speedup(base_times, new_times, confidence=0.95, resamples=2000,
+                      seed=0):
+    """Return the speedup of new over base and its confidence interval.
+
+    The speedup is the ratio of the median times (> 1 if new is faster). The
+    interval is a percentile bootstrap over the repeated measurements.
+
+    Return a tuple (speedup, low, high).
+    """
+    rng = random.Random(seed)
+    speedups = []
+    for _ in range(resamples):
+        base = [rng.choice(base_times) for _ in base_times]
+        new = [rng.choice(new_times) for _ in new_times]
+        speedups.append(median(base) / max(median(new), 1e-12))
+    speedups.sort()
+    alpha = (1 - confidence) / 2
+    low = speedups[int(alpha * (resamples - 1))]
+    high = speedups[int((1 - alpha) * (resamples - 1))]
+    return (median(base_times) / max(median(new_times), 1e-12), low, high)
+
+
+def compare_results(base, new, threshold=0.1, stages=TRACKED_STAGES,
+                    confidence=0.95, resamples=2000):
+    """Compare two benchmark result dicts (see pdbb.benchmarks.stages).
+
+    Sizes and stages present in both results are compared. A tracked stage
+    regresses if it is slower than base by more than threshold (a fraction)
+    with the given confidence, i.e. if the upper bound of the speedup interval
+    is below 1 / (1 + threshold). A tracked stage of base that is missing
+    from new (or of which the size is missing) is a regression as well, with
+    a speedup of None.
+
+    Return a list of dicts with "atoms", "stage", "speedup", "low", "high",
+    "tracked", "missing" and "regression", ordered by size and stage.
+    """
+    if base.get("options") != new.get("options"):
+        _log.warn("Benchmarks were run with different options: {0} and "
+                  "{1}".format(base.get("options"), new.get("options")))
+    limit = 1 / (1 + threshold)
+    new_results = dict((r["atoms"], r) for r in new["results"])
+    comparison = []
+    for base_result in sorted(base["results"], key=lambda r: r["atoms"]):
+        atoms = base_result["atoms"]
+        if atoms not in new_results:
+            _log.warn("No results for {0:d} atoms in new run".format(atoms))
+        new_stages = new_results.get(atoms, {"stages": {}})["stages"]
+        for stage in sorted(base_result["stages"]):
+            if stage not in new_stages:
+                if stage in stages:
+                    _log.warn("No results for tracked stage {0:s} at {1:d} "
+                              "atoms in new run".format(stage, atoms))
+                    comparison.append({
+                        "atoms": atoms,
+                        "stage": stage,
+                        "speedup": None,
+                        "low": None,
+                        "high": None,
+                        "tracked": True,
+                        "missing": True,
+                        "regression": True,
+                    })
+                continue
+            speedup, low, high = bootstrap_speedup(
+                base_result["stages"][stage]["times"],
+                new_stages[stage]["times"],
+                confidence=confidence, resamples=resamples)
+            tracked = stage in stages
+            comparison.append({
+                "atoms": atoms,
+                "stage": stage,
+                "speedup": speedup,
+                "low": low,
+                "high": high,
+                "tracked": tracked,
+                "missing": False,
+                "regression": tracked and high < limit,
+            })
+    return comparison
+
+
+def main():
+    """Compare two benchmark runs and fail on regressions."""
+
+    parser = argparse.ArgumentParser(
+        description="Compare two benchmark result files (python -m\
+        pdbb.benchmarks) and exit with status 1 if a tracked stage is slower\
+        than in the base run by more than the threshold.")
+    parser.add_argument(
+        "--threshold",
+        help="allowed slowdown as a fraction (default: 0.1)",
+        type=float, default=0.1)
+    parser.add_argument(
+        "--confidence",
+        help="confidence level of the speedup intervals (default: 0.95)",
+        type=float, default=0.95)
+    parser.add_argument(
+        "--resamples",
+        help="number of bootstrap resamples (default: 2000)",
+        type=int, default=2000)
+    parser.add_argument(
+        "--stages",
+        help="comma-separated tracked stages (default: {0:s})".format(
+            ",".join(TRACKED_STAGES)),
+        type=lambda x: x.split(","), default=list(TRACKED_STAGES))
+    parser.add_argument(
+        "base",
+        help="json file with the base results, e.g. of the main branch")
+    parser.add_argument(
+        "new",
+        help="json file with the new results")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING,
+                        format="%(asctime)s | %(levelname)-7s | %(message)s")
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    comparison = compare_results(base, new, threshold=args.threshold,
+                                 stages=args.stages,
+                                 confidence=args.confidence,
+                                 resamples=args.resamples)
+    print("{0:>8s} {1:<24s} {2:>8s} {3:>19s}".format(
+        "atoms", "stage", "speedup", "{0:.0%} interval".format(
+            args.confidence)))
+    for c in comparison:
+        if c["missing"]:
+            print("{0:8d} {1:<24s} {2:>8s} MISSING".format(
+                c["atoms"], c["stage"], "-"))
+            continue
+        print("{0:8d} {1:<24s} {2:8.3f} [{3:8.3f}, {4:8.3f}]{5:s}".format(
+            c["atoms"], c["stage"], c["speedup"], c["low"], c["high"],
+            " REGRESSION" if c["regression"] else ""))
+    if not [c for c in comparison if c["tracked"]]:
+        print("No tracked stages were compared")
+        sys.exit(1)
+    regressions = [c for c in comparison if c["regression"]]
+    if regressions:
+        print("{0:d} tracked stage(s) regressed by more than {1:.0%} or "
+              "are missing".format(len(regressions), args.threshold))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
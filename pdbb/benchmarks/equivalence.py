@@ -0,0 +1,291 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from __future__ import division, print_function
+
+import logging
+_log = logging.getLogger(__name__)
+
+import argparse
+import json
+import os
+import pyconfig
+import shutil
+import sys
+import tempfile
+
+from collections import Counter
+
+import pdbb.benchmarks.reference  # Registers the fast paths
+
+from pdbb.application import create_bdb_entry
+from pdbb.batch import _NonDaemonPool, find_pdb_files
+from pdbb.fastpaths import (check_fast_paths, default_fast_paths,
+                            fast_paths, reference_paths)
+from pdbb.timings import StageTimer
+
+
+MISSING = "<missing>"
+
+
+def _same(reference, fast, float_tol):
+    """Return True if the values are equal, numbers (also in lists and
+    dicts) if they differ at most float_tol."""
+    if isinstance(reference, float) and isinstance(fast, (int, float)) or \
+            isinstance(fast, float) and isinstance(reference, (int, float)):
+        return abs(reference - fast) <= float_tol
+    if isinstance(reference, list) and isinstance(fast, list):
+        return len(reference) == len(fast) and all(
+            _same(r, f, float_tol) for r, f in zip(reference, fast))
+    if isinstance(reference, dict) and isinstance(fast, dict):
+        return set(reference) == set(fast) and all(
+            _same(reference[k], fast[k], float_tol) for k in reference)
+    return reference == fast
+
+
+def diff_bdbd(reference, fast, float_tol=0.0):
+    """Return the fields that differ between two bdb entry dicts.
+
+    Numbers, also in lists and dicts, are equal if they differ at most
+    float_tol (e.g. sums in another order). The timings are not compared.
+
+    Return a list of (field, reference value, fast value) tuples.
+    """
+    mismatches = []
+    for field in sorted(set(reference) | set(fast)):
+        if field == "timings":
+            continue
+        r = reference.get(field, MISSING)
+        f = fast.get(field, MISSING)
+        if not _same(r, f, float_tol):
+            mismatches.append((field, r, f))
+    return mismatches
+
+
+def diff_bytes(reference, fast):
+    """Return None if the file contents are identical.
+
+    Otherwise return a description of the first difference.
+    """
+    if reference == fast:
+        return None
+    if reference is None or fast is None:
+        return "file {0:s}".format("missing" if fast is None else "added")
+    ref_lines = reference.splitlines()
+    fast_lines = fast.splitlines()
+    for i, (r, f) in enumerate(zip(ref_lines, fast_lines), 1):
+        if r != f:
+            return "line {0:d}: {1!r} != {2!r}".format(i, r, f)
+    return "{0:d} lines != {1:d} lines".format(
+        len(ref_lines), len(fast_lines))
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def run_entry(pdb_file_path, pdb_id, out_dir):
+    """Create a bdb entry in out_dir.
+
+    Return a dict with the return value or exception ("created"), the json
+    data ("bdbd"), the contents of the .bdb and .whynot files and the stage
+    wall times ("stages").
+    """
+    pyconfig.set("BDB_FILE_DIR_PATH", out_dir)
+    timer = StageTimer()
+    try:
+        created = create_bdb_entry(pdb_file_path, pdb_id, stage_timer=timer)
+    except Exception as ex:
+        created = "{0:s}: {1}".format(type(ex).__name__, ex)
+    bdbd = _read(os.path.join(out_dir, pdb_id + ".json"))
+    return {
+        "created": created,
+        "bdbd": json.loads(bdbd) if bdbd is not None else {},
+        "bdb": _read(os.path.join(out_dir, pdb_id + ".bdb")),
+        "whynot": _read(os.path.join(out_dir, pdb_id + ".whynot")),
+        "stages": dict((s, v["wall"])
+                       for s, v in timer.report()["stages"].items()),
+    }
+
+
+def compare_entry(job):
+    """Create a bdb entry with the reference and the fast implementations.
+
+    Return a dict with the PDB ID, the mismatches as a list of
+    (field, reference, fast) tuples and the stage wall times of both runs.
+    """
+    pdb_file_path, pdb_id, names, float_tol = job
+    work_dir = tempfile.mkdtemp(prefix="bdb_equivalence_")
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    try:
+        ref_dir = os.path.join(work_dir, "reference")
+        fast_dir = os.path.join(work_dir, "fast")
+        os.mkdir(ref_dir)
+        os.mkdir(fast_dir)
+        with reference_paths(names):
+            reference = run_entry(pdb_file_path, pdb_id, ref_dir)
+        with fast_paths(names):
+            fast = run_entry(pdb_file_path, pdb_id, fast_dir)
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        shutil.rmtree(work_dir)
+
+    mismatches = []
+    if reference["created"] != fast["created"]:
+        mismatches.append(("created", reference["created"], fast["created"]))
+    mismatches.extend(diff_bdbd(reference["bdbd"], fast["bdbd"], float_tol))
+    for f in ("bdb", "whynot"):
+        diff = diff_bytes(reference[f], fast[f])
+        if diff is not None:
+            mismatches.append(("." + f, None, diff))
+    return {
+        "pdb_id": pdb_id,
+        "mismatches": mismatches,
+        "stages": {"reference": reference["stages"], "fast": fast["stages"]},
+    }
+
+
+def _init_worker():
+    # The pipeline logs are not needed
+    root_logger = logging.getLogger()
+    for h in list(root_logger.handlers):
+        root_logger.removeHandler(h)
+    root_logger.addHandler(logging.NullHandler())
+
+
+def run_equivalence(pdb_files, names=None, jobs=None, float_tol=0.0):
+    """Compare the reference and fast pipelines for (path, pdb_id) pairs.
+
+    Entries are compared in parallel by jobs worker processes, which may
+    start processes of their own (see pdbb.batch._NonDaemonPool), e.g. for
+    the parallel_parse fast path.
+
+    Return a list of compare_entry results, ordered as pdb_files.
+    """
+    pool = _NonDaemonPool(jobs, initializer=_init_worker)
+    try:
+        results = pool.map(
+            compare_entry,
+            [(path, pdb_id, names, float_tol) for path, pdb_id in pdb_files])
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def summarize(results):
+    """Summarize the results of run_equivalence.
+
+    The speedup of a stage is the ratio of its total reference and fast wall
+    times over all entries that ran it in both pipelines.
+
+    Return a dict that can be dumped to json.
+    """
+    ref_total = Counter()
+    fast_total = Counter()
+    for r in results:
+        ref, fast = r["stages"]["reference"], r["stages"]["fast"]
+        for stage in set(ref) & set(fast):
+            ref_total[stage] += ref[stage]
+            fast_total[stage] += fast[stage]
+    return {
+        "entries": len(results),
+        "mismatched": dict((r["pdb_id"], r["mismatches"]) for r in results
+                           if r["mismatches"]),
+        "stages": dict(
+            (s, {"reference": ref_total[s],
+                 "fast": fast_total[s],
+                 "speedup": ref_total[s] / fast_total[s]
+                 if fast_total[s] > 0 else None})
+            for s in ref_total),
+    }
+
+
+def main():
+    """Check that the fast paths do not change the bdb entries."""
+
+    parser = argparse.ArgumentParser(
+        description="Create the bdb entries of a corpus of PDB files with the\
+        reference and the fast implementations of the pipeline, report the\
+        json fields and .bdb/.whynot files that differ and the speedup per\
+        stage. Exit with status 1 if any entry differs.")
+    parser.add_argument(
+        "-j", "--jobs",
+        help="number of worker processes (default: number of CPUs)",
+        type=int)
+    parser.add_argument(
+        "--fast",
+        help="comma-separated fast paths to compare with their reference "
+        "(default: all but those that replace the same function as another)",
+        type=lambda x: x.split(","))
+    parser.add_argument(
+        "--float-tol",
+        help="allowed difference of numeric fields (default: 0)",
+        type=float, default=0.0)
+    parser.add_argument(
+        "--report",
+        help="json file to save the summary to")
+    parser.add_argument(
+        "pdb_paths",
+        help="PDB files or directories with PDB files.",
+        nargs="+")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING,
+                        format="%(asctime)s | %(levelname)-7s | %(message)s")
+
+    names = args.fast if args.fast is not None else default_fast_paths()
+    if not names:
+        parser.error("no fast paths registered")
+    try:
+        check_fast_paths(names)
+    except ValueError as ex:
+        parser.error("{0}".format(ex))
+
+    results = run_equivalence(list(find_pdb_files(args.pdb_paths)),
+                              names=names, jobs=args.jobs,
+                              float_tol=args.float_tol)
+    summary = summarize(results)
+    summary["fast_paths"] = names
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, sort_keys=True, indent=4)
+
+    print("Fast paths: {0:s}".format(", ".join(names)))
+    for pdb_id, mismatches in sorted(summary["mismatched"].items()):
+        for field, r, f in mismatches:
+            print("{0:s} {1:s}: {2!r} != {3!r}".format(pdb_id, field, r, f))
+    print("{0:>24s} {1:>12s} {2:>12s} {3:>8s}".format(
+        "stage", "reference", "fast", "speedup"))
+    for stage, s in sorted(summary["stages"].items()):
+        print("{0:>24s} {1:12.4f} {2:12.4f} {3:>8s}".format(
+            stage, s["reference"], s["fast"],
+            "{0:.2f}".format(s["speedup"]) if s["speedup"] else "-"))
+    print("{0:d} of {1:d} entries differ".format(len(summary["mismatched"]),
+                                                 summary["entries"]))
+    if summary["mismatched"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
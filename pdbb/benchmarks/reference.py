@@ -0,0 +1,187 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""Reference implementations of the fast paths of the pipeline.
+
+Most fast paths are the default implementations; they are registered here
+with the straightforward implementations that they replace (see
+pdbb.fastpaths), against which the equivalence harness compares them. The
+streaming fast path creates the entries one chain at a time instead (see
+pdbb.streaming).
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import pdbb.application
+import pyconfig
+
+from pdbb.check_beq import (_useful_residues, b_group_votes, b_segment_starts,
+                            classify_chain, is_calpha_trace, is_nucleic_chain,
+                            is_phos_trace, is_protein_chain)
+from pdbb.fastpaths import register_fast_path
+from pdbb.pdb.atoms import atom_table, first_model, parallel_atom_table
+from pdbb.pdb.files import open_pdb_file
+from pdbb.tls import tls_group_masks
+
+
+def streamed_bdb_entry(*args, **kwargs):
+    """Create a bdb entry, analyzing the coordinates one chain at a time
+    (see pdbb.application.create_bdb_entry)."""
+    kwargs["streaming"] = True
+    return pdbb.application.create_bdb_entry(*args, **kwargs)
+
+
+def serial_atom_table(pdb_file_path):
+    """Return the atom table of this PDB file, parsed in this process and
+    not from the cache."""
+    with open_pdb_file(pdb_file_path) as pdb_file:
+        return atom_table(pdb_file)
+
+
+def parallel_read_atom_table(pdb_file_path):
+    """Return the atom table of this PDB file, parsed in parallel whatever
+    its size (see pdbb.pdb.atoms.parallel_atom_table)."""
+    return parallel_atom_table(pdb_file_path,
+                               pyconfig.get("PARALLEL_PARSE_JOBS"))
+
+
+def reference_classify_chain(chain):
+    """Return the type of this chain (see pdbb.check_beq.classify_chain)."""
+    if is_protein_chain(chain):
+        return "protein"
+    if is_nucleic_chain(chain):
+        return "nucleic"
+    if is_calpha_trace(chain):
+        return "calpha_trace"
+    if is_phos_trace(chain):
+        return "phos_trace"
+    return None
+
+
+def reference_b_group_votes(atoms):
+    """Return the residue votes and B-factor range of every chain (see
+    pdbb.check_beq.b_group_votes), one residue at a time."""
+    import numpy as np
+
+    margin = 0.01
+    atoms, new_res = _useful_residues(atoms)
+    votes = {}
+    residues = np.split(atoms, np.flatnonzero(new_res)[1:]) \
+        if len(atoms) > 0 else []
+    for residue in residues:
+        chain = votes.setdefault(str(residue["chain"][0]), {
+            "individual": 0, "residue_1ADP": 0, "residue_2ADP": 0,
+            "residues": 0, "b": []})
+        chain["residues"] += 1
+        b_atom = sorted(residue["bfactor"].tolist())
+        chain["b"].extend(b_atom)
+        if len(b_atom) < 2:
+            continue
+        if np.isclose(b_atom[-1], b_atom[0], atol=margin):
+            chain["residue_1ADP"] += 1
+        elif len(b_atom) > 3 and \
+                np.allclose([b_atom[-1], b_atom[1]],
+                            [b_atom[-2], b_atom[0]], atol=margin) and \
+                not np.isclose(b_atom[-2], b_atom[1], atol=margin):
+            chain["residue_2ADP"] += 1
+        else:
+            chain["individual"] += 1
+    for chain in votes.values():
+        b = chain.pop("b")
+        chain["b_min"] = min(b)
+        chain["b_max"] = max(b)
+        chain["b_values"] = sorted(set(b))[:4]
+    return votes
+
+
+def reference_b_segment_starts(b, first, refs=None):
+    """Return where a segment of constant B-factor starts (see
+    pdbb.check_beq.b_segment_starts), one atom at a time."""
+    import numpy as np
+
+    margin = 0.01
+    new_seg = np.zeros(len(b), dtype=bool)
+    chain = -1
+    seg_b = None
+    for i, b_i in enumerate(b.tolist()):
+        if first[i]:
+            chain += 1
+            seg_b = refs[chain] if refs is not None else np.nan
+            if np.isnan(seg_b):
+                new_seg[i] = True
+                seg_b = b_i
+                continue
+        if abs(b_i - seg_b) > margin:
+            new_seg[i] = True
+            seg_b = b_i
+    return new_seg
+
+
+def reference_tls_group_masks(atoms, compiled, chains=None):
+    """Return the atom masks of the compiled TLS groups (see
+    pdbb.tls.tls_group_masks), comparing the residue ranges one atom at a
+    time."""
+    import numpy as np
+
+    atoms = first_model(atoms)
+    if chains is None:
+        chains = []
+        for c in atoms["chain"].tolist():
+            if c not in chains:
+                chains.append(c)
+    residues = [(chains.index(c) if c in chains else len(chains), n, i)
+                for c, n, i in zip(atoms["chain"].tolist(),
+                                   atoms["resseq"].tolist(),
+                                   atoms["icode"].tolist())]
+    masks = np.zeros((len(compiled), len(atoms)), dtype=bool)
+    for g, group in enumerate(compiled):
+        if group["error"] is not None:
+            continue
+        for r in group["ranges"] or []:
+            if r["chain_1"] not in chains or r["chain_2"] not in chains:
+                continue
+            lo = (chains.index(r["chain_1"]), r["num_1"], r["ic_1"] or "")
+            hi = (chains.index(r["chain_2"]), r["num_2"], r["ic_2"] or "")
+            for i, residue in enumerate(residues):
+                if lo <= residue <= hi:
+                    masks[g, i] = True
+        if group["selection"] is not None:
+            masks[g] |= group["selection"](atoms)
+    return masks
+
+
+# Sums B-factors per chain, in another order (see --float-tol)
+register_fast_path("streaming", streamed_bdb_entry,
+                   ["pdbb.benchmarks.equivalence.create_bdb_entry"],
+                   default=False)
+register_fast_path("parallel_parse", parallel_read_atom_table,
+                   ["pdbb.application.read_atom_table"],
+                   reference=serial_atom_table)
+register_fast_path("classify_chain", classify_chain,
+                   ["pdbb.check_beq.classify_chain"],
+                   reference=reference_classify_chain)
+register_fast_path("b_group_votes", b_group_votes,
+                   ["pdbb.check_beq.b_group_votes",
+                    "pdbb.streaming.b_group_votes"],
+                   reference=reference_b_group_votes)
+register_fast_path("b_segment_starts", b_segment_starts,
+                   ["pdbb.check_beq.b_segment_starts"],
+                   reference=reference_b_segment_starts)
+register_fast_path("tls_group_masks", tls_group_masks,
+                   ["pdbb.application.tls_group_masks",
+                    "pdbb.tls.tls_group_masks",
+                    "pdbb.streaming.tls_group_masks"],
+                   reference=reference_tls_group_masks)
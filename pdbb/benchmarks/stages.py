@@ -0,0 +1,272 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from __future__ import division, print_function
+
+import logging
+_log = logging.getLogger(__name__)
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import pyconfig
+import shlex
+import shutil
+import tempfile
+import timeit
+
+from pdbb.application import create_bdb_entry
+from pdbb.benchmarks.synthetic import write_synthetic_pdb
+from pdbb.check_beq import (check_beq, determine_b_group,
+                            determine_b_group_chains, determine_b_segments,
+                            get_structure, write_multiplied_8pipi)
+from pdbb.pdb.atoms import read_atom_table
+from pdbb.pdb.parser import (parse_pdb_file, parse_ref_prog,
+                             parse_tls_groups, parse_tls_selection)
+from pdbb.refprog import get_refi_data, parse_refprog
+from pdbb.streaming import analyze_atoms, analyze_chains
+from pdbb.tls import (check_tls_ranges, compile_tls_groups, residue_index,
+                      tls_group_masks, tls_group_stats)
+
+
+STAGES = ("parse_pdb_file", "get_structure", "get_refi_data", "parse_refprog",
+          "check_beq", "determine_b_group", "read_atom_table",
+          "determine_b_group_chains", "determine_b_segments",
+          "check_tls_ranges", "tls_group_masks", "analyze_atoms",
+          "analyze_chains",
+          "write_multiplied_8pipi", "create_bdb_entry")
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# Fast stages are called repeatedly until a measurement takes at least this
+# long (seconds) and the mean time per call is reported
+MIN_MEASURE_TIME = 0.01
+
+
+def measure(func, repeat):
+    """Return repeat measurements of the time (seconds) of a call of func."""
+    start = timeit.default_timer()
+    func()
+    elapsed = timeit.default_timer() - start
+    number = 1
+    if elapsed < MIN_MEASURE_TIME:
+        number = int(MIN_MEASURE_TIME / max(elapsed, 1e-7)) + 1
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        for _ in range(number):
+            func()
+        times.append((timeit.default_timer() - start) / number)
+    return times
+
+
+def time_stages(pdb_file_path, pdb_id, work_dir, repeat=5, stages=STAGES):
+    """Time the pipeline stages on this PDB file.
+
+    Every stage is timed in isolation on the output of the stages it depends
+    on. Output files are written to work_dir. Stages that do not apply to the
+    file (parse_refprog without a refinement program, check_tls_ranges and
+    tls_group_masks without TLS groups) are skipped.
+
+    Return a dict of stage name to a list of repeat times (seconds).
+    """
+    pdb_records = parse_pdb_file(pdb_file_path)
+    structure = get_structure(pdb_file_path, pdb_id)
+    refprog = parse_ref_prog(pdb_records)
+    tls_selections = parse_tls_selection(pdb_records)
+    tls_groups = parse_tls_groups(pdb_records)
+    atoms = read_atom_table(pdb_file_path)
+    xyzout = os.path.join(work_dir, pdb_id + ".bdb")
+    calls = {
+        "parse_pdb_file": lambda: parse_pdb_file(pdb_file_path),
+        "get_structure": lambda: get_structure(pdb_file_path, pdb_id),
+        "get_refi_data": lambda: get_refi_data(pdb_records, structure,
+                                               pdb_id),
+        "parse_refprog": lambda: parse_refprog(refprog),
+        "check_beq": lambda: check_beq(structure),
+        "determine_b_group": lambda: determine_b_group(structure),
+        "read_atom_table": lambda: read_atom_table(pdb_file_path),
+        "determine_b_group_chains": lambda: determine_b_group_chains(atoms),
+        "determine_b_segments": lambda: determine_b_segments(atoms),
+        "check_tls_ranges": lambda: check_tls_ranges(residue_index(atoms),
+                                                     tls_selections),
+        "tls_group_masks": lambda: tls_group_stats(
+            atoms, tls_group_masks(atoms, compile_tls_groups(tls_groups))),
+        "analyze_atoms": lambda: analyze_atoms(atoms, tls_groups,
+                                               tls_selections),
+        "analyze_chains": lambda: analyze_chains(pdb_file_path, tls_groups,
+                                                 tls_selections),
+        "write_multiplied_8pipi": lambda: write_multiplied_8pipi(
+            pdb_file_path, xyzout, pdb_id),
+        "create_bdb_entry": lambda: create_bdb_entry(pdb_file_path, pdb_id),
+    }
+    if refprog is None:
+        del calls["parse_refprog"]
+    if not tls_selections:
+        del calls["check_tls_ranges"]
+    if not tls_groups:
+        del calls["tls_group_masks"]
+
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    pyconfig.set("BDB_FILE_DIR_PATH", work_dir)
+    try:
+        times = {}
+        for stage in stages:
+            if stage in calls:
+                _log.info("Timing {0:s}...".format(stage))
+                times[stage] = measure(calls[stage], repeat)
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+    return times
+
+
+def median(values):
+    """Return the median of a list of numbers."""
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2
+
+
+def run_benchmarks(work_dir, sizes=DEFAULT_SIZES, repeat=5, stages=STAGES,
+                   **synthetic_options):
+    """Time the pipeline stages on synthetic PDB files of the given sizes.
+
+    sizes are atom counts. The other options are passed to
+    pdbb.benchmarks.synthetic.write_synthetic_pdb.
+
+    Return the results as a dict that can be dumped to json.
+    """
+    pdb_id = synthetic_options.setdefault("pdb_id", "9xyz")
+    results = []
+    for size in sizes:
+        pdb_file_path = os.path.join(work_dir, "{0:s}_{1:d}.pdb".format(
+            pdb_id, size))
+        atoms = write_synthetic_pdb(pdb_file_path, size, **synthetic_options)
+        _log.info("Benchmarking {0:d} atoms...".format(atoms))
+        times = time_stages(pdb_file_path, pdb_id, work_dir, repeat=repeat,
+                            stages=stages)
+        results.append({
+            "atoms": atoms,
+            "file_bytes": os.path.getsize(pdb_file_path),
+            "stages": dict(
+                (s, {"times": t, "min": min(t), "median": median(t)})
+                for s, t in times.items()),
+        })
+    return {
+        "created": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "options": synthetic_options,
+        "results": results,
+    }
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    """Benchmark the pipeline stages on synthetic PDB files."""
+
+    parser = argparse.ArgumentParser(
+        description="Time the bdb pipeline stages on synthetic PDB files of\
+        increasing size and save the results as json.")
+    parser.add_argument(
+        "-v", "--verbose",
+        help="show verbose output",
+        action="store_true")
+    parser.add_argument(
+        "--sizes",
+        help="comma-separated atom counts (default: {0:s})".format(
+            ",".join(str(s) for s in DEFAULT_SIZES)),
+        type=_int_list, default=list(DEFAULT_SIZES))
+    parser.add_argument(
+        "--chains",
+        help="number of chains (default: as few as fit the residue "
+             "numbers)",
+        type=int)
+    parser.add_argument(
+        "--anisou",
+        help="write ANISOU records",
+        action="store_true")
+    parser.add_argument(
+        "--tls-groups",
+        help="number of TLS groups (default: 0)",
+        type=int, default=0)
+    parser.add_argument(
+        "--tls-residual",
+        help="state that the ATOM records contain residual B-factors only",
+        action="store_true")
+    parser.add_argument(
+        "--remark3-lines",
+        help="number of OTHER REFINEMENT REMARKS lines (default: 0)",
+        type=int, default=0)
+    parser.add_argument(
+        "--program",
+        help="REMARK 3 refinement program (default: REFMAC 5.8.0073)",
+        default="REFMAC 5.8.0073")
+    parser.add_argument(
+        "--repeat",
+        help="number of measurements per stage (default: 5)",
+        type=int, default=5)
+    parser.add_argument(
+        "--stages",
+        help="comma-separated stages to time (default: all)",
+        type=lambda x: x.split(","), default=list(STAGES))
+    parser.add_argument(
+        "--tlsanl",
+        help="TLSANL command for create_bdb_entry (default: tlsanl), e.g. "
+             "\"python -m pdbb.benchmarks.tlsanl_stub\"",
+        type=shlex.split)
+    parser.add_argument(
+        "output",
+        help="json file to save the results to")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.WARNING if not args.verbose else logging.INFO,
+        format="%(asctime)s | %(levelname)-7s | %(message)s")
+
+    if args.tlsanl is not None:
+        pyconfig.set("TLSANL_CMD", args.tlsanl)
+
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error("unknown stages: {0:s}".format(", ".join(unknown)))
+
+    work_dir = tempfile.mkdtemp(prefix="bdb_benchmark_")
+    try:
+        results = run_benchmarks(
+            work_dir, sizes=args.sizes, repeat=args.repeat,
+            stages=args.stages, n_chains=args.chains, anisou=args.anisou,
+            tls_groups=args.tls_groups, tls_residual=args.tls_residual,
+            remark3_lines=args.remark3_lines, program=args.program)
+    finally:
+        shutil.rmtree(work_dir)
+    with open(args.output, "w") as f:
+        json.dump(results, f, sort_keys=True, indent=4)
+
+    for result in results["results"]:
+        print("{0:d} atoms".format(result["atoms"]))
+        for stage in STAGES:
+            if stage in result["stages"]:
+                print("  {0:<24s} {1:10.6f} s".format(
+                    stage, result["stages"][stage]["median"]))
@@ -0,0 +1,205 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from __future__ import division
+
+import logging
+_log = logging.getLogger(__name__)
+
+import math
+import random
+
+
+CHAIN_IDS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+# Heavy atoms (name, element) of the alanine residues of the synthetic chains
+RESIDUE_ATOMS = ((" N  ", "N"), (" CA ", "C"), (" C  ", "C"), (" O  ", "O"),
+                 (" CB ", "C"))
+
+MAX_RESIDUES_PER_CHAIN = 9999
+
+# Residues per straight part of a chain
+TRACE_RESIDUES = 1000
+
+REMARK_FILLER = "HYDROGENS HAVE BEEN ADDED IN THE RIDING POSITIONS."
+
+
+def _record(line):
+    return "{0:<80s}\n".format(line)
+
+
+def _remark(num, text=""):
+    return _record("REMARK {0:>3d} {1:s}".format(num, text).rstrip())
+
+
+def _split(n, parts):
+    """Split n into parts sizes that differ at most 1."""
+    return [n // parts + (1 if i < n % parts else 0) for i in range(parts)]
+
+
+def tls_ranges(residues_per_chain, tls_groups):
+    """Return the (chain ID, first, last) residue ranges of the TLS groups.
+
+    The groups are distributed over the chains round-robin and the residues of
+    a chain are split evenly over its groups.
+    """
+    n_chains = len(residues_per_chain)
+    ranges = []
+    for c, n_groups in enumerate(_split(tls_groups, n_chains)):
+        if n_groups == 0:
+            continue
+        if n_groups > residues_per_chain[c]:
+            raise ValueError("Chain {0:s} has fewer residues than TLS "
+                             "groups".format(CHAIN_IDS[c]))
+        first = 1
+        for size in _split(residues_per_chain[c], n_groups):
+            ranges.append((CHAIN_IDS[c], first, first + size - 1))
+            first += size
+    return ranges
+
+
+def header_records(pdb_id="9xyz", program="REFMAC 5.8.0073", tls_groups=0,
+                   residues_per_chain=(1,), tls_residual=False,
+                   remark3_lines=0):
+    """Return the header records (a list of lines) of a synthetic PDB file.
+
+    REMARK 3 contains the refinement program, the TLS group details (REFMAC
+    style residue ranges) and remark3_lines lines of OTHER REFINEMENT REMARKS.
+    """
+    lines = [
+        _record("HEADER    {0:<40s}{1:9s}   {2:4s}".format(
+            "SYNTHETIC BENCHMARK", "01-JAN-15", pdb_id.upper())),
+        _record("EXPDTA    X-RAY DIFFRACTION"),
+        _remark(2),
+        _remark(2, "RESOLUTION.    1.80 ANGSTROMS."),
+        _remark(3),
+        _remark(3, "REFINEMENT."),
+        _remark(3, "  PROGRAM     : {0:s}".format(program)),
+        _remark(3),
+    ]
+    if tls_groups > 0:
+        lines.append(_remark(3, " TLS DETAILS"))
+        lines.append(_remark(3, "  NUMBER OF TLS GROUPS  : {0:d}".format(
+            tls_groups)))
+        if tls_residual:
+            lines.append(_remark(
+                3, "  ATOM RECORD CONTAINS RESIDUAL B FACTORS ONLY"))
+        ranges = tls_ranges(residues_per_chain, tls_groups)
+        for g, (chain_id, first, last) in enumerate(ranges, 1):
+            lines.extend([
+                _remark(3),
+                _remark(3, "  TLS GROUP : {0:d}".format(g)),
+                _remark(3, "   NUMBER OF COMPONENTS GROUP : 1"),
+                _remark(3, "   COMPONENTS        C SSSEQI   TO  C SSSEQI"),
+                _remark(3, "   RESIDUE RANGE :   {0:s}{1:>6d}        "
+                           "{0:s}{2:>6d}".format(chain_id, first, last)),
+            ])
+        lines.append(_remark(3))
+    if remark3_lines > 0:
+        lines.append(_remark(
+            3, " OTHER REFINEMENT REMARKS: SYNTHETIC BENCHMARK ENTRY."))
+        for _ in range(remark3_lines - 1):
+            lines.append(_remark(3, "  {0:s}".format(REMARK_FILLER)))
+    lines.extend([
+        _remark(4),
+        _remark(4, "{0:s} COMPLIES WITH FORMAT V. 3.30, 13-JUL-11".format(
+            pdb_id.upper())),
+        _record("CRYST1  100.000  100.000  100.000  90.00  90.00  90.00 "
+                "P 1           1"),
+    ])
+    return lines
+
+
+def coordinate_records(residues_per_chain, anisou=False, seed=0):
+    """Yield the coordinate records of the synthetic chains.
+
+    Every residue is an alanine with individual B-factors. ANISOU records are
+    isotropic and reproduce the B-factor within the check_beq margin.
+    """
+    rng = random.Random(seed)
+    serial = 0
+    for c, n_res in enumerate(residues_per_chain):
+        chain_id = CHAIN_IDS[c]
+        for resseq in range(1, n_res + 1):
+            # A helix-like trace along z, chains side by side along x. The
+            # trace is folded every TRACE_RESIDUES residues along y, so that
+            # the coordinates fit their fields.
+            angle = math.radians(100 * resseq)
+            fold, pos = divmod(resseq - 1, TRACE_RESIDUES)
+            x0 = 20.0 * c + 2.3 * math.cos(angle)
+            y0 = 20.0 * fold + 2.3 * math.sin(angle)
+            z0 = 1.5 * (pos + 1)
+            for name, element in RESIDUE_ATOMS:
+                serial += 1
+                # U in 1e-4 A**2, B = 8 * pi**2 * U
+                u = rng.randint(1000, 6000)
+                b = 8 * math.pi ** 2 * u * 1e-4
+                ident = "{0:5d} {1:4s} ALA {2:1s}{3:4d} ".format(
+                    serial % 100000, name, chain_id, resseq)
+                yield "ATOM  {0:s}   {1:8.3f}{2:8.3f}{3:8.3f}" \
+                      "{4:6.2f}{5:6.2f}          {6:>2s}  \n".format(
+                          ident,
+                          x0 + rng.uniform(-1.5, 1.5),
+                          y0 + rng.uniform(-1.5, 1.5),
+                          z0 + rng.uniform(-0.7, 0.7),
+                          1.0, b, element)
+                if anisou:
+                    yield "ANISOU{0:s} {1:7d}{1:7d}{1:7d}{2:7d}{2:7d}{2:7d}" \
+                          "      {3:>2s}  \n".format(ident, u, 0, element)
+        serial += 1
+        yield _record("TER   {0:5d}      ALA {1:1s}{2:4d}".format(
+            serial % 100000, chain_id, n_res))
+
+
+def write_synthetic_pdb(pdb_file_path, n_atoms, n_chains=None, anisou=False,
+                        tls_groups=0, tls_residual=False, remark3_lines=0,
+                        program="REFMAC 5.8.0073", pdb_id="9xyz", seed=0):
+    """Write a synthetic PDB file with about n_atoms atoms.
+
+    The atoms are divided over n_chains protein chains of alanine residues
+    (n_atoms is rounded up to whole residues). By default, as few chains are
+    used as fit the residue number field. The file is valid input for the
+    bdb pipeline and its size and composition can be varied to benchmark the
+    pipeline stages.
+
+    Raise a ValueError if a chain would have more residues than fit the
+    residue number field.
+
+    Return the number of atoms written.
+    """
+    n_res = int(math.ceil(n_atoms / len(RESIDUE_ATOMS)))
+    if n_chains is None:
+        n_chains = max(1, int(math.ceil(n_res / MAX_RESIDUES_PER_CHAIN)))
+    if n_chains < 1 or n_chains > len(CHAIN_IDS):
+        raise ValueError("Number of chains must be between 1 and {0:d}".format(
+            len(CHAIN_IDS)))
+    n_res = max(n_chains, n_res)
+    residues_per_chain = _split(n_res, n_chains)
+    if residues_per_chain[0] > MAX_RESIDUES_PER_CHAIN:
+        raise ValueError("Too many residues per chain ({0:d}), use more "
+                         "chains".format(residues_per_chain[0]))
+
+    _log.info("Writing synthetic PDB file {0:s} ({1:d} atoms)".format(
+        pdb_file_path, n_res * len(RESIDUE_ATOMS)))
+    with open(pdb_file_path, "w") as f:
+        f.writelines(header_records(
+            pdb_id=pdb_id, program=program, tls_groups=tls_groups,
+            residues_per_chain=residues_per_chain, tls_residual=tls_residual,
+            remark3_lines=remark3_lines))
+        f.writelines(coordinate_records(residues_per_chain, anisou=anisou,
+                                        seed=seed))
+        f.write(_record("END"))
+    return n_res * len(RESIDUE_ATOMS)
@@ -0,0 +1,208 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""A stand-in for CCP4 TLSANL to test and benchmark the pipeline offline.
+
+The stub has the command line (XYZIN/XYZOUT logical names) and keyworded
+input (stdin) of TLSANL. It adds a fixed TLS contribution to the B-factors of
+the atoms in the REMARK 3 TLS groups and writes a log with the Skttls summary
+to stdout. The B-factors are not physically meaningful.
+
+The behaviour is configured with environment variables:
+TLSANL_STUB_LATENCY : seconds to sleep before processing (default: 0)
+TLSANL_STUB_MODE    : "ok" (default), "fail" (exit status 1), "stderr"
+                      (output on stderr), "small" (truncated XYZOUT), "hang"
+                      (never exit) or "crash" (killed by a signal)
+TLSANL_STUB_B_TLS   : TLS contribution to the B-factors (default: 20.0)
+
+Use it with pyconfig.set("TLSANL_CMD", [sys.executable, "-m",
+"pdbb.benchmarks.tlsanl_stub"]) or the tlsanl-stub script.
+"""
+from __future__ import division, print_function
+
+import math
+import os
+import signal
+import sys
+import time
+
+from pdbb.pdb.parser import RE_TLS_SEL
+
+
+MODES = ("ok", "fail", "stderr", "small", "hang", "crash")
+
+KEYWORDS = ("BINPUT", "BRESID", "ISOOUT", "NUMERIC", "AXES", "NUCLEIC", "END")
+
+
+def parse_command_line(argv):
+    """Return a dict of the logical file names in argv.
+
+    Raise a ValueError if argv is not a list of XYZIN/XYZOUT name pairs.
+    """
+    if len(argv) % 2 != 0:
+        raise ValueError("Odd number of command line arguments")
+    files = {}
+    for name, path in zip(argv[::2], argv[1::2]):
+        if name.upper() not in ("XYZIN", "XYZOUT"):
+            raise ValueError("Unknown logical name {0:s}".format(name))
+        files[name.upper()] = path
+    if sorted(files) != ["XYZIN", "XYZOUT"]:
+        raise ValueError("XYZIN and XYZOUT are required")
+    return files
+
+
+def read_keywords(stream):
+    """Return the (keyword, arguments) tuples of the keyworded input.
+
+    Input ends at END or at the end of the stream. Raise a ValueError for
+    unknown keywords.
+    """
+    keywords = []
+    for line in stream:
+        fields = line.split()
+        if not fields:
+            continue
+        keyword = fields[0].upper()
+        # Keywords can be abbreviated to four characters
+        matches = [k for k in KEYWORDS if k.startswith(keyword[:4])]
+        if len(matches) != 1:
+            raise ValueError("Unknown keyword {0:s}".format(fields[0]))
+        if matches[0] == "END":
+            break
+        keywords.append((matches[0], fields[1:]))
+    return keywords
+
+
+def tls_ranges(lines):
+    """Return the (chain, first, last) residue ranges of the TLS groups."""
+    ranges = []
+    for line in lines:
+        if line.startswith("REMARK"):
+            m = RE_TLS_SEL.search(line[7:])
+            if m is not None and m.group("ch_1") == m.group("ch_2"):
+                ranges.append((m.group("ch_1"), int(m.group("rn_1")),
+                               int(m.group("rn_2"))))
+    return ranges
+
+
+def _in_tls_group(ranges, chain, resseq):
+    for c, first, last in ranges:
+        if c == chain and first <= resseq <= last:
+            return True
+    return False
+
+
+def add_tls_contribution(lines, b_tls):
+    """Return the output records and the number of bonds between residues.
+
+    The B-factors of the atoms in TLS groups are increased by b_tls and
+    isotropic ANISOU records with the full B-factor are written for them.
+    """
+    ranges = tls_ranges(lines)
+    out = []
+    bonds = 0
+    previous = None
+    for line in lines:
+        record = line[0:6]
+        if record == "ANISOU":
+            continue
+        if record not in ("ATOM  ", "HETATM"):
+            out.append(line)
+            continue
+        chain = line[21]
+        resseq = int(line[22:26])
+        if record == "ATOM  ":
+            residue = (chain, resseq, line[26])
+            if previous is not None and residue != previous and \
+                    previous[0] == chain:
+                bonds += 1
+            previous = residue
+        if not _in_tls_group(ranges, chain, resseq):
+            out.append(line)
+            continue
+        b = float(line[60:66]) + b_tls
+        atom = line[:60] + "{0:6.2f}".format(b) + line[66:]
+        out.append(atom)
+        u = int(round(b / (8 * math.pi ** 2) * 1e4))
+        out.append("ANISOU" + line[6:27] + " " +
+                   "{0:7d}{0:7d}{0:7d}{1:7d}{1:7d}{1:7d}".format(u, 0) +
+                   "      " + line[76:].rstrip("\n") + "\n")
+    return out, bonds
+
+
+def skttls_summary(bonds):
+    """Return the Skttls summary lines as read by parse_skttls_summ."""
+    return [
+        "#  Skttls summary (stub)",
+        "#  Total number of bonds between residues: {0:d}".format(bonds),
+        "#  Number of bonds beyond 95th percentile for any residual: "
+        "{0:d}".format(bonds // 20),
+        "#  Number of bonds beyond 99th percentile for any residual: "
+        "{0:d}".format(bonds // 100),
+    ]
+
+
+def run(argv, stdin, stdout, stderr, environ):
+    """Run the stub. Return the exit status."""
+    mode = environ.get("TLSANL_STUB_MODE", "ok")
+    if mode not in MODES:
+        stderr.write("Unknown TLSANL_STUB_MODE {0:s}\n".format(mode))
+        return 1
+    try:
+        files = parse_command_line(argv)
+        keywords = read_keywords(stdin)
+    except ValueError as ex:
+        stderr.write("TLSANL: {0}\n".format(ex))
+        return 1
+
+    time.sleep(float(environ.get("TLSANL_STUB_LATENCY", 0)))
+    if mode == "hang":
+        while True:
+            time.sleep(60)
+    if mode == "crash":
+        os.kill(os.getpid(), signal.SIGSEGV)
+
+    stdout.write(" ### CCP4 PROGRAM SUITE: TLSANL (stub) ###\n\n")
+    for keyword, args in keywords:
+        stdout.write(" Data line--- {0:s} {1:s}\n".format(keyword,
+                                                          " ".join(args)))
+    if mode == "fail":
+        stderr.write("TLSANL: Error in TLS group definitions\n")
+        return 1
+
+    with open(files["XYZIN"]) as f:
+        lines = f.readlines()
+    out, bonds = add_tls_contribution(
+        lines, float(environ.get("TLSANL_STUB_B_TLS", 20.0)))
+    if mode == "small":
+        out = out[:10]
+    with open(files["XYZOUT"], "w") as f:
+        f.writelines(out)
+
+    stdout.write("\n" + "\n".join(skttls_summary(bonds)) + "\n\n")
+    stdout.write(" TLSANL:  Normal termination\n")
+    if mode == "stderr":
+        stderr.write("TLSANL: Warning: unusual TLS parameters\n")
+    return 0
+
+
+def main():
+    sys.exit(run(sys.argv[1:], sys.stdin, sys.stdout, sys.stderr,
+                 os.environ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+import logging
+_log = logging.getLogger(__name__)
+
+import json
+import pyconfig
+
+from collections import Counter
+from contextlib import contextmanager
+
+
+# Hits per branch (tuple of the function name and branch labels)
+_hits = Counter()
+
+# Branch lists of the running recordings (see recording)
+_recordings = []
+
+# Whether hits are counted (BRANCH_PROFILE, see reset_branch_counts)
+_counting = False
+
+
+def hit(*branch):
+    """Count a hit of this branch, e.g. hit("last_used", "corels").
+
+    The first label is the name of the function that contains the branch.
+    Hits are counted only if BRANCH_PROFILE was set when the counts were
+    last reset, but are always added to the running recordings.
+    """
+    for branches in _recordings:
+        branches.append(branch)
+    if _counting:
+        _hits[branch] += 1
+
+
+@contextmanager
+def recording():
+    """Record the branches hit in this context in the yielded list, so that
+    they can be counted again (see replay) when a memoized result is used.
+    """
+    branches = []
+    _recordings.append(branches)
+    try:
+        yield branches
+    finally:
+        _recordings.remove(branches)
+
+
+def replay(branches):
+    """Hit the recorded branches again."""
+    for branch in branches:
+        hit(*branch)
+
+
+def branch_counts():
+    """Return a copy of the Counter of hits per branch."""
+    return Counter(_hits)
+
+
+def reset_branch_counts():
+    """Forget the counted hits, and count the hits from now on only if
+    BRANCH_PROFILE is set.
+
+    The setting is read here, once per entry or batch, and not on every hit.
+    """
+    global _counting
+    _hits.clear()
+    _counting = bool(pyconfig.get("BRANCH_PROFILE"))
+
+
+def branch_report(counts):
+    """Return the hits in counts per function, as a dict of function names
+    and lists of [branch, hits] pairs in order of decreasing hits.
+
+    The labels of a branch are joined with ":".
+    """
+    report = {}
+    for branch, n in counts.items():
+        report.setdefault(branch[0], []).append(
+            [":".join(str(b) for b in branch[1:]), n])
+    for hits in report.values():
+        hits.sort(key=lambda h: (-h[1], h[0]))
+    return report
+
+
+def write_branch_counts(path, counts, entries):
+    """Write the hits in counts of a batch of entries to the json file at
+    path (see branch_report)."""
+    try:
+        with open(path, "w") as f:
+            json.dump({"entries": entries, "hits": branch_report(counts)},
+                      f, sort_keys=True, indent=4)
+        _log.info("Branch hits saved to {0:s}".format(path))
+    except (IOError, OSError) as ex:
+        _log.error(ex)
@@ -23,11 +23,13 @@ import itertools
 import re
 import shutil
 
-import Bio.PDB
-import numpy as np
-
 from collections import Counter
 
+# numpy and Bio.PDB are imported by the functions that use them, so that
+# importing this module (e.g. by mkbdb for WHY NOT entries) stays cheap.
+
+from pdbb.pdb.atoms import first_model
+from pdbb.pdb.files import open_pdb_file
 from pdbb.pdb.parser import get_pdb_header_and_trailer
 
 
@@ -45,6 +47,8 @@ def check_beq(structure):
 
     Raise a ValueError if structure is None.
     """
+    import numpy as np
+
     if not structure:
         msg = "Could not check Beq values in ANISOU records. No structure."
         _log.error(msg)
@@ -98,6 +102,8 @@ def check_combinations(anisou, b, margin, check_first=False):
 
     Standard: U11, U22, and U33 are the first three values in the ANISOU record
     """
+    import numpy as np
+
     assert(len(anisou) == 6)
     reproduced = False
     for c in itertools.combinations(list(xrange(0, 6)), 3):
@@ -146,6 +152,82 @@ def check_tls_range(structure, tls_selections):
     return True
 
 
+# Bits of the backbone atom names in the presence bitmap of a residue
+BACKBONE_BITS = dict((name, 1 << i) for i, name in enumerate((
+    "N", "CA", "C", "O",  # Protein
+    "P", "OP1", "OP2", "O5'", "C5'", "C4'",
+    "O4'", "C3'", "O3'", "C2'", "C1'", )))  # DNA/RNA
+AMINO_ACID_BACKBONE = sum(BACKBONE_BITS[a] for a in ("N", "CA", "C", "O"))
+SUGAR_PHOSPHATE_BACKBONE = sum(
+    BACKBONE_BITS[a] for a in ("P", "OP1", "OP2", "O5'", "C5'", "C4'",
+                               "O4'", "C3'", "O3'", "C2'", "C1'"))
+
+
+def classify_chain(chain):
+    """Return the type of this chain.
+
+    The chain is read once: the backbone atoms present in the first 10
+    residues are combined in a bitmap per residue and, unless these residues
+    decide the type, the CA and P atoms of the whole chain are counted. The
+    result is the same as testing is_protein_chain, is_nucleic_chain,
+    is_calpha_trace and is_phos_trace in that order.
+
+    Return "protein", "nucleic", "calpha_trace", "phos_trace" or None.
+    """
+    check_max = 10
+    protein = True
+    nucleic = True
+    protein_checked = 0
+    nucleic_checked = 0
+    n_atoms = 0
+    n_ca = 0
+    n_p = 0
+    for i, res in enumerate(chain.get_residues()):
+        atoms = res.child_dict
+        n_atoms += len(res)
+        n_ca += "CA" in atoms
+        n_p += "P" in atoms
+        if res.get_id()[0] != " ":  # Exclude HETATM and waters
+            continue
+        # The first residue does not contain the phosphate
+        check_protein = protein and protein_checked < check_max
+        check_nucleic = nucleic and nucleic_checked < check_max and i > 0
+        if check_protein or check_nucleic:
+            bits = 0
+            for name in atoms:
+                bits |= BACKBONE_BITS.get(name, 0)
+            if check_protein:
+                protein = bits & AMINO_ACID_BACKBONE == AMINO_ACID_BACKBONE
+                protein_checked += 1
+            if check_nucleic:
+                nucleic = bits & SUGAR_PHOSPHATE_BACKBONE == \
+                    SUGAR_PHOSPHATE_BACKBONE
+                nucleic_checked += 1
+        # The atom counts are only needed for the trace checks
+        if protein and protein_checked == check_max:
+            return "protein"
+        if not protein and nucleic and nucleic_checked == check_max:
+            return "nucleic"
+
+    if protein:
+        return "protein"
+    if nucleic:
+        return "nucleic"
+    if n_ca / n_atoms >= 0.75:
+        return "calpha_trace"
+    if n_p / n_atoms >= 0.75:
+        return "phos_trace"
+    return None
+
+
+def classify_chains(structure):
+    """Return a list of (chain, type) tuples of the chains in structure.
+
+    See classify_chain for the types.
+    """
+    return [(c, classify_chain(c)) for c in structure.get_chains()]
+
+
 def determine_b_group(structure):
     """Determine the most likely B-factor parameterization.
 
@@ -176,20 +258,19 @@ def determine_b_group(structure):
 
     _log.info("Determining most likely B-factor group type")
     if structure is not None:
-        chains = structure.get_chains()
-        for c in chains:
-            if is_protein_chain(c):
+        for c, chain_type in classify_chains(structure):
+            if chain_type == "protein":
                 if group["protein_b"] is None:
                     group["protein_b"] = determine_b_group_chain(c)
-            elif is_nucleic_chain(c):
+            elif chain_type == "nucleic":
                 if group["nucleic_b"] is None:
                     group["nucleic_b"] = determine_b_group_chain(c)
-            elif is_calpha_trace(c):
+            elif chain_type == "calpha_trace":
                 if group["protein_b"] is None:
                     group["calpha_only"] = True
                     _log.info("Calpha-only chain(s) present")
                     group["protein_b"] = determine_b_group_chain(c)
-            elif is_phos_trace(c):
+            elif chain_type == "phos_trace":
                 if group["nucleic_b"] is None:
                     group["phos_only"] = True
                     _log.info("Backbone phosphorus-only chain(s) present")
@@ -225,6 +306,8 @@ def determine_b_group_chain(chain):
     Note: if only the first three residues would have been considered,
     the approach would have been too greedy for 1hlz chain B or 1av1
     """
+    import numpy as np
+
     margin = 0.01
     residues = chain.get_residues()
     group = "individual"
@@ -305,15 +388,369 @@ def determine_b_group_chain(chain):
     return group
 
 
+def _group_by_chain(atoms, key=None):
+    """Return the rows of the atom table grouped by chain, or by the values
+    of key (an array with a value per row) if given.
+
+    The groups are in order of first appearance and the rows of a group
+    stay in file order, also if the chain is split into blocks (e.g. a chain
+    that continues after a TER record).
+    """
+    import numpy as np
+
+    if key is None:
+        key = atoms["chain"]
+    if len(atoms) < 2:
+        return atoms
+    values, first, inverse = np.unique(key, return_index=True,
+                                       return_inverse=True)
+    if np.count_nonzero(key[1:] != key[:-1]) == len(values) - 1:
+        return atoms
+    rank = np.empty(len(values), dtype=np.intp)
+    rank[np.argsort(first)] = np.arange(len(values))
+    return atoms[np.argsort(rank[inverse], kind="mergesort")]
+
+
+def _useful_residues(atoms):
+    """Return the heavy and occupied ATOM rows of the atom table, grouped by
+    chain (see _group_by_chain).
+
+    Also return a boolean array that is True for the first row of every
+    residue: residues are consecutive rows with the same chain, number and
+    insertion code.
+    """
+    import numpy as np
+
+    # Names are stripped, so the first character tells hydrogens
+    useful = ~atoms["hetero"] & (atoms["occupancy"] > 0) & \
+        (atoms["name"].astype("S1") != b"H")
+    atoms = _group_by_chain(atoms[useful])
+    new_res = np.ones(len(atoms), dtype=bool)
+    new_res[1:] = (atoms["chain"][1:] != atoms["chain"][:-1]) | \
+        (atoms["resseq"][1:] != atoms["resseq"][:-1]) | \
+        (atoms["icode"][1:] != atoms["icode"][:-1])
+    return atoms, new_res
+
+
+def determine_b_group_chains(atoms):
+    """Return the most likely B-factor group type of every chain.
+
+    The decision rules are those of determine_b_group_chain, but all residues
+    of all chains in the atom table (pdbb.pdb.atoms) are evaluated at once.
+    Residues (ATOM records only) are classified from their sorted heavy and
+    occupied atoms and the chain type is the majority vote. Chains of at
+    least 10 such residues are overall or no_b-factors if all their B-factors
+    are the same, or overall if they have less than 4 different values.
+
+    Only the first model is evaluated (see pdbb.pdb.atoms.first_model).
+
+    Return a dict of chain ID to group type for the chains with useful
+    residues (margin 0.01 Angstrom**2).
+    """
+    return dict((chain_id, b_group_from_votes(votes))
+                for chain_id, votes in b_group_votes(
+                    first_model(atoms)).items())
+
+
+def b_group_votes(atoms):
+    """Return the residue votes and B-factor range of every chain.
+
+    These are the statistics from which determine_b_group_chains decides;
+    the statistics of parts of a chain can be combined with
+    merge_b_group_votes. All rows are evaluated, of any model. The rows are
+    grouped by chain once and the statistics of all chains are computed
+    together, so that entries with many chains cost no more than one chain
+    of the same size.
+
+    Return a dict of chain ID to a dict with the number of residues that
+    vote "individual", "residue_1ADP" and "residue_2ADP", the number of
+    useful "residues", the lowest and highest B-factor ("b_min", "b_max")
+    and up to 4 different B-factors ("b_values").
+    """
+    import numpy as np
+
+    margin = 0.01
+    atoms, new_res = _useful_residues(atoms)
+    if len(atoms) == 0:
+        return {}
+    res = np.cumsum(new_res) - 1
+    b = atoms["bfactor"][np.lexsort((atoms["bfactor"], res))]
+    starts = np.flatnonzero(new_res)
+    ends = np.append(starts[1:], len(atoms))
+    counts = ends - starts
+    lo = b[starts]
+    lo_2 = b[np.minimum(starts + 1, ends - 1)]
+    hi = b[ends - 1]
+    hi_2 = b[np.maximum(ends - 2, starts)]
+    adp_1 = (counts > 1) & np.isclose(hi, lo, atol=margin)
+    adp_2 = ~adp_1 & (counts > 3) & np.isclose(hi, hi_2, atol=margin) & \
+        np.isclose(lo_2, lo, atol=margin) & \
+        ~np.isclose(hi_2, lo_2, atol=margin)
+    individual = (counts > 1) & ~adp_1 & ~adp_2
+
+    # The chains are consecutive (see _useful_residues)
+    res_chain = atoms["chain"][starts]
+    new_chain = np.ones(len(starts), dtype=bool)
+    new_chain[1:] = res_chain[1:] != res_chain[:-1]
+    chain_res = np.flatnonzero(new_chain)
+    chain_rows = np.append(starts[chain_res], len(atoms))
+    n_res = np.diff(np.append(chain_res, len(starts)))
+    n_individual = np.add.reduceat(individual.astype(int), chain_res)
+    n_adp_1 = np.add.reduceat(adp_1.astype(int), chain_res)
+    n_adp_2 = np.add.reduceat(adp_2.astype(int), chain_res)
+    b_min = np.minimum.reduceat(atoms["bfactor"], chain_rows[:-1])
+    b_max = np.maximum.reduceat(atoms["bfactor"], chain_rows[:-1])
+
+    votes = {}
+    for i, chain_id in enumerate(res_chain[chain_res]):
+        chain_b = atoms["bfactor"][chain_rows[i]:chain_rows[i + 1]]
+        votes[str(chain_id)] = {
+            "individual": int(n_individual[i]),
+            "residue_1ADP": int(n_adp_1[i]),
+            "residue_2ADP": int(n_adp_2[i]),
+            "residues": int(n_res[i]),
+            "b_min": b_min[i],
+            "b_max": b_max[i],
+            "b_values": sorted(set(np.unique(chain_b)[:4])),
+        }
+    return votes
+
+
+def merge_b_group_votes(votes, other):
+    """Return the b_group_votes of two parts of a chain combined."""
+    return {
+        "individual": votes["individual"] + other["individual"],
+        "residue_1ADP": votes["residue_1ADP"] + other["residue_1ADP"],
+        "residue_2ADP": votes["residue_2ADP"] + other["residue_2ADP"],
+        "residues": votes["residues"] + other["residues"],
+        "b_min": min(votes["b_min"], other["b_min"]),
+        "b_max": max(votes["b_max"], other["b_max"]),
+        "b_values": sorted(set(votes["b_values"]) |
+                           set(other["b_values"]))[:4],
+    }
+
+
+def b_group_from_votes(votes):
+    """Return the B-factor group type of a chain from its b_group_votes."""
+    import numpy as np
+
+    margin = 0.01
+    min_res = 10
+    counts = dict((g, votes[g])
+                  for g in ("individual", "residue_1ADP", "residue_2ADP"))
+    ranked = sorted(counts.values(), reverse=True)
+    if ranked[0] == 0:
+        group = "individual"
+    elif ranked[0] == ranked[1]:
+        # If we have ties, assign most complex model
+        if counts["individual"] > 0:
+            group = "individual"
+        elif counts["residue_1ADP"] > 0:
+            group = "residue_1ADP"
+        else:
+            group = "residue_2ADP"
+    else:
+        group = max(counts, key=counts.get)
+    if votes["residues"] >= min_res:
+        b_min, b_max = votes["b_min"], votes["b_max"]
+        if np.isclose(b_min, b_max, atol=margin):
+            if np.isclose(b_min, 0) and np.isclose(b_max, 0):
+                group = "no_b-factors"
+            else:
+                group = "overall"
+        elif len(votes["b_values"]) < 4:
+            # Exception for structures that have two overall B-factors
+            group = "overall"
+    return group
+
+
+def determine_b_segments(atoms):
+    """Find the segments of constant B-factor in every chain.
+
+    A segment is a run of consecutive heavy and occupied atoms (ATOM records
+    only, see determine_b_group_chains) of a chain of which each B-factor is
+    within the margin of the first B-factor of the segment, so that a slow
+    drift of the B-factors is not one segment. The rows of a chain that is
+    split into blocks are taken together. The runs are found in linear time
+    (see b_segment_starts), so that chains with several domains, each with
+    its own overall B-factor (e.g. 1efg chain A, 1av1), are recognized.
+
+    Return a dict with
+    overall_segments: a dict of chain ID to
+                      overall         one segment
+                      no_b-factors    one segment with B-factor 0
+                      domain_overall  more segments, of at least 10
+                                      residues on average
+                      None            otherwise (e.g. individual B-factors)
+    b_segments      : a dict of chain ID to a list of segments, each a dict
+                      with the first and last residue ("12", "12A"), the
+                      number of residues and the B-factor of the first atom,
+                      for the chains that are not None in overall_segments.
+
+    Only the first model is evaluated (see pdbb.pdb.atoms.first_model).
+
+    (margin 0.01 Angstrom**2)
+    """
+    segments = {"overall_segments": {}, "b_segments": {}}
+    atoms, runs = b_segment_runs(first_model(atoms))
+    for chain_id, run in runs.items():
+        group = overall_from_segments(len(run["first"]),
+                                      atoms["bfactor"][run["first"][0]],
+                                      run["residues"])
+        segments["overall_segments"][chain_id] = group
+        if group is not None:
+            segments["b_segments"][chain_id] = segment_list(atoms, run)
+    return segments
+
+
+def b_segment_starts(b, first, refs=None):
+    """Return a boolean array that is True where a segment of constant
+    B-factor starts.
+
+    b are the B-factors of the atoms, grouped by chain, and first is True at
+    the first atom of every chain. A segment continues as long as the
+    B-factors are within the margin of its first B-factor. refs are the
+    first B-factors of segments that the chains continue (NaN if a chain
+    starts a new segment), one per chain.
+
+    An atom of which the B-factor differs more than three times the margin
+    from the previous one always starts a segment, as the previous one is
+    within the margin of the segment (twice the margin would do without
+    rounding; the third leaves room for it). Only the runs between such
+    atoms that are not within the margin of their first B-factor are
+    followed atom by atom.
+
+    (margin 0.01 Angstrom**2)
+    """
+    import numpy as np
+
+    margin = 0.01
+    new_seg = first.copy()
+    new_seg[1:] |= np.abs(b[1:] - b[:-1]) > 3 * margin
+    starts = np.flatnonzero(new_seg)
+    if len(starts) == 0:
+        return new_seg
+    ends = np.append(starts[1:], len(b))
+    ref = b[starts]
+    continued = np.zeros(len(starts), dtype=bool)
+    if refs is not None:
+        refs = np.asarray(refs, dtype=float)
+        has_ref = ~np.isnan(refs)
+        runs = np.searchsorted(starts, np.flatnonzero(first)[has_ref])
+        ref[runs] = refs[has_ref]
+        continued[runs] = True
+    simple = (np.maximum.reduceat(b, starts) - ref <= margin) & \
+        (ref - np.minimum.reduceat(b, starts) <= margin)
+    new_seg[starts[simple & continued]] = False
+    for run in np.flatnonzero(~simple):
+        start = starts[run]
+        new_seg[start] = not continued[run]
+        seg_b = ref[run]
+        for i, b_i in enumerate(b[start:ends[run]].tolist(), start):
+            if abs(b_i - seg_b) > margin:
+                new_seg[i] = True
+                seg_b = b_i
+    return new_seg
+
+
+def b_segment_runs(atoms, refs=None):
+    """Return the segments of constant B-factor of every chain.
+
+    refs is a dict of chain ID to the B-factor of the last segment of a
+    previous part of the chain (see b_segment_starts), which the first
+    segment of the chain may continue.
+
+    Return the useful atoms (see _useful_residues) and a dict of chain ID
+    to a dict with the "first" and "last" rows of the segments in these
+    atoms and their numbers of residues ("sizes"), as arrays, the number of
+    useful "residues" of the chain and whether the first segment continues
+    the last segment of the previous part ("continued"). The B-factor of a
+    continued segment is that of its first atom in this part.
+
+    No strings are made for the segments until segment_list is called, so
+    that chains with many segments cost little.
+    """
+    import numpy as np
+
+    atoms, new_res = _useful_residues(atoms)
+    if len(atoms) == 0:
+        return atoms, {}
+
+    res = np.cumsum(new_res) - 1
+    chain = atoms["chain"]
+    first = np.ones(len(atoms), dtype=bool)
+    first[1:] = chain[1:] != chain[:-1]
+    chain_rows = np.flatnonzero(first)
+    chain_ids = [str(c) for c in chain[chain_rows]]
+    new_seg = b_segment_starts(
+        atoms["bfactor"], first, [refs.get(c, np.nan) for c in chain_ids]
+        if refs else None)
+    starts = np.flatnonzero(new_seg | first)
+    ends = np.append(starts[1:], len(atoms)) - 1
+    sizes = res[ends] - res[starts] + 1
+    chain_bounds = np.append(np.searchsorted(starts, chain_rows),
+                             len(starts))
+    chain_res = np.add.reduceat(new_res.astype(int), chain_rows)
+
+    runs = {}
+    for i, chain_id in enumerate(chain_ids):
+        seg = slice(chain_bounds[i], chain_bounds[i + 1])
+        runs[chain_id] = {
+            "first": starts[seg],
+            "last": ends[seg],
+            "sizes": sizes[seg],
+            "residues": int(chain_res[i]),
+            "continued": not new_seg[chain_rows[i]],
+        }
+    return atoms, runs
+
+
+def segment_list(atoms, run):
+    """Return the segments of a chain from b_segment_runs as a list of dicts
+    (see determine_b_segments)."""
+    return [{"first": _residue_label(atoms[first]),
+             "last": _residue_label(atoms[last]),
+             "residues": int(size),
+             "b": float(atoms["bfactor"][first])}
+            for first, last, size in zip(run["first"], run["last"],
+                                         run["sizes"])]
+
+
+def overall_from_segments(n_segments, b, residues):
+    """Return the overall_segments type of a chain (see
+    determine_b_segments) from its number of segments, the B-factor of the
+    first segment and the number of residues."""
+    import numpy as np
+
+    min_res = 10
+    if n_segments == 1:
+        if np.isclose(b, 0):
+            return "no_b-factors"
+        return "overall"
+    if residues >= min_res * n_segments:
+        return "domain_overall"
+    return None
+
+
+def _residue_label(atom):
+    return "{0:d}{1:s}".format(int(atom["resseq"]), str(atom["icode"]))
+
+
 def get_structure(pdb_file_path, pdb_id, verbose=False):
     """Return a Bio.PDB.Structure for this PDB file.
 
+    pdb_file_path can also be the contents as a buffer or file object (see
+    pdbb.pdb.files.is_buffer).
+
     Return None if a Structure could not be created.
     """
+    import Bio.PDB
+
     structure = None
     try:
         p = Bio.PDB.PDBParser(QUIET=not verbose)
-        structure = p.get_structure(pdb_id, pdb_file_path)
+        with open_pdb_file(pdb_file_path) as pdb_file:
+            structure = p.get_structure(pdb_id, pdb_file)
     except (AttributeError, IndexError, ValueError, AssertionError,
             Bio.PDB.PDBExceptions.PDBConstructionException) as e:
         # (temporary fix until Biopython parser is fixed)
@@ -355,6 +792,8 @@ def is_calpha_trace(chain):
     Example: 1efg chain A contains 6 protein domains (each with a different
     overall B-factor) and GDP, chain B and C are composed of UNK residues.
     """
+    import numpy as np
+
     ca = []
     for atom in chain.get_atoms():
         if atom.get_name() == "CA":
@@ -395,6 +834,8 @@ def is_phos_trace(chain):
 
     Example: 3cw1 chain V.
     """
+    import numpy as np
+
     p = []
     for atom in chain.get_atoms():
         if atom.get_name() == "P":
@@ -425,6 +866,8 @@ def is_protein_chain(chain):
 
 def multiply_bfactors_8pipi(structure):
     """Multiply B-factors with 8*pi**2."""
+    import numpy as np
+
     for atom in structure.get_atoms():
         atom.set_bfactor(8*np.pi**2 * atom.get_bfactor())
     return structure
@@ -487,7 +930,12 @@ def transfer_header_and_trailer(pdb_file_path, xyzout):
 
 
 def write_multiplied_8pipi(pdb_file_path, xyzout, pdb_id, verbose=False):
-    """Multiply the B-factors in the input PDB file with 8*pi^2."""
+    """Multiply the B-factors in the input PDB file with 8*pi^2.
+
+    Return True if the header and trailer were transferred to xyzout.
+    """
+    import Bio.PDB
+
     _log.info("Calculating B-factors from Uiso values...")
     structure = get_structure(pdb_file_path, pdb_id, verbose)
     structure = multiply_bfactors_8pipi(structure)
@@ -0,0 +1,122 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+import logging
+_log = logging.getLogger(__name__)
+
+import importlib
+
+from contextlib import contextmanager
+
+
+# name: (fast function, dotted names of the reference function it replaces,
+#        reference function or None, whether it is used by default)
+FAST_PATHS = {}
+
+
+def register_fast_path(name, func, targets, reference=None, default=True):
+    """Register func as a fast implementation of a pipeline function.
+
+    targets are the dotted names under which the reference implementation is
+    used, e.g. ["pdbb.check_beq.check_beq", "pdbb.refprog.check_beq"]: every
+    module that imports the function by name needs its own target.
+
+    reference is the implementation that func replaces, if func is already
+    used under the targets (see reference_paths). Fast paths that are not
+    default are only used when named, e.g. if they replace the same function
+    as another fast path.
+
+    Fast paths are registered when the module that defines them is imported,
+    so that they are known in worker processes too.
+    """
+    FAST_PATHS[name] = (func, tuple(targets), reference, default)
+
+
+def default_fast_paths():
+    """Return the sorted names of the fast paths that are used by default."""
+    return sorted(n for n, (_, _, _, default) in FAST_PATHS.items()
+                  if default)
+
+
+def _resolve(target):
+    module_name, attr = target.rsplit(".", 1)
+    return importlib.import_module(module_name), attr
+
+
+def check_fast_paths(names=None):
+    """Return the names, the default fast paths if None.
+
+    Raise a ValueError if a fast path is not registered, or if two of them
+    replace the same function with different implementations.
+    """
+    names = default_fast_paths() if names is None else names
+    unknown = [n for n in names if n not in FAST_PATHS]
+    if unknown:
+        raise ValueError("Unknown fast path(s): {0:s}".format(
+            ", ".join(unknown)))
+    funcs = {}
+    for name in names:
+        func, targets, _, _ = FAST_PATHS[name]
+        for target in targets:
+            if funcs.setdefault(target, (name, func))[1] is not func:
+                raise ValueError(
+                    "Fast paths {0:s} and {1:s} both replace {2:s}".format(
+                        funcs[target][0], name, target))
+    return names
+
+
+@contextmanager
+def _patched(names, index, kind):
+    """Patch the functions at index of the fast paths in at their targets."""
+    saved = []
+    try:
+        for name in names:
+            func, targets = FAST_PATHS[name][index], FAST_PATHS[name][1]
+            if func is None:
+                continue
+            for target in targets:
+                module, attr = _resolve(target)
+                saved.append((module, attr, getattr(module, attr)))
+                setattr(module, attr, func)
+            _log.debug("Using {0:s} {1:s}".format(kind, name))
+        yield
+    finally:
+        for module, attr, func in reversed(saved):
+            setattr(module, attr, func)
+
+
+@contextmanager
+def fast_paths(names=None):
+    """Use the fast paths with these names (default: see default_fast_paths)
+    in this context.
+
+    Raise a ValueError if a fast path is not registered, or if two of them
+    replace the same function.
+    """
+    with _patched(check_fast_paths(names), 0, "fast path"):
+        yield
+
+
+@contextmanager
+def reference_paths(names=None):
+    """Use the reference implementations of the fast paths with these names
+    (default: see default_fast_paths) in this context.
+
+    Fast paths without a reference are left out, as their reference is what
+    their targets are without fast paths. Raise a ValueError as fast_paths.
+    """
+    with _patched(check_fast_paths(names), 2, "reference of"):
+        yield
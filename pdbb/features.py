@@ -0,0 +1,140 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""Store of the refinement features of bdb entries.
+
+With FEATURE_STORE, create_bdb_entry saves the features that the decisions
+about an entry are based on (see pdbb.refprog.extract_refi_features) and
+the decisions made from them in a single SQLite database. redecide runs
+the decision layer (pdbb.refprog.decide_refi_data) again over the stored
+features of the whole archive, so that the effect of a change to the
+decision rules is known without parsing the PDB files again.
+
+SQLite locks the whole database file, which does not work reliably on
+network file systems: keep the store on a local disk.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import pyconfig
+import sqlite3
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from pdbb.refprog import DECISION_FIELDS, decide_refi_data
+
+
+class FeatureStore(object):
+    """The features and decisions of the entries in an SQLite database."""
+
+    def __init__(self, path, timeout=60.0):
+        """Open the store at path, which is created if it does not exist.
+
+        Writers wait at most timeout seconds for other processes (e.g. the
+        workers of bdb-batch) that are writing to the store.
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=timeout)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "pdb_id TEXT PRIMARY KEY, "
+                "features BLOB NOT NULL, "
+                "decisions BLOB NOT NULL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def put(self, features, decisions):
+        """Save the features and decisions of an entry.
+
+        Stored features of the same PDB ID are replaced.
+        """
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (features["pdb_id"], _dumps(features), _dumps(decisions)))
+
+    def get(self, pdb_id):
+        """Return the features and decisions of an entry, or None if it is
+        not stored."""
+        row = self._db.execute(
+            "SELECT features, decisions FROM entries WHERE pdb_id = ?",
+            (pdb_id, )).fetchone()
+        return (_loads(row[0]), _loads(row[1])) if row is not None else None
+
+    def __iter__(self):
+        """Yield the PDB ID, features and decisions of all entries, in order
+        of PDB ID."""
+        for pdb_id, features, decisions in self._db.execute(
+                "SELECT pdb_id, features, decisions FROM entries "
+                "ORDER BY pdb_id"):
+            yield str(pdb_id), _loads(features), _loads(decisions)
+
+
+def _dumps(obj):
+    return sqlite3.Binary(pickle.dumps(obj, 2))
+
+
+def _loads(blob):
+    return pickle.loads(bytes(blob))
+
+
+def store_features(features, refi_data):
+    """Save the features and the decisions (DECISION_FIELDS of refi_data)
+    of an entry in the FEATURE_STORE.
+
+    Return True if the features were saved.
+    """
+    decisions = dict((f, refi_data[f]) for f in DECISION_FIELDS)
+    try:
+        with FeatureStore(pyconfig.get("FEATURE_STORE")) as store:
+            store.put(features, decisions)
+    except sqlite3.Error as ex:
+        _log.error("Could not store the features: {0}".format(ex))
+        return False
+    return True
+
+
+def redecide(store):
+    """Decide again about all entries in the FeatureStore.
+
+    The stored decisions are not changed, and no WHY NOT files are written.
+
+    Return a dict of the PDB IDs of the entries with other decisions to a
+    list of (field, stored value, new value) tuples.
+    """
+    changed = {}
+    for pdb_id, features, decisions in store:
+        refi_data = decide_refi_data(features, report=False)
+        changes = [(f, decisions.get(f), refi_data[f])
+                   for f in DECISION_FIELDS
+                   if decisions.get(f) != refi_data[f]]
+        if changes:
+            changed[pdb_id] = changes
+    return changed
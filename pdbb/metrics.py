@@ -0,0 +1,190 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+import logging
+_log = logging.getLogger(__name__)
+
+import heapq
+import json
+import os
+import time
+
+from collections import Counter
+
+
+# Upper bounds (seconds) of the stage time histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class BatchMetrics(object):
+    """Aggregate metrics of a batch of bdb entries.
+
+    Entry results are dicts as returned by pdbb.batch.process_entry:
+    "pdb_id"      : PDB ID
+    "outcome"     : "bdb", "whynot" or "error"
+    "whynot"      : WHY NOT reason or None
+    "tlsanl"      : "success", "failure", "timeout" or None if not run
+    "wall"        : wall time of the entry (seconds)
+    "peak_mem_kb" : peak memory of the entry (kB)
+    "stages"      : dict of stage name to wall time (seconds)
+    """
+
+    def __init__(self, top_n=10):
+        self.start = time.time()
+        self.top_n = top_n
+        self.outcomes = Counter()
+        self.whynot = Counter()
+        self.tlsanl = Counter()
+        self.stage_buckets = {}
+        self.stage_sum = Counter()
+        self.stage_count = Counter()
+        self._slowest = []
+        self._largest = []
+
+    def add(self, result):
+        self.outcomes[result["outcome"]] += 1
+        if result["whynot"] is not None:
+            self.whynot[result["whynot"]] += 1
+        if result["tlsanl"] is not None:
+            self.tlsanl[result["tlsanl"]] += 1
+        for stage, wall in result["stages"].items():
+            buckets = self.stage_buckets.setdefault(
+                stage, [0] * len(STAGE_BUCKETS))
+            for i, le in enumerate(STAGE_BUCKETS):
+                if wall <= le:
+                    buckets[i] += 1
+                    break
+            self.stage_sum[stage] += wall
+            self.stage_count[stage] += 1
+        self._push(self._slowest, (result["wall"], result["pdb_id"]))
+        self._push(self._largest, (result["peak_mem_kb"], result["pdb_id"]))
+
+    def _push(self, heap, item):
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, item)
+        elif self.top_n > 0:
+            heapq.heappushpop(heap, item)
+
+    @property
+    def entries(self):
+        return sum(self.outcomes.values())
+
+    def entries_per_second(self):
+        elapsed = time.time() - self.start
+        return self.entries / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """Return the metrics as a dict that can be dumped to json."""
+        return {
+            "entries": self.entries,
+            "elapsed": time.time() - self.start,
+            "entries_per_second": self.entries_per_second(),
+            "outcomes": dict(self.outcomes),
+            "whynot_reasons": dict(self.whynot),
+            "tlsanl": dict(self.tlsanl),
+            "stages": dict(
+                (s, {"count": self.stage_count[s],
+                     "sum": self.stage_sum[s],
+                     "buckets": dict(zip([str(le) for le in STAGE_BUCKETS],
+                                         self._cumulative(s)))})
+                for s in self.stage_buckets),
+            "slowest": [{"pdb_id": p, "wall": w}
+                        for w, p in sorted(self._slowest, reverse=True)],
+            "largest_memory": [{"pdb_id": p, "peak_mem_kb": m}
+                               for m, p in sorted(self._largest,
+                                                  reverse=True)],
+        }
+
+    def _cumulative(self, stage):
+        cumulative = []
+        total = 0
+        for n in self.stage_buckets[stage]:
+            total += n
+            cumulative.append(total)
+        return cumulative
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP {0:s} {1:s}".format(name, help_text))
+            lines.append("# TYPE {0:s} {1:s}".format(name, kind))
+            for labels, value in samples:
+                lines.append("{0:s}{1:s} {2}".format(
+                    name, _labels(labels), _value(value)))
+
+        metric("pdbb_entries_total", "counter",
+               "Number of processed entries by outcome.",
+               [({"outcome": o}, n) for o, n in sorted(self.outcomes.items())])
+        metric("pdbb_entries_per_second", "gauge",
+               "Processed entries per second since the start of the batch.",
+               [({}, self.entries_per_second())])
+        metric("pdbb_whynot_total", "counter",
+               "Number of WHY NOT entries by reason.",
+               [({"reason": r}, n) for r, n in sorted(self.whynot.items())])
+        metric("pdbb_tlsanl_runs_total", "counter",
+               "Number of TLSANL runs by outcome.",
+               [({"outcome": o}, n) for o, n in sorted(self.tlsanl.items())])
+        lines.append("# HELP pdbb_stage_seconds Wall time per pipeline stage.")
+        lines.append("# TYPE pdbb_stage_seconds histogram")
+        for stage in sorted(self.stage_buckets):
+            les = [str(le) for le in STAGE_BUCKETS] + ["+Inf"]
+            counts = self._cumulative(stage) + [self.stage_count[stage]]
+            for le, n in zip(les, counts):
+                lines.append("pdbb_stage_seconds_bucket{0:s} {1}".format(
+                    _labels({"stage": stage, "le": le}), n))
+            lines.append("pdbb_stage_seconds_sum{0:s} {1}".format(
+                _labels({"stage": stage}), _value(self.stage_sum[stage])))
+            lines.append("pdbb_stage_seconds_count{0:s} {1}".format(
+                _labels({"stage": stage}), self.stage_count[stage]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory, prom_name, json_name):
+        """Write the Prometheus and json files to directory.
+
+        The files are replaced atomically so that they can be scraped at any
+        time.
+        """
+        try:
+            _write_atomic(os.path.join(directory, prom_name),
+                          self.prometheus())
+            _write_atomic(os.path.join(directory, json_name),
+                          json.dumps(self.summary(), sort_keys=True, indent=4))
+        except (IOError, OSError) as ex:
+            _log.error(ex)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{0:s}="{1:s}"'.format(k, v.replace("\\", "\\\\")
+                                   .replace("\n", "\\n")
+                                   .replace('"', '\\"'))
+        for k, v in sorted(labels.items())) + "}"
+
+
+def _value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _write_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(data)
+    os.rename(tmp, path)
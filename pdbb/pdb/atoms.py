@@ -0,0 +1,324 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+import logging
+_log = logging.getLogger(__name__)
+
+import multiprocessing
+import os
+import pyconfig
+
+from pdbb.pdb.cache import content_key, load_atom_table, store_atom_table
+from pdbb.pdb.files import is_plain_file, open_pdb_file, read_pdb_buffer
+
+
+# Fields of the atom table (a numpy structured array, one row per atom)
+ATOM_DTYPE = [
+    ("model", "i4"),
+    ("chain", "S1"),
+    ("resseq", "i4"),
+    ("icode", "S1"),
+    ("resname", "S3"),
+    ("name", "S4"),
+    ("altloc", "S1"),
+    ("element", "S2"),
+    ("hetero", "?"),
+    ("coord", "f8", (3,)),
+    ("occupancy", "f8"),
+    ("bfactor", "f8"),
+    ("anisou", "f8", (6,)),
+    ("has_anisou", "?"),
+]
+
+
+def _column(chars, start, end, strip=True):
+    """Return the string column start:end of the record array."""
+    import numpy as np
+
+    width = end - start
+    col = np.ascontiguousarray(chars[:, start:end]).view(
+        "S{0:d}".format(width)).ravel()
+    if not strip:
+        return col
+    if width == 1:
+        # Much faster than np.char.strip
+        col = col.copy()
+        col[col == b" "] = b""
+        return col
+    return np.char.strip(col)
+
+
+def _numbers(chars, start, end, dtype):
+    """Convert the column start:end to numbers. Blank fields are zero."""
+    col = _column(chars, start, end, strip=False)
+    blank = col == b" " * (end - start)
+    if blank.any():
+        col = col.copy()
+        col[blank] = b"0"
+    return col.astype(dtype)
+
+
+def _atom_records(lines, model=0):
+    """Return the atom table of the records in lines, with all alternate
+    locations (see atom_table). The first model in lines is numbered
+    model."""
+    import numpy as np
+
+    atom_lines = []
+    anisou_lines = {}
+    model_ends = []  # number of atoms before every ENDMDL
+    for line in lines:
+        record = line[0:6]
+        if record == "ATOM  " or record == "HETATM":
+            atom_lines.append(line)
+        elif record == "ANISOU" and atom_lines:
+            anisou_lines[len(atom_lines) - 1] = line
+        elif record == "ENDMDL":
+            model_ends.append(len(atom_lines))
+
+    n = len(atom_lines)
+    atoms = np.zeros(n, dtype=ATOM_DTYPE)
+    if n == 0:
+        return atoms
+    atoms["model"] = model
+    if model_ends:
+        atoms["model"] += np.searchsorted(model_ends, np.arange(n),
+                                          side="right")
+    chars = np.array([l.rstrip("\r\n")[:80].ljust(80) for l in atom_lines],
+                     dtype="S80").view("S1").reshape(n, 80)
+    atoms["hetero"] = _column(chars, 0, 6, strip=False) == b"HETATM"
+    atoms["name"] = _column(chars, 12, 16)
+    atoms["altloc"] = _column(chars, 16, 17)
+    atoms["resname"] = _column(chars, 17, 20)
+    atoms["chain"] = _column(chars, 21, 22)
+    atoms["resseq"] = _numbers(chars, 22, 26, "i4")
+    atoms["icode"] = _column(chars, 26, 27)
+    for i, (start, end) in enumerate(((30, 38), (38, 46), (46, 54))):
+        atoms["coord"][:, i] = _numbers(chars, start, end, "f8")
+    atoms["occupancy"] = _numbers(chars, 54, 60, "f8")
+    atoms["bfactor"] = _numbers(chars, 60, 66, "f8")
+    atoms["element"] = _column(chars, 76, 78)
+
+    if anisou_lines:
+        rows = np.array(sorted(anisou_lines), dtype=int)
+        u_chars = np.array(
+            [anisou_lines[i].rstrip("\r\n")[:80].ljust(80) for i in rows],
+            dtype="S80").view("S1").reshape(len(rows), 80)
+        for i in range(6):
+            start = 28 + 7 * i
+            atoms["anisou"][rows, i] = _numbers(
+                u_chars, start, start + 7, "f8") / 10000
+        atoms["has_anisou"][rows] = True
+    return atoms
+
+
+def _select_altlocs(atoms):
+    """Keep the alternate location with the highest occupancy (the first if
+    equal) of every atom."""
+    import numpy as np
+
+    altlocs = np.flatnonzero(atoms["altloc"] != b"")
+    if len(altlocs) == 0:
+        return atoms
+    keep = np.ones(len(atoms), dtype=bool)
+    selected = {}
+    for i in altlocs:
+        key = (atoms["model"][i], atoms["chain"][i], atoms["resseq"][i],
+               atoms["icode"][i], atoms["resname"][i], atoms["name"][i])
+        j = selected.get(key)
+        if j is None:
+            selected[key] = i
+        elif atoms["occupancy"][i] > atoms["occupancy"][j]:
+            keep[j] = False
+            selected[key] = i
+        else:
+            keep[i] = False
+    return atoms[keep]
+
+
+def atom_table(lines):
+    """Return the atom table of the ATOM and HETATM records in lines.
+
+    All models are read and numbered from 0 in file order in the model
+    field (a new model starts after every ENDMDL record), as by Biopython;
+    see first_model. Of alternate locations, the atom with the highest
+    occupancy of the model is kept (the first if equal). ANISOU
+    records are matched to the preceding ATOM or HETATM record and their
+    values are in A**2, as returned by Bio.PDB.Atom.get_anisou.
+
+    Return a numpy structured array with the fields in ATOM_DTYPE. The rows
+    are in file order.
+    """
+    atoms = _select_altlocs(_atom_records(lines))
+    _log.debug("Atom table with {0:d} atoms".format(len(atoms)))
+    return atoms
+
+
+def first_model(atoms):
+    """Return the rows of the first model of the atom table, as a view."""
+    import numpy as np
+
+    return atoms[:np.searchsorted(atoms["model"], 1)]
+
+
+def _is_atom_line(data, pos):
+    return data[pos:pos + 6] in (b"ATOM  ", b"HETATM")
+
+
+def _next_atom_line(data, pos, end):
+    """Return the offset of the first ATOM or HETATM record at or after the
+    line that contains pos, or end."""
+    if pos > 0 and data[pos - 1:pos] != b"\n":
+        pos = data.find(b"\n", pos, end) + 1 or end
+    while pos < end and not _is_atom_line(data, pos):
+        pos = data.find(b"\n", pos, end) + 1 or end
+    return pos
+
+
+def coordinate_ranges(data, parts):
+    """Split the coordinate section into byte ranges.
+
+    data is the file contents (e.g. an mmap). Ranges start at an ATOM or
+    HETATM record, so that ANISOU records stay with their atom, and the
+    last range ends at the end of data.
+
+    Return a list of at most parts (start, end) tuples.
+    """
+    end = len(data)
+    start = _next_atom_line(data, 0, end)
+    ranges = []
+    for k in range(1, parts + 1):
+        split = _next_atom_line(
+            data, start + (end - start) * k // parts, end) \
+            if k < parts else end
+        if split > start:
+            ranges.append((start, split))
+            start = split
+    return ranges
+
+
+def _count_models(data, start, end):
+    """Return the number of ENDMDL records in the byte range of data."""
+    count = 0
+    pos = data.find(b"\nENDMDL", start, end)
+    while pos >= 0:
+        count += 1
+        pos = data.find(b"\nENDMDL", pos + 1, end)
+    return count
+
+
+def _range_records(job):
+    """Return the atom table of a byte range of a file that starts in this
+    model, with all alternate locations.
+
+    The range is given by its contents or as (pdb_file_path, start, end),
+    to be read from the file.
+    """
+    source, model = job
+    if isinstance(source, tuple):
+        pdb_file_path, start, end = source
+        with open(pdb_file_path, "rb") as pdb_file:
+            pdb_file.seek(start)
+            source = pdb_file.read(end - start)
+    return _atom_records(source.splitlines(True), model)
+
+
+def parallel_atom_table(pdb_file_path, jobs=None, data=None):
+    """Return the atom table (see atom_table) of this PDB file.
+
+    pdb_file_path can also be the contents as a buffer or file object (see
+    pdbb.pdb.files.is_buffer). data are the uncompressed contents if they
+    have been read already (see pdbb.pdb.files.read_pdb_buffer).
+
+    The coordinate section is split into byte ranges (see
+    coordinate_ranges) that are parsed by jobs worker processes (default:
+    number of CPUs). The workers read their range from uncompressed files
+    on disk, so that only the parsed tables are sent between processes;
+    the ranges of compressed and preloaded files are sent to them.
+    """
+    import numpy as np
+
+    jobs = jobs or multiprocessing.cpu_count()
+    plain = is_plain_file(pdb_file_path)
+    if data is None:
+        data = read_pdb_buffer(pdb_file_path)
+    if isinstance(data, memoryview):  # No find on Python 2
+        data = data.tobytes()
+    ranges = coordinate_ranges(data, jobs)
+    # The model in which every range starts
+    sources = []
+    model = _count_models(data, 0, ranges[0][0]) if ranges else 0
+    for start, end in ranges:
+        sources.append(((pdb_file_path, start, end) if plain else
+                        bytes(data[start:end]), model))
+        model += _count_models(data, start, end)
+    _log.debug("Parsing {0:d} byte ranges in parallel".format(len(ranges)))
+    pool = multiprocessing.Pool(min(jobs, len(ranges)) or 1)
+    try:
+        chunks = pool.map(_range_records, sources)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    atoms = _select_altlocs(np.concatenate(chunks)) if chunks else \
+        np.zeros(0, dtype=ATOM_DTYPE)
+    _log.debug("Atom table with {0:d} atoms".format(len(atoms)))
+    return atoms
+
+
+def _read_atom_table(pdb_file_path):
+    min_bytes = pyconfig.get("PARALLEL_PARSE_MIN_BYTES")
+    jobs = pyconfig.get("PARALLEL_PARSE_JOBS")
+    if min_bytes is not None and multiprocessing.current_process().daemon:
+        _log.debug("Parsing serially in a daemonic worker process")
+    elif min_bytes is not None and is_plain_file(pdb_file_path):
+        if os.path.getsize(pdb_file_path) >= min_bytes:
+            return parallel_atom_table(pdb_file_path, jobs)
+    elif min_bytes is not None:
+        # The uncompressed size is only known after decompression
+        data = read_pdb_buffer(pdb_file_path)
+        if len(data) >= min_bytes:
+            return parallel_atom_table(pdb_file_path, jobs, data)
+        pdb_file_path = memoryview(data)
+    with open_pdb_file(pdb_file_path) as pdb_file:
+        return atom_table(pdb_file)
+
+
+def read_atom_table(pdb_file_path):
+    """Return the atom table (see atom_table) of this PDB file.
+
+    Files of at least PARALLEL_PARSE_MIN_BYTES (uncompressed) are parsed in
+    parallel by PARALLEL_PARSE_JOBS processes (see parallel_atom_table),
+    except in daemonic processes (e.g. the workers of a
+    multiprocessing.Pool), which cannot start processes of their own. The
+    workers of bdb-batch are not daemonic for this reason.
+
+    With ATOM_CACHE_DIR, the table is read from the cache if the contents
+    of the file were parsed before, as a read-only memory map (see
+    pdbb.pdb.cache), and saved to it otherwise.
+    """
+    key = content_key(pdb_file_path) if pyconfig.get("ATOM_CACHE_DIR") \
+        else None
+    if key is not None:
+        atoms = load_atom_table(key)
+        if atoms is not None:
+            return atoms
+    atoms = _read_atom_table(pdb_file_path)
+    if key is not None:
+        store_atom_table(key, atoms)
+    return atoms
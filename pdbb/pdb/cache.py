@@ -0,0 +1,164 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""On-disk cache of atom tables for repeated runs.
+
+The atom table of a PDB file (see pdbb.pdb.atoms.atom_table) is saved as a
+.npy file in ATOM_CACHE_DIR, named after the SHA-1 hash of the contents of
+the file, so that later runs map it into memory instead of parsing the
+coordinates again. Changed files get a new key, and a cached table is never
+out of date. The least recently used tables are removed when the cache is
+larger than ATOM_CACHE_BYTES.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import errno
+import hashlib
+import os
+import pyconfig
+import tempfile
+
+from pdbb.pdb.files import (_compression, _contents, compression,
+                            open_pdb_file)
+
+
+# Version of the cached tables, part of the key (change with ATOM_DTYPE)
+CACHE_VERSION = 2
+
+# Bytes to write between two checks of the size of the cache, as a fraction
+# of ATOM_CACHE_BYTES
+EVICT_INTERVAL = 0.1
+
+# Bytes written by this process since the last check (None: never checked)
+_written = None
+
+
+def content_key(pdb_file):
+    """Return the cache key of the PDB file, or None for a file object.
+
+    The key is the SHA-1 hash of the uncompressed contents, so that a
+    compressed file on disk and its preloaded (decompressed) contents share
+    the cached table.
+    """
+    if hasattr(pdb_file, "read"):
+        return None
+    sha1 = hashlib.sha1()
+    data = _contents(pdb_file)
+    if data is not None and _compression(data) is None:
+        sha1.update(data)
+        return "{0:s}-{1:d}".format(sha1.hexdigest(), CACHE_VERSION)
+    if data is None and compression(pdb_file) is None:
+        f = open(pdb_file, "rb")
+    else:
+        f = open_pdb_file(pdb_file)
+    with f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    return "{0:s}-{1:d}".format(sha1.hexdigest(), CACHE_VERSION)
+
+
+def cache_path(key):
+    """Return the path of the cached atom table with this key."""
+    return os.path.join(pyconfig.get("ATOM_CACHE_DIR"), key + ".npy")
+
+
+def load_atom_table(key):
+    """Return the cached atom table with this key as a read-only memory map,
+    or None if it is not cached."""
+    import numpy as np
+
+    path = cache_path(key)
+    try:
+        atoms = np.load(path, mmap_mode="r")
+    except (IOError, OSError, ValueError) as ex:
+        if getattr(ex, "errno", None) != errno.ENOENT:
+            _log.warning("Could not read {0:s}: {1}".format(path, ex))
+        return None
+    try:
+        # Mark as recently used (not possible in a read-only cache)
+        os.utime(path, None)
+    except (IOError, OSError):
+        pass
+    _log.debug("Atom table from cache {0:s}".format(path))
+    return atoms
+
+
+def store_atom_table(key, atoms):
+    """Save the atom table with this key in the cache.
+
+    The table is written to a temporary file that is renamed, so that
+    parallel runs never read a partial table. The size of the cache is
+    checked (see evict) after every EVICT_INTERVAL * ATOM_CACHE_BYTES bytes
+    written by this process. Return True if the table was saved.
+    """
+    global _written
+    import numpy as np
+
+    path = cache_path(key)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, atoms)
+            os.rename(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except (IOError, OSError) as ex:
+        _log.warning("Could not write {0:s}: {1}".format(path, ex))
+        return False
+    _log.debug("Saved atom table to cache {0:s}".format(path))
+
+    max_bytes = pyconfig.get("ATOM_CACHE_BYTES")
+    if max_bytes is not None:
+        size = os.path.getsize(path)
+        if _written is None or _written + size > max_bytes * EVICT_INTERVAL:
+            evict(os.path.dirname(path), max_bytes)
+            _written = 0
+        else:
+            _written += size
+    return True
+
+
+def evict(cache_dir, max_bytes):
+    """Remove the least recently used tables until the cache is at most
+    max_bytes large. Return the number of removed tables."""
+    tables = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".npy"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue  # removed by another process
+        tables.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in tables)
+    removed = 0
+    for _, size, path in sorted(tables):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+    if removed:
+        _log.info("Removed {0:d} atom tables from the cache".format(removed))
+    return removed
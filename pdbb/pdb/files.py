@@ -0,0 +1,274 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""Access to PDB files, compressed or read into memory in advance.
+
+PDB files may be compressed with gzip (.ent.gz as on the wwPDB mirror),
+bzip2 or xz. The compression is recognized from the first bytes and the
+files are decompressed while they are read.
+
+The readers also accept the contents as a buffer (memoryview, bytearray)
+or file object instead of a path (see is_buffer).
+
+The batch driver reads the next files while the current entries are being
+processed (see pdbb.batch.Prefetcher). In the worker, the contents are
+registered with preloaded() and the readers of this package open them with
+open_pdb_file, so that they do not wait for (network) file I/O again.
+
+Programs that need an uncompressed file on disk (TLSANL) get one in the
+scratch directory from materialized().
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import bz2
+import gzip
+import io
+import mmap
+import os
+import pyconfig
+import shutil
+import tempfile
+
+from contextlib import contextmanager
+
+try:
+    import lzma
+except ImportError:  # Python < 3.3
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    from cStringIO import StringIO as _buffer_reader  # Does not copy
+except ImportError:  # Python 3
+    _buffer_reader = io.BytesIO
+
+
+# Magic numbers of the supported compression formats
+MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+)
+
+# pdb_file_path: file contents
+_PRELOADED = {}
+
+
+@contextmanager
+def preloaded(pdb_file_path, data):
+    """Read the PDB file at pdb_file_path from data in this context.
+
+    If data is None, the file is read as before (from disk, or from the
+    data of an enclosing context).
+    """
+    if data is None:
+        yield
+        return
+    previous = _PRELOADED.get(pdb_file_path)
+    _PRELOADED[pdb_file_path] = data
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _PRELOADED[pdb_file_path]
+        else:
+            _PRELOADED[pdb_file_path] = previous
+
+
+def is_preloaded(pdb_file_path):
+    """Return True if the PDB file is read from memory."""
+    return not is_buffer(pdb_file_path) and pdb_file_path in _PRELOADED
+
+
+def pdb_file_exists(pdb_file):
+    """Return True if the PDB file is a buffer, preloaded or exists."""
+    return is_buffer(pdb_file) or is_preloaded(pdb_file) or \
+        os.path.exists(pdb_file)
+
+
+def is_buffer(pdb_file):
+    """Return True if pdb_file is a buffer or file object, not a path.
+
+    Buffers are memoryview and bytearray objects (and bytes on Python 3; on
+    Python 2 bytes are paths, use memoryview(data) instead).
+    """
+    return hasattr(pdb_file, "read") or \
+        isinstance(pdb_file, (memoryview, bytearray)) or \
+        bytes is not str and isinstance(pdb_file, bytes)
+
+
+def _contents(pdb_file):
+    """Return the (compressed) contents of a buffer or preloaded file, or
+    None for a file on disk."""
+    if hasattr(pdb_file, "read"):
+        return pdb_file.read()
+    elif is_buffer(pdb_file):
+        return pdb_file
+    return _PRELOADED.get(pdb_file)
+
+
+def _compression(head):
+    head = bytes(bytearray(head[:6]))
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def compression(pdb_file_path):
+    """Return the compression format of the PDB file or None."""
+    head = _PRELOADED.get(pdb_file_path)
+    if head is None:
+        with open(pdb_file_path, "rb") as f:
+            head = f.read(6)
+    return _compression(head)
+
+
+def _lzma():
+    if lzma is None:
+        raise IOError("Reading xz files requires the lzma module "
+                      "(backports.lzma on Python 2)")
+    return lzma
+
+
+class _BufferFile(object):
+    """A read-only file object of a buffer, which is not copied (as by
+    io.BytesIO on Python 2)."""
+
+    def __init__(self, data):
+        self._file = _buffer_reader(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+def _open_contents(data):
+    method = _compression(data)
+    if method == "gzip":
+        return io.BufferedReader(gzip.GzipFile(fileobj=_buffer_reader(data)))
+    elif method == "bz2":
+        # bz2.BZ2File does not read file objects on Python 2
+        return _BufferFile(bz2.decompress(data))
+    elif method == "xz":
+        return _lzma().LZMAFile(_buffer_reader(data))
+    return _BufferFile(data)
+
+
+def open_pdb_file(pdb_file):
+    """Return a file object of the uncompressed PDB file.
+
+    pdb_file is a path or a buffer or file object (see is_buffer). The file
+    is read from memory if it is preloaded and decompressed while it is read
+    if it is compressed.
+    """
+    data = _contents(pdb_file)
+    if data is not None:
+        return _open_contents(data)
+    method = compression(pdb_file)
+    if method == "gzip":
+        return io.BufferedReader(gzip.open(pdb_file))
+    elif method == "bz2":
+        return bz2.BZ2File(pdb_file)
+    elif method == "xz":
+        return _lzma().LZMAFile(pdb_file)
+    return open(pdb_file)
+
+
+def read_pdb_buffer(pdb_file):
+    """Return the uncompressed contents of the PDB file as a buffer.
+
+    pdb_file is a path or a buffer or file object (see is_buffer). Buffers
+    and preloaded files are returned as they are and uncompressed files on
+    disk are memory-mapped, so that their contents are not copied. Compressed
+    files are decompressed into memory.
+    """
+    data = _contents(pdb_file)
+    if data is None:
+        if compression(pdb_file) is None:
+            with open(pdb_file, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open_pdb_file(pdb_file) as f:
+            return f.read()
+    if _compression(data) is None:
+        return data
+    with _open_contents(data) as f:
+        return f.read()
+
+
+def uncompressed_buffer(pdb_file):
+    """Return the uncompressed contents of the PDB file as a buffer (see
+    read_pdb_buffer) if they can be had without reading or decompressing
+    it: uncompressed buffers and preloaded files and memory maps of
+    uncompressed files on disk. Return None otherwise.
+    """
+    if hasattr(pdb_file, "read"):
+        return None
+    data = _contents(pdb_file)
+    if data is None:
+        return read_pdb_buffer(pdb_file) \
+            if compression(pdb_file) is None else None
+    return data if _compression(data) is None else None
+
+
+def is_plain_file(pdb_file):
+    """Return True if the PDB file is an uncompressed file on disk."""
+    return not is_buffer(pdb_file) and not is_preloaded(pdb_file) and \
+        compression(pdb_file) is None
+
+
+def copy_pdb_file(pdb_file_path, dst):
+    """Copy the uncompressed PDB file to dst."""
+    if is_plain_file(pdb_file_path):
+        shutil.copy(pdb_file_path, dst)
+        return
+    with open_pdb_file(pdb_file_path) as src, open(dst, "wb") as f:
+        shutil.copyfileobj(src, f)
+
+
+@contextmanager
+def materialized(pdb_file_path):
+    """Yield the path of an uncompressed file on disk of the PDB file.
+
+    Compressed and preloaded files are written to a temporary file in the
+    SCRATCH_DIR directory (None: the system default), which is removed
+    afterwards.
+    """
+    if is_plain_file(pdb_file_path):
+        yield pdb_file_path
+        return
+    fd, path = tempfile.mkstemp(suffix=".pdb",
+                                dir=pyconfig.get("SCRATCH_DIR"))
+    try:
+        with open_pdb_file(pdb_file_path) as src, os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(src, f)
+        _log.debug("Materialized {0:s} as {1:s}".format(pdb_file_path, path))
+        yield path
+    finally:
+        os.remove(path)
@@ -0,0 +1,158 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""Persistent record index of PDB files for repeated runs.
+
+The index of a PDB file has the line lengths and record names of the file
+(see pdbb.pdb.records.line_index), so that later runs find the header, the
+coordinate section and the records without scanning the file again. It is
+written as a compressed numpy .npz file with the .idx extension, next to
+the PDB file or in RECORD_INDEX_DIR, when RECORD_INDEX is set. An index is
+only used if the size and modification time of the PDB file are unchanged.
+
+The index only saves the scan for the lines, not the reading of the file:
+the records are still sliced from the whole uncompressed contents. For
+uncompressed files these are memory-mapped, so that only the pages of the
+records that are read are loaded, but compressed files (.ent.gz) are still
+decompressed completely, which costs much more than the scan. Indexes are
+therefore only worthwhile for uncompressed files.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+import os
+import pyconfig
+import tempfile
+
+from pdbb.pdb.files import is_buffer
+from pdbb.pdb.records import line_index
+
+
+# Version of the index format
+INDEX_VERSION = 1
+
+
+def index_path(pdb_file_path):
+    """Return the path of the index of the PDB file.
+
+    Indexes in RECORD_INDEX_DIR are named after the PDB file (not its
+    directory), so PDB file names must be unique there.
+    """
+    index_dir = pyconfig.get("RECORD_INDEX_DIR")
+    if index_dir is None:
+        return pdb_file_path + ".idx"
+    return os.path.join(index_dir, os.path.basename(pdb_file_path) + ".idx")
+
+
+def is_indexable(pdb_file):
+    """Return True if RECORD_INDEX is set and pdb_file is a file on disk."""
+    return bool(pyconfig.get("RECORD_INDEX")) and not is_buffer(pdb_file) \
+        and os.path.isfile(pdb_file)
+
+
+def _stamp(pdb_file_path):
+    st = os.stat(pdb_file_path)
+    return st.st_size, st.st_mtime
+
+
+def write_index(pdb_file_path, starts, ends, names):
+    """Write the index of the lines of the PDB file.
+
+    The index is written to a temporary file that is renamed, so that
+    parallel runs never read a partial index. Return True if the index was
+    written.
+    """
+    import numpy as np
+
+    path = index_path(pdb_file_path)
+    lengths = ends - starts
+    lengths = lengths.astype(np.uint16 if len(lengths) == 0 or
+                             lengths.max() < 2 ** 16 else np.int64)
+    size, mtime = _stamp(pdb_file_path)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, version=INDEX_VERSION, size=size,
+                                    mtime=mtime, lengths=lengths,
+                                    names=names)
+            os.rename(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except (IOError, OSError) as ex:
+        _log.warning("Could not write index {0:s}: {1}".format(path, ex))
+        return False
+    _log.debug("Wrote index {0:s}".format(path))
+    return True
+
+
+def read_index(pdb_file_path):
+    """Return the line starts, ends and record names of the PDB file from its
+    index (see pdbb.pdb.records.line_index).
+
+    Return None if there is no index, or if it is unreadable, of another
+    version or older than the PDB file.
+    """
+    import numpy as np
+
+    path = index_path(pdb_file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as index:
+            if int(index["version"]) != INDEX_VERSION or \
+                    (int(index["size"]), float(index["mtime"])) != \
+                    _stamp(pdb_file_path):
+                _log.debug("Index {0:s} is out of date".format(path))
+                return None
+            lengths = index["lengths"]
+            names = index["names"]
+    except Exception as ex:
+        _log.warning("Could not read index {0:s}: {1}".format(path, ex))
+        return None
+    ends = np.cumsum(lengths, dtype=np.int64)
+    return ends - lengths, ends, names
+
+
+def _from(index, start):
+    """Return the lines of the index from offset start."""
+    if start == 0:
+        return index
+    first = index[0].searchsorted(start)
+    return tuple(a[first:] for a in index)
+
+
+def indexed_lines(pdb_file, data, start=0):
+    """Return the line starts, ends and record names of the uncompressed
+    contents data of the PDB file, from offset start (the start of a line).
+
+    They are read from the index of the file if it is valid, or found in
+    data (see pdbb.pdb.records.line_index) and written to a new index if
+    the file is indexable (see is_indexable). data must be the whole
+    contents, also if the index is valid.
+    """
+    if not is_indexable(pdb_file):
+        return line_index(data, start)
+    index = read_index(pdb_file)
+    if index is not None and (index[1][-1] if len(index[1]) > 0 else 0) \
+            == len(data):
+        _log.debug("Using index of {0:s}".format(pdb_file))
+        return _from(index, start)
+    index = line_index(data)
+    write_index(pdb_file, *index)
+    return _from(index, start)
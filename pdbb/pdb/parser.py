@@ -18,10 +18,18 @@ import logging
 _log = logging.getLogger(__name__)
 
 import datetime
-import os
 import re
 
+from pdbb.pdb.files import (is_buffer, is_plain_file, open_pdb_file,
+                            pdb_file_exists, preloaded, read_pdb_buffer,
+                            uncompressed_buffer)
+from pdbb.pdb.index import indexed_lines
+from pdbb.pdb.records import (COORDINATE_START, PdbRecords, buffer_slicer,
+                              coordinate_start)
 
+
+RE_COORDINATE_SECTION = re.compile(r"^(MODEL|ATOM|HETATM|ANISOU|SIGUIJ|"
+                                   "TER|ENDMDL|END\s+)")
 RE_BTYPE = re.compile(r"^  3   B VALUE TYPE : (?P<btype>.*)")
 RE_REF_PROG = re.compile(r"^  3   PROGRAM     : (?P<refprogs>.*)")
 RE_REF_REMARKS = re.compile(r"^  3  OTHER REFINEMENT REMARKS: (?!NULL|NONE)")
@@ -40,6 +48,9 @@ RE_TLS_SEL = re.compile(r"""
         (?P<rn_2>-?\d+)
         (?P<ic_2>[a-zA-Z]?)\s*$
         """, re.VERBOSE)
+RE_TLS_GROUP = re.compile(r"^\s+3\s+TLS GROUP\s*:\s*(?P<group>\d+)")
+RE_TLS_PHENIX_SEL = re.compile(r"^\s+3\s+SELECTION\s*:\s*(?P<sel>.*?)\s*$")
+RE_TLS_PHENIX_CONT = re.compile(r"^\s+3\s{8,}(?P<sel>\S.*?)\s*$")
 RE_TLS_RES = re.compile(r"^  3   ATOM RECORD CONTAINS RESIDUAL B FACTORS ONLY")
 RE_TLS_RES_1 = re.compile(r"RESIDUAL\s+([BU]-?\s*(FACTORS?|VALUES?)\s+)?ONLY")
 RE_TLS_RES_2 = re.compile(r"ATOMIC\s+[BU]-?\s*(FACTORS?|VALUES?)\s+(SHOWN\s+)?"
@@ -84,34 +95,127 @@ RE_TLS_SUM_6 = re.compile(r"""
         """, re.VERBOSE)
 
 
-def parse_pdb_file(pdb_file_path):
+# Bytes read at a time after the header of a compressed file
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class PdbFileReader(object):
+    """Parse the header and then the rest of a PDB file from one read.
+
+    Use as
+        with PdbFileReader(pdb_file_path) as reader:
+            header = reader.parse_header()
+            pdb_records = reader.parse()
+
+    parse_header returns the records up to the first MODEL, ATOM or HETATM
+    record, as parse_pdb_file with header_only. parse returns all records,
+    as parse_pdb_file: only the lines after the header are found, in the
+    contents that follow it, so that a compressed file is decompressed once
+    and its header is not parsed again.
+
+    Uncompressed files are read as by read_pdb_buffer (memory-mapped if on
+    disk). The decompressed contents of other files are kept in memory and,
+    with keep, preloaded (see pdbb.pdb.files.preloaded) until the end of
+    the with block, so that the other readers of the entry (e.g.
+    pdbb.pdb.atoms.read_atom_table) do not decompress the file again. The
+    records returned by parse do not keep these contents (see
+    pdbb.pdb.records.PdbRecords): their coordinate records are read again
+    from the file if they are accessed.
+    """
+
+    def __init__(self, pdb_file_path, keep=False):
+        self.pdb_file_path = pdb_file_path
+        self.keep = keep
+        self._file = None
+        self._head = None  # the lines read by parse_header
+        self._offset = 0  # of the first line that is not in the header
+        self._header = None
+        self._preloaded = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the file and release the decompressed contents."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._preloaded is not None:
+            self._preloaded.__exit__(None, None, None)
+            self._preloaded = None
+        self._head = None
+
+    def parse_header(self):
+        """Return the header records (see parse_pdb_file)."""
+        if not pdb_file_exists(self.pdb_file_path):
+            _log.error("'{}' not found".format(self.pdb_file_path))
+            raise ValueError("'{}' not found".format(self.pdb_file_path))
+        self._file = open_pdb_file(self.pdb_file_path)
+        self._head = bytearray()
+        records = {}
+        for record in iter(self._file.readline, b""):
+            self._head += record
+            if record.startswith(COORDINATE_START):
+                break
+            self._offset += len(record)
+            records.setdefault(record[0:6], []).append(record[7:])
+        self._header = records
+        return records
+
+    def parse(self):
+        """Return all records (see parse_pdb_file)."""
+        if self._header is None:
+            self.parse_header()
+        data = uncompressed_buffer(self.pdb_file_path)
+        if data is None:
+            for block in iter(lambda: self._file.read(READ_BLOCK_SIZE), b""):
+                self._head += block
+            data = self._head
+            if self.keep and not is_buffer(self.pdb_file_path):
+                self._preloaded = preloaded(self.pdb_file_path, data)
+                self._preloaded.__enter__()
+        self._file.close()
+        self._file = None
+        path = self.pdb_file_path
+        source = None if is_buffer(path) or is_plain_file(path) else path
+        return PdbRecords(data, *indexed_lines(path, data, self._offset),
+                          header=self._header, source=source)
+
+
+def parse_pdb_file(pdb_file_path, header_only=False):
     """
     Parses the given pdb file, returning a dict where the key is the
     record name (e.g. 'ATOM   ') and the value is a list of all lines of that
     record name type.
 
+    pdb_file_path can also be the contents as a buffer or file object (see
+    pdbb.pdb.files.is_buffer). The lines are found in the buffer (see
+    pdbb.pdb.records.line_index). The dict is a read-only
+    pdbb.pdb.records.PdbRecords, which keeps the coordinate records as
+    offsets into the buffer and only makes their strings when read. The
+    decompressed contents of compressed and preloaded files are not kept:
+    their coordinate records are read again from the file when accessed.
+
+    If header_only is True, reading stops at the first MODEL, ATOM or HETATM
+    record, so that (compressed) coordinates are not read at all. To parse
+    the rest of the file after its header, use a PdbFileReader.
+
+    With RECORD_INDEX, the lines of a full parse are found from the index
+    of the file (see pdbb.pdb.index), which is written by the first one.
+
     No validation is performed on the content of the pdb file.
 
     If the file at pdb_file_path doesn't exist, a ValueError is raised.
     """
-    _log.info("Parsing pdb file {}".format(pdb_file_path))
-
-    if not os.path.exists(pdb_file_path):
-        _log.error("'{}' not found".format(pdb_file_path))
-        raise ValueError("'{}' not found".format(pdb_file_path))
-
-    with open(pdb_file_path) as pdb_file:
-        records = {}
-        for record in pdb_file:
-            record_name = record[0:6]
-
-            # If this is the first occurrence of a record name, initialise
-            # the value with an empty list.
-            if record_name not in records:
-                records[record_name] = []
-            records[record_name].append(record[7:])
-        _log.debug("Parsed {0} records".format(len(records)))
-        return records
+    _log.info("Parsing pdb file {}".format(
+        pdb_file_path if not is_buffer(pdb_file_path) else "from buffer"))
+    with PdbFileReader(pdb_file_path) as reader:
+        records = reader.parse_header() if header_only else reader.parse()
+    _log.debug("Parsed {0} records".format(len(records)))
+    return records
 
 
 def parse_dep_date(pdb_records):
@@ -263,22 +367,67 @@ def parse_tls_selection(pdb_records):
     for record in pdb_records["REMARK"]:
         m = RE_TLS_SEL.search(record)
         if m is not None:
-            chain_1 = m.group("ch_1")
-            num_1 = m.group("rn_1")
-            ic_1 = m.group("ic_1")
-            chain_2 = m.group("ch_2")
-            num_2 = m.group("rn_2")
-            ic_2 = m.group("ic_2")
-            selection = {"chain_1": chain_1,
-                         "num_1": int(num_1),
-                         "ic_1": None if ic_1 == '' else ic_1,
-                         "chain_2": chain_2,
-                         "num_2": int(num_2),
-                         "ic_2": None if ic_2 == '' else ic_2}
-            selections.append(selection)
+            selections.append(_tls_range(m))
     return selections
 
 
+def _tls_range(m):
+    """Return the residue range dict of a RE_TLS_SEL match."""
+    chain_1 = m.group("ch_1")
+    num_1 = m.group("rn_1")
+    ic_1 = m.group("ic_1")
+    chain_2 = m.group("ch_2")
+    num_2 = m.group("rn_2")
+    ic_2 = m.group("ic_2")
+    return {"chain_1": chain_1,
+            "num_1": int(num_1),
+            "ic_1": None if ic_1 == '' else ic_1,
+            "chain_2": chain_2,
+            "num_2": int(num_2),
+            "ic_2": None if ic_2 == '' else ic_2}
+
+
+def parse_tls_groups(pdb_records):
+    """
+    Parses the selections of the tls groups, returning a list with a dict
+    per TLS GROUP with
+    ranges    : the REFMAC-style residue ranges (dicts as returned by
+                parse_tls_selection)
+    selection : the PHENIX-style selection string (e.g. "CHAIN A AND RESID
+                1:50"), joined over continuation lines, or None
+
+    If no tls groups are found, an empty list is returned.
+    """
+    groups = []
+    continued = False
+    for record in pdb_records["REMARK"]:
+        m = RE_TLS_GROUP.search(record)
+        if m is not None:
+            groups.append({"ranges": [], "selection": None})
+            continued = False
+            continue
+        if not groups:
+            continue
+        m = RE_TLS_SEL.search(record)
+        if m is not None:
+            groups[-1]["ranges"].append(_tls_range(m))
+            continued = False
+            continue
+        m = RE_TLS_PHENIX_SEL.search(record)
+        if m is not None:
+            selection = groups[-1]["selection"]
+            groups[-1]["selection"] = m.group("sel") if selection is None \
+                else "({0:s}) OR ({1:s})".format(selection, m.group("sel"))
+            continued = True
+            continue
+        m = RE_TLS_PHENIX_CONT.search(record)
+        if continued and m is not None:
+            groups[-1]["selection"] += " " + m.group("sel")
+            continue
+        continued = False
+    return groups
+
+
 def parse_ref_prog(pdb_records):
     """
     Parses the refinement program from the pdb REMARK records, returning it as
@@ -370,6 +519,9 @@ def is_tls_sum(pdb_records):
 def get_pdb_header_and_trailer(pdb_file_path):
     """Return the PDB-file header and trailer records as two lists.
 
+    pdb_file_path can also be the contents as a buffer or file object (see
+    pdbb.pdb.files.is_buffer).
+
     We assume the PDB file has the following composition:
     Header records
     [MODEL]
@@ -382,16 +534,21 @@ def get_pdb_header_and_trailer(pdb_file_path):
     Trailer records
     END
     """
-    header = []
-    trailer = []
-    head_records = True
-    with open(pdb_file_path, "r") as pdb:
-        for record in pdb:
-            if re.search(r"^(MODEL|ATOM|HETATM)", record):
-                head_records = False
-            if head_records:
-                header.append(record[0:80])  # keep trailing whitespace
-            elif not re.search(r"^(MODEL|ATOM|HETATM|ANISOU|SIGUIJ|"
-                               "TER|ENDMDL|END\s+)", record):
-                trailer.append(record[0:80])
+    import numpy as np
+
+    data = read_pdb_buffer(pdb_file_path)
+    starts, ends, names = indexed_lines(pdb_file_path, data)
+    first = coordinate_start(names)
+    # Trailer records are recognized from the record names
+    is_trailer = np.zeros(len(names), dtype=bool)
+    for name in np.unique(names[first:]).tolist():
+        if not RE_COORDINATE_SECTION.search(name):
+            is_trailer[first:] |= names[first:] == name
+    line = buffer_slicer(data)
+    # keep trailing whitespace
+    header = list(map(line, starts[:first].tolist(),
+                      np.minimum(ends[:first], starts[:first] + 80).tolist()))
+    trailer = list(map(line, starts[is_trailer].tolist(),
+                       np.minimum(ends[is_trailer],
+                                  starts[is_trailer] + 80).tolist()))
     return header, trailer
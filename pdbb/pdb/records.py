@@ -0,0 +1,195 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""Records of a PDB file as offsets into its contents.
+
+The lines of a buffer (see pdbb.pdb.files.read_pdb_buffer) are found with
+numpy, so that no string is made for a line until it is needed. PdbRecords
+keeps the coordinate records as offsets only.
+"""
+import logging
+_log = logging.getLogger(__name__)
+
+from pdbb.pdb.files import read_pdb_buffer
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+# Records that start the coordinate section
+COORDINATE_START = ("MODEL", "ATOM", "HETATM")
+
+# Records that are kept as offsets into the buffer (see PdbRecords)
+OFFSET_RECORDS = ("ATOM  ", "HETATM", "ANISOU", "SIGATM", "SIGUIJ", "CONECT")
+
+
+def _as_array(data):
+    """Return the bytes of the buffer as a numpy uint8 array (no copy)."""
+    import numpy as np
+
+    if isinstance(data, memoryview):
+        return np.asarray(data).view(np.uint8).ravel()
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def buffer_slicer(data):
+    """Return a function that returns data[start:end] as a string."""
+    if isinstance(data, memoryview):
+        return lambda start, end: data[start:end].tobytes()
+    elif isinstance(data, bytearray):
+        return lambda start, end: bytes(data[start:end])
+    # Much faster with map than a lambda (str and mmap on Python 2)
+    return getattr(data, "__getslice__", lambda start, end: data[start:end])
+
+
+def line_index(data, start=0):
+    """Return the line offsets and record names of the buffer.
+
+    Return the start and end offsets (after the newline) of the lines and the
+    record names, which are the first six characters of the lines as by
+    line[0:6] (including the newline of shorter lines), as numpy arrays.
+    Only the lines from offset start (the start of a line) are indexed.
+    """
+    import numpy as np
+
+    chars = _as_array(data)
+    n = len(chars)
+    ends = np.flatnonzero(chars[start:] == ord("\n")) + (start + 1)
+    if n > start and (len(ends) == 0 or ends[-1] != n):
+        ends = np.append(ends, n)
+    starts = np.zeros(len(ends), dtype=ends.dtype)
+    if len(ends) > 0:
+        starts[0] = start
+    starts[1:] = ends[:-1]
+
+    # First six characters, padded with NUL (stripped from "S6" values)
+    head = np.zeros((len(starts), 6), dtype=np.uint8)
+    for i in range(6):
+        column = starts + i
+        in_line = column < ends
+        head[in_line, i] = chars[column[in_line]]
+    names = head.view("S6").ravel()
+    return starts, ends, names
+
+
+def _groups(names):
+    """Yield the record names and the rows (in file order) of their lines."""
+    import numpy as np
+
+    if len(names) == 0:
+        return
+    order = np.argsort(names, kind="mergesort")
+    sorted_names = names[order]
+    bounds = np.flatnonzero(sorted_names[1:] != sorted_names[:-1]) + 1
+    for first, last in zip(np.append(0, bounds),
+                           np.append(bounds, len(order))):
+        yield str(sorted_names[first]), order[first:last]
+
+
+class PdbRecords(Mapping):
+    """A read-only dict of record name to the lines (from column 8) of that
+    record, in file order (see parse_pdb_file).
+
+    The lines of the records in OFFSET_RECORDS are kept as offsets into the
+    buffer and sliced to strings each time they are read, so that the
+    coordinates take 8 bytes per line instead of a string each. All other
+    records are kept as lists of strings, after the lines of header (a dict
+    of record name to lines) if given.
+
+    Without source, the buffer is kept open as long as the records are. With
+    source, a PDB file (see pdbb.pdb.files.read_pdb_buffer) whose contents
+    are the buffer, the buffer is released after the header records are
+    copied out and the offset records are read again from source when
+    accessed, so that decompressed contents are not kept in memory.
+    """
+
+    def __init__(self, data, starts, ends, names, header=None, source=None):
+        import numpy as np
+
+        line = buffer_slicer(data)
+        self._line = line if source is None else None
+        self._source = source
+        self._lines = dict((name, list(lines))
+                           for name, lines in (header or {}).items())
+        self._offsets = {}
+        dtype = np.uint32 if len(data) < 2 ** 32 else np.int64
+        for name, rows in _groups(names):
+            if name in OFFSET_RECORDS:
+                self._offsets[name] = ((starts[rows] + 7).astype(dtype),
+                                       ends[rows].astype(dtype))
+            else:
+                self._lines.setdefault(name, []).extend(map(
+                    line, (starts[rows] + 7).tolist(), ends[rows].tolist()))
+
+    def __getitem__(self, name):
+        if name in self._offsets:
+            starts, ends = self._offsets[name]
+            line = self._line
+            if line is None:
+                _log.debug("Reading {} records again from the file".format(
+                    name.strip()))
+                line = buffer_slicer(read_pdb_buffer(self._source))
+            return list(map(line, starts.tolist(), ends.tolist()))
+        return self._lines[name]
+
+    def __contains__(self, name):
+        return name in self._lines or name in self._offsets
+
+    def __iter__(self):
+        for name in self._lines:
+            yield name
+        for name in self._offsets:
+            yield name
+
+    def __len__(self):
+        return len(self._lines) + len(self._offsets)
+
+    def count(self, name):
+        """Return the number of lines of this record (0 if not present)
+        without reading them."""
+        if name in self._offsets:
+            return len(self._offsets[name][0])
+        return len(self._lines.get(name, []))
+
+    def nbytes(self):
+        """Return the size of the offset arrays in bytes."""
+        return sum(s.nbytes + e.nbytes for s, e in self._offsets.values())
+
+
+def startswith(names, prefix):
+    """Return a mask of the record names that start with prefix.
+
+    Much faster than np.char.startswith.
+    """
+    import numpy as np
+
+    chars = np.ascontiguousarray(names).view(np.uint8).reshape(-1, 6)
+    prefix = np.frombuffer(prefix.encode("ascii"), dtype=np.uint8)
+    return (chars[:, :len(prefix)] == prefix).all(axis=1)
+
+
+def coordinate_start(names):
+    """Return the index of the first line of the coordinate section (the
+    number of lines if there is none)."""
+    import numpy as np
+
+    is_start = np.zeros(len(names), dtype=bool)
+    for prefix in COORDINATE_START:
+        is_start |= startswith(names, prefix)
+    first = np.flatnonzero(is_start)
+    return first[0] if len(first) > 0 else len(names)
@@ -0,0 +1,119 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+import logging
+_log = logging.getLogger(__name__)
+
+import cProfile
+import os
+import pstats
+
+from collections import Counter, defaultdict
+
+
+def profile_call(pstats_path, func, *args, **kwargs):
+    """Call func under cProfile and save the profile to pstats_path.
+
+    Return the return value of func.
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        try:
+            profiler.dump_stats(pstats_path)
+            _log.info("Profile saved to {0:s}".format(pstats_path))
+        except (IOError, OSError) as ex:
+            _log.error(ex)
+
+
+def merge_pstats(pstats_paths):
+    """Return a single pstats.Stats with the sum of the given profiles."""
+    merged = None
+    for path in pstats_paths:
+        if merged is None:
+            merged = pstats.Stats(path)
+        else:
+            merged.add(path)
+    return merged
+
+
+def frame_label(func):
+    """Return a flamegraph frame label for a pstats function key."""
+    file_name, line, name = func
+    if file_name == "~":  # built-in
+        label = name
+    else:
+        label = "{0:s}:{1:d}({2:s})".format(os.path.basename(file_name), line,
+                                            name)
+    return label.replace(";", ",")
+
+
+def collapsed_stacks(stats, min_time=1e-6):
+    """Return a Counter of collapsed stacks (tuples of frame labels) and the
+    self time (seconds) attributed to them.
+
+    cProfile only records caller-callee pairs, not complete stacks. The stacks
+    are reconstructed from the call graph by following all call paths from the
+    root functions. The time of a function is distributed over its callers in
+    proportion to the cumulative time spent in the function per caller.
+    Recursive calls are folded into the first occurrence of the function on
+    the stack and paths with less than min_time seconds are pruned.
+    """
+    children = defaultdict(dict)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not [c for c in callers if c != func]:
+            roots.append(func)
+        for caller, edge in callers.items():
+            if isinstance(edge, tuple):
+                edge_ct = edge[3]
+            else:  # profile (not cProfile) only records call counts
+                edge_ct = ct * edge / nc if nc else 0.0
+            children[caller][func] = edge_ct
+
+    stacks = Counter()
+    todo = [(r, (r, ), stats.stats[r][3]) for r in roots]
+    while todo:
+        func, path, t = todo.pop()
+        ct = stats.stats[func][3]
+        tt = stats.stats[func][2]
+        frac = t / ct if ct > 0 else 0.0
+        labels = tuple(frame_label(f) for f in path)
+        stacks[labels] += tt * frac
+        for child, edge_ct in children[func].items():
+            child_t = edge_ct * frac
+            if child in path:
+                # recursion: the time is already part of this path
+                continue
+            if child_t >= min_time:
+                todo.append((child, path + (child, ), child_t))
+    return stacks
+
+
+def write_collapsed_stacks(stats, out_path):
+    """Write the stacks of stats in the collapsed format used by flamegraph
+    tools (one "frame;frame;frame count" line per stack, count in us).
+    """
+    stacks = collapsed_stacks(stats)
+    try:
+        with open(out_path, "w") as f:
+            for labels, t in sorted(stacks.items()):
+                us = int(round(t * 1e6))
+                if us > 0:
+                    f.write("{0:s} {1:d}\n".format(";".join(labels), us))
+    except IOError as ex:
+        _log.error(ex)
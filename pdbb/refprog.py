@@ -28,7 +28,9 @@ from pdbb.pdb.parser import (parse_other_ref_remarks, is_bmsqav, parse_dep_date,
                              parse_num_tls_groups, parse_tls_selection,
                              parse_ref_prog, is_tls_residual, is_tls_sum)
 from pdbb.bdb_utils import write_whynot
+from pdbb.branches import hit, recording, replay
 from pdbb.check_beq import check_beq, check_tls_range, report_beq
+from pdbb.timings import NULL_TIMER
 
 
 RE_BEXCEPT = re.compile(r"""
@@ -40,6 +42,21 @@ RE_BEXCEPT = re.compile(r"""
                                 \s+
                              )
                           """, re.VERBOSE)
+RE_BVALUES = re.compile(r"[BU]-?\s*(FACTORS?|VALUES?)")
+RE_U = re.compile(r"""
+                    THE\s+QUANTITY\s+PRESENTED\s+
+                    IN\s+THE\s+TEMPERATURE\s+FACTOR\s+
+                    FIELD\s+IS\s+U\.
+                    """, re.VERBOSE)
+
+# Remediations can have format_version 3.15, 3.20, 3.30
+# and were performed for REFMAC at or before 13 July 2011
+REMEDIATION_FORMATS = [3.15, 3.20, 3.30]
+REMEDIATION_DATE = datetime(2011, 7, 13)
+
+# Memoized decisions of decide_refprog and the branches hit to reach them
+# (see pdbb.branches) by decision_key
+_DECISIONS = {}
 
 
 def is_bdb_includable_refprog(refprog):
@@ -91,38 +108,28 @@ def decide_refprog_restrain(pdb_info):
     if pdb_info["has_anisou"]:
         assert pdb_info["beq_identical"] <= 0.9999
 
-    RE_U = re.compile(r"""
-                        THE\s+QUANTITY\s+PRESENTED\s+
-                        IN\s+THE\s+TEMPERATURE\s+FACTOR\s+
-                        FIELD\s+IS\s+U\.
-                        """, re.VERBOSE)
-
     # Decide
 
     if pdb_info["b_msqav"]:
+        hit("decide_refprog_restrain", "b_msqav")
         useful = True
         msg = "B-factor field contains mean square atomic displacement "\
               "(REMARK 3){}".format(msg)
     elif re.search(RE_U, pdb_info["other_refinement_remarks"]):
         """ e.g. 3cms, 4cms """
+        hit("decide_refprog_restrain", "u")
         msg = "B-factor field contains \"U\" (REMARK 3){}".format(msg)
     elif pdb_info["b_type"] or pdb_info["has_anisou"] or \
             pdb_info["tls_groups"] or pdb_info["tls_residual"] or \
             pdb_info["tls_sum"]:
+        hit("decide_refprog_restrain", "unexpected")
         msg = "Unexpected content cannot (yet) be handled{}".format(msg)
     else:
+        hit("decide_refprog_restrain", "full")
         msg = "Probably full B-factors{}".format(msg)
         useful = True
         assume_iso = True
 
-    # Report
-
-    if not useful:
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.warn("{}.".format(msg))
-    else:
-        _log.info("{}".format(msg))
-
     return useful, assume_iso, req_tlsanl, msg
 
 
@@ -145,7 +152,6 @@ def decide_refprog_remediation(pdb_info):
 
     (useful, assume_iso, req_tlsanl) = (False, False, False)
     msg = ": {}".format(pdb_info["prog_last"][0])
-    remediation = datetime(2011, 7, 13)
 
     # Decide
 
@@ -156,35 +162,33 @@ def decide_refprog_remediation(pdb_info):
         # otherwise inspect first
         if pdb_info["prog_last"][0] == "REFMAC":
             if pdb_info["tls_valid"]:
+                hit("decide_refprog_remediation", "residual", "tls_valid")
                 useful = True
                 msg = "{}{}".format(res_msg, msg)
             else:
                 # TLS residues invalid or absent
+                hit("decide_refprog_remediation", "residual", "tls_invalid")
                 msg = "{}. Invalid TLS residue range{}".format(res_msg, msg)
         else:
+            hit("decide_refprog_remediation", "residual", "not_refmac")
             msg = "{}{}".format(res_msg, msg)
     elif pdb_info["b_type"] == "unverified":
+        hit("decide_refprog_remediation", "unverified")
         msg = "B-factor type could not be determined (wwPDB remediation){}".\
               format(msg)
     elif pdb_info["prog_last"][0] == "REFMAC" and \
-            pdb_info["format_vers"] in [3.15, 3.20, 3.30] and \
-            pdb_info["dep_date"] < remediation:
+            pdb_info["format_vers"] in REMEDIATION_FORMATS and \
+            pdb_info["dep_date"] < REMEDIATION_DATE:
         # The REFMAC entry was found to contain full B-factors
+        hit("decide_refprog_remediation", "full")
         useful = True
         assume_iso = True
         msg = "Full B-factors (wwPDB remediation){}".format(msg)
     else:
+        hit("decide_refprog_remediation", "unexpected")
         msg = "Unexpected B-factor type annotation (wwPDB remediation){}".\
             format(msg)
 
-    # Report
-
-    if not useful:
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.warn("{}.".format(msg))
-    else:
-        _log.info("{}".format(msg))
-
     return useful, assume_iso, req_tlsanl, msg
 
 
@@ -215,6 +219,8 @@ def decide_refprog_tls(pdb_info):
     # Decide
 
     if pdb_info["tls_residual"]:  # Mentioned residual B-factors
+        hit("decide_refprog_tls", "residual", "anisou"
+            if pdb_info["has_anisou"] else "no_anisou")
         if pdb_info["has_anisou"]:
             msg = "TLS group(s), residual B-factors (REMARK 3) "\
                   "and ANISOU records. {}{}".format(bneq_msg, msg)
@@ -227,6 +233,8 @@ def decide_refprog_tls(pdb_info):
                 # useful = True
             req_tlsanl = True
     elif pdb_info["tls_sum"]:  # Mentioned full B-factors
+        hit("decide_refprog_tls", "sum", "anisou"
+            if pdb_info["has_anisou"] else "no_anisou")
         if pdb_info["has_anisou"]:
             # (probably, TLSANL was run)
             msg = "TLS group(s), full B-factors (REMARK 3) "\
@@ -243,11 +251,14 @@ def decide_refprog_tls(pdb_info):
             # else: # inspect first
                 # useful = True
     elif re.search(RE_BEXCEPT, pdb_info["other_refinement_remarks"]) and \
-            re.search("[BU]-?\s*(FACTORS?|VALUES?)",
+            re.search(RE_BVALUES,
                       pdb_info["other_refinement_remarks"]):  # any exceptions?
+        hit("decide_refprog_tls", "unrecognized")
         msg = "TLS group(s) and, possibly, residual or full B-factors "\
               "(REMARK 3, unrecognized format){}".format(msg)
     else:  # TLS refinement without hints about B-value type
+        hit("decide_refprog_tls", "no_details", "anisou"
+            if pdb_info["has_anisou"] else "no_anisou")
         if pdb_info["has_anisou"]:
             """ REFMAC: e.g. 1oj7, 1pm7, 2gcl, 3c2s, 3l6r, 3o1a """
             msg = "TLS group(s), no B-factor type details (REMARK 3). {}{}".\
@@ -257,14 +268,6 @@ def decide_refprog_tls(pdb_info):
             msg = "TLS group(s), no B-factor type details (REMARK 3) "\
                   "and no ANISOU records{}".format(msg)
 
-    # Report
-
-    if not useful:
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.warn("{}.".format(msg))
-    else:
-        _log.info("{}".format(msg))
-
     return useful, assume_iso, req_tlsanl, msg
 
 
@@ -305,6 +308,7 @@ def decide_refprog_notls(pdb_info):
             msg = "{}. {}".format(msg, bneq_msg)
 
         if pdb_info["tls_sum"]:
+            hit("decide_refprog_notls", "tls_remark", "sum")
             assume_iso = True
             msg = "{}. Full B-factors (REMARK 3)".format(msg)
             if pdb_info["prog_last"][0] == "REFMAC":
@@ -312,55 +316,109 @@ def decide_refprog_notls(pdb_info):
             # else: # inspect first
                 # useful = True
         elif pdb_info["tls_residual"]:
+            hit("decide_refprog_notls", "tls_remark", "residual")
             req_tlsanl = True
             msg = "{}. Residual B-factors (REMARK 3)".format(msg)
             if pdb_info["prog_last"][0] == "REFMAC":
                 useful = True
+        else:
+            hit("decide_refprog_notls", "tls_remark", "no_details")
     elif pdb_info["tls_residual"]:
         """ REFMAC: e.g. 3ch0, 2pq7, 3h3z """
+        hit("decide_refprog_notls", "residual")
         msg = "Residual B-factors without TLS group(s) (REMARK 3)"
         if pdb_info["has_anisou"]:
             msg = "{}. {}".format(msg, bneq_msg)
     elif pdb_info["tls_sum"]:
+        hit("decide_refprog_notls", "sum")
         msg = "Full B-factors without TLS group(s) (REMARK 3)"
         if pdb_info["has_anisou"]:
             msg = "{}. {}".format(msg, bneq_msg)
     elif re.search(RE_BEXCEPT, pdb_info["other_refinement_remarks"]) and \
-            re.search("[BU]-?\s*(FACTORS?|VALUES?)",
+            re.search(RE_BVALUES,
                       pdb_info["other_refinement_remarks"]):  # any exceptions?
+        hit("decide_refprog_notls", "unrecognized")
         msg = "Possibly, residual or full B-factors (REMARK 3, unrecognized"\
               " format). No TLS groups"
         if pdb_info["has_anisou"]:
             msg = "{}. {}".format(msg, bneq_msg)
     elif pdb_info["has_anisou"]:
+        hit("decide_refprog_notls", "anisou")
         msg = "Probably full/mixed anisotropic refinement. {}".format(bneq_msg)
     else:
         # Probably refinement without any type of
         # anisotopic displacement parameters
+        hit("decide_refprog_notls", "full")
         useful = True
         assume_iso = True
         msg = "Probably full B-factors"
     # Append program
     msg = "{}{}".format(msg, rp_msg)
 
-    # Report
+    return useful, assume_iso, req_tlsanl, msg
+
+
+def decision_key(pdb_info):
+    """Return the canonical tuple of the features of pdb_info that
+    decide_refprog depends on.
 
+    Entries with the same key get the same decision. Return None if a
+    feature is missing from pdb_info.
+    """
+    try:
+        orr = pdb_info["other_refinement_remarks"] or ""
+        remediation_format = pdb_info["format_vers"] in REMEDIATION_FORMATS
+        return (tuple(pdb_info["prog_last"]),
+                bool(pdb_info["has_anisou"]),
+                bool(pdb_info["b_msqav"]),
+                pdb_info["b_type"],
+                bool(pdb_info["tls_groups"]),
+                bool(pdb_info["tls_valid"]),
+                bool(pdb_info["tls_residual"]),
+                bool(pdb_info["tls_sum"]),
+                remediation_format,
+                remediation_format and
+                pdb_info["dep_date"] < REMEDIATION_DATE,
+                RE_U.search(orr) is not None,
+                RE_BEXCEPT.search(orr) is not None and
+                RE_BVALUES.search(orr) is not None,
+                "TLS" in orr)
+    except KeyError:
+        return None
+
+
+def clear_decisions():
+    """Forget the memoized decisions of decide_refprog."""
+    _DECISIONS.clear()
+
+
+def report_decision(pdb_id, useful, msg, error=False):
+    """Log the decision about an entry and write the WHY NOT file if it is
+    not useful."""
     if not useful:
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.warn("{}.".format(msg))
+        write_whynot(pdb_id, msg)
+        if error:
+            _log.error("{}.".format(msg))
+        else:
+            _log.warn("{}.".format(msg))
     else:
         _log.info("{}".format(msg))
 
-    return useful, assume_iso, req_tlsanl, msg
-
 
-def decide_refprog(pdb_info):
+def decide_refprog(pdb_info, report=True):
     """Determine whether refinement program can be used in the bdb project.
 
     The decision is based on the refinement program interpreted from the
     PDB file. Furthermore, several remarks and details in the
     header are used.
 
+    The decisions are memoized by decision_key, as the deciders do not write
+    or log anything themselves. The branches hit by the deciders are
+    memoized too and hit again on every use of a decision, so that the
+    branch counts (see pdbb.branches) do not depend on the memo. If report
+    is True, the decision is logged and the WHY NOT file written (see
+    report_decision).
+
     WARNING: this code assumes the Beq values from ANISOU records are not
              identical to the reported corresponding B-factors
 
@@ -379,75 +437,98 @@ def decide_refprog(pdb_info):
     if pdb_info["has_anisou"]:
         assert pdb_info["beq_identical"] <= 0.9999
 
+    if len(pdb_info["prog_last"]) == 1:
+        assert isinstance(pdb_info["prog_last"][0], str)
+        if report:
+            _log.info("Interpreted last-used refinement program: {}.".format(
+                pdb_info["prog_last"][0]))
+
+        # The orr may have to be searched (also on memoized decisions, as it
+        # is returned by get_refi_data)
+        if is_bdb_includable_refprog(pdb_info["prog_last"][0]) and \
+                pdb_info["other_refinement_remarks"] is None:
+            pdb_info["other_refinement_remarks"] = ""
+
+    key = decision_key(pdb_info)
+    memo = _DECISIONS.get(key) if key is not None else None
+    if memo is None:
+        hit("decide_refprog", "memo", "miss" if key is not None else "no_key")
+        with recording() as branches:
+            decision = _decide_refprog(pdb_info)
+        if key is not None:
+            _DECISIONS[key] = (decision, branches)
+    else:
+        hit("decide_refprog", "memo", "hit")
+        decision, branches = memo
+        replay(branches)
+    if report:
+        report_decision(pdb_info["pdb_id"], decision[0], decision[3],
+                        error=len(pdb_info["prog_last"]) == 0)
+    return decision
+
+
+def _decide_refprog(pdb_info):
+    """Return the decision of decide_refprog."""
+
     # There must be only a single refinement program. If not, return False for
     # all values in the return tuple.
     if len(pdb_info["prog_last"]) > 1:
+        hit("decide_refprog", "combination")
         refprog = [str(p) for p in pdb_info["prog_last"]]
         msg = "Combination of refinement programs cannot (yet) be "\
               "included in the bdb: {}".format(" and ".join(refprog))
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.warn("{}.".format(msg))
         return False, False, False, msg
     elif len(pdb_info["prog_last"]) == 0:
         """ e.g. 3cw1 """
+        hit("decide_refprog", "uninterpreted")
         msg = "Program(s) in REMARK 3 not interpreted as refinement "\
               "program(s)"
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.error("{}.".format(msg))
         return False, False, False, msg
 
-    assert isinstance(pdb_info["prog_last"][0], str)
-    _log.info("Interpreted last-used refinement program: {}.".format(
-        pdb_info["prog_last"][0]))
-
     msg = ": {}".format(pdb_info["prog_last"][0])
 
     # Check if the refinement program is supported. If not, return False for
     # all values in return tuple.
     if not is_bdb_includable_refprog(pdb_info["prog_last"][0]):
+        hit("decide_refprog", "not_includable")
         msg = "Program cannot (yet) be included{}".format(msg)
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.warn("{}.".format(msg))
         return False, False, False, msg
 
-    # The orr may have to be searched
-    if pdb_info["other_refinement_remarks"] is None:
-        pdb_info["other_refinement_remarks"] = ""
-
     # Start deciding
 
     # Special treatment for RESTRAIN files
     if pdb_info["prog_last"][0] == "RESTRAIN" or \
             (pdb_info["prog_last"][0] == "PROLSQ" and pdb_info["b_msqav"]):
+        hit("decide_refprog", "restrain")
         return decide_refprog_restrain(pdb_info)
 
     # REFMAC and other refprogs:
 
     # We trust the wwPDB remediation decision
-    # Remediations can have format_version 3.15, 3.20, 3.30
-    # and were performed for REFMAC at or before 13 July 2011
-    remediation = datetime(2011, 7, 13)
-    if (pdb_info["format_vers"] in [3.15, 3.20, 3.30] and
+    if (pdb_info["format_vers"] in REMEDIATION_FORMATS and
         pdb_info["prog_last"][0] == "REFMAC" and
-        pdb_info["dep_date"] < remediation) \
+        pdb_info["dep_date"] < REMEDIATION_DATE) \
             or pdb_info["b_type"]:
+        hit("decide_refprog", "remediation")
         return decide_refprog_remediation(pdb_info)
 
     # B-factors cannot be residual and full at the same time
     if pdb_info["tls_residual"] and pdb_info["tls_sum"]:
+        hit("decide_refprog", "residual_and_full")
         msg = "Residual and full B-factors (REMARK 3){}".format(msg)
-        write_whynot(pdb_info["pdb_id"], msg)
-        _log.warn("{}.".format(msg))
         return False, False, False, msg
 
     # TLS groups defined in the PDB file..
     if pdb_info["tls_groups"]:
+        hit("decide_refprog", "tls")
         return decide_refprog_tls(pdb_info)
     else:  # ..or not (?)
+        hit("decide_refprog", "notls")
         return decide_refprog_notls(pdb_info)
 
 
-def except_refprog_warn():
+def except_refprog_warn(refprog=None):
+    hit("parse_refprog", "exception", refprog)
     message = "Pre-defined exceptional refinement program case found"
     _log.warn("{}.".format(message))
 
@@ -493,7 +574,13 @@ def filter_progs(pin, pv):
     return pin, pv
 
 
-def get_refi_data(pdb_records, structure, pdb_id):
+# Fields of get_refi_data that are decided from the other fields
+DECISION_FIELDS = ("assume_iso", "decision", "is_bdb_includable", "prog_inter",
+                   "prog_last", "prog_vers", "ref_prog", "req_tlsanl")
+
+
+def get_refi_data(pdb_records, structure, pdb_id, stage_timer=NULL_TIMER,
+                  chain_analysis=None):
     """Determine whether this PDB file can be used in the bdb project.
 
     The decision is based on refinement details parsed from the header.
@@ -503,6 +590,11 @@ def get_refi_data(pdb_records, structure, pdb_id):
     Warning: it is assumed that B-factors are full and isotropic if they can be
     reproduced from Beq values.
 
+    The check_beq and parse_refprog stages are recorded in stage_timer.
+
+    If a pdbb.streaming.ChainAnalysis is given, the Beq values and TLS
+    residue ranges are taken from it and structure is not used.
+
     Return a dict containing refinement and decision info.
     "assume_iso"   : whether the PDB file should be assumed to have
                      total isotropic B-factors
@@ -544,9 +636,20 @@ def get_refi_data(pdb_records, structure, pdb_id):
     "tls_sum"      : True if it is mentioned somewhere in REMARK 3 that the
                      ATOM records contain the sum of TLS and residual B-factors
     """
-    is_bdb_includable = False
-    assume_iso = False
-    message = None
+    return decide_refi_data(
+        extract_refi_features(pdb_records, structure, pdb_id, stage_timer,
+                              chain_analysis),
+        stage_timer)
+
+
+def extract_refi_features(pdb_records, structure, pdb_id,
+                          stage_timer=NULL_TIMER, chain_analysis=None):
+    """Return the refinement details of this PDB file that the decisions of
+    get_refi_data are based on.
+
+    The features are the fields of get_refi_data except DECISION_FIELDS.
+    They depend on the PDB file only (see decide_refi_data).
+    """
     _log.debug("Parsing refinement program...")
 
     # Parse the pdb records for refinement data
@@ -557,7 +660,9 @@ def get_refi_data(pdb_records, structure, pdb_id):
     tls_selections = parse_tls_selection(pdb_records)
     tls_valid = None
     if len(tls_selections) > 0:
-        tls_valid = check_tls_range(structure, tls_selections)
+        tls_valid = chain_analysis.check_tls_range(tls_selections) \
+            if chain_analysis is not None else \
+            check_tls_range(structure, tls_selections)
 
     pdb_info = {
         "pdb_id": pdb_id,
@@ -574,21 +679,44 @@ def get_refi_data(pdb_records, structure, pdb_id):
         "tls_residual": is_tls_residual(pdb_records),
         "tls_sum": is_tls_sum(pdb_records)}
 
-    _log.debug("Interpreting PDB file...")
-
     # For entries that have ANISOU records..
     reproduced = {"beq_identical": None, "correct_uij": None}
     if pdb_info["has_anisou"]:
-        reproduced = check_beq(structure)
+        with stage_timer.stage("check_beq"):
+            reproduced = chain_analysis.beq() \
+                if chain_analysis is not None else check_beq(structure)
         report_beq(reproduced)
-        # ..we assume we can save time
-        if reproduced["beq_identical"] > 0.9999:
-            is_bdb_includable = True
-            assume_iso = True
-            message = "Assuming full isotropic B-factors because enough "\
-                      "B-factors could be reproduced from the ANISOU records"
-            _log.info(message)
     pdb_info.update(reproduced)
+    return pdb_info
+
+
+def decide_refi_data(features, stage_timer=NULL_TIMER, report=True):
+    """Decide whether the PDB file with these features (see
+    extract_refi_features) can be used in the bdb project.
+
+    The parse_refprog stage is recorded in stage_timer. If report is False,
+    the decisions are neither logged nor written to WHY NOT files.
+
+    Return a new dict with the features and the DECISION_FIELDS (see
+    get_refi_data).
+    """
+    pdb_info = dict(features)
+    pdb_id = pdb_info["pdb_id"]
+    is_bdb_includable = False
+    assume_iso = False
+    message = None
+
+    _log.debug("Interpreting PDB file...")
+
+    # For entries that have ANISOU records, we assume we can save time
+    if pdb_info["has_anisou"] and pdb_info["beq_identical"] > 0.9999:
+        hit("decide_refi_data", "beq_identical")
+        is_bdb_includable = True
+        assume_iso = True
+        message = "Assuming full isotropic B-factors because enough "\
+                  "B-factors could be reproduced from the ANISOU records"
+        if report:
+            _log.info(message)
 
     prog = pdb_info["refprog"]
     prog_inter = None
@@ -598,7 +726,8 @@ def get_refi_data(pdb_records, structure, pdb_id):
     # Programs mentioned in REMARK 3
     if prog:
         # Interpret refinement program(s)
-        prog, prog_inter, version = parse_refprog(prog)
+        with stage_timer.stage("parse_refprog"):
+            prog, prog_inter, version = parse_refprog(prog)
         # Decide the final structure's most likely refprog signature
         prog_last = last_used(prog_inter, version)
         pdb_info.update({"prog_inter": prog_inter,
@@ -615,21 +744,27 @@ def get_refi_data(pdb_records, structure, pdb_id):
             if not assume_iso:
                 # interpret refinement data
                 is_bdb_includable, assume_iso, req_tlsanl, message = \
-                    decide_refprog(pdb_info)
+                    decide_refprog(pdb_info, report=report)
             else:
-                _log.info("Probably full B-factors: {}".format(
-                    " and ".join(prog_last)))
+                hit("decide_refi_data", "assume_iso")
+                if report:
+                    _log.info("Probably full B-factors: {}".format(
+                        " and ".join(prog_last)))
         else:
             # we should not end up here under normal circumstances
+            hit("decide_refi_data", "parse_error")
             message = "Refinement program parse error"
-            write_whynot(pdb_id, message)
-            _log.error("{}.".format(message))
+            if report:
+                report_decision(pdb_id, False, message, error=True)
     else:
+        hit("decide_refi_data", "no_refprog")
         msg = "No refinement program found"
-        _log.warn("{}.".format(msg))
+        if report:
+            _log.warn("{}.".format(msg))
         if not assume_iso:
             message = msg
-            write_whynot(pdb_id, message)
+            if report:
+                write_whynot(pdb_id, message)
 
     more_refprog = {"assume_iso": assume_iso,
                     "decision": message,
@@ -680,14 +815,17 @@ def last_used(pin, pv):
         """
         shelx = pin.index("SHELX")
         if not re.search("[LH]", pv[shelx]):
+            hit("last_used", "shelx", "phasing")
             pin = pin[:shelx] + pin[(shelx + 1):]
         else:
+            hit("last_used", "shelx", "refinement")
             return ["SHELX"]
     if "CORELS" in pin and len(pin) > 1:
         """
         If CORELS has been used, it has probably been used first, unless
         it is the only program
         """
+        hit("last_used", "corels")
         corels = pin.index("CORELS")
         pin = pin[:corels] + pin[(corels + 1):]
     # Decide about some (sub)combinations
@@ -719,7 +857,11 @@ def last_used(pin, pv):
         ("X-PLOR", "TNT"),
         ]
     for combi in known_combis:
+        n = len(pin)
         pin = one_of_the_two(pin, loser=combi[0], winner=combi[1])
+        if len(pin) < n:
+            hit("last_used", "combination", *combi)
+    hit("last_used", "programs", len(pin))
     return pin
 
 
@@ -778,85 +920,85 @@ def parse_refprog(refprog):
     # Exceptions
     if refprog == "NULL" or refprog == "NONE" or \
             refprog == "NO REFINEMENT":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return ([None], [None], [None])
     elif refprog == "X-PLOR 3.1 AND 3.85":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["X-PLOR 3.85"], ["X-PLOR"], ["3.85"])
     elif refprog == "X-PLOR 3.1, 3.816":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["X-PLOR 3.816"], ["X-PLOR"], ["3.816"])
     elif refprog == "CNS 1.1 & 1.3":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["CNS 1.3"], ["CNS"], ["1.3"])
     elif refprog == "CNS 0.4, O, OOPS":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["CNS 0.4", "O", "OOPS"],
                 ["CNS", "O", "OOPS"],
                 ["0.4", "-", "-"])
     elif refprog == "CNS 0.1-0.4":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["CNS 0.4"], ["CNS"], ["0.4"])
     elif refprog == "CNS 0.9,1.0,1.1":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["CNS 1.1"], ["CNS"], ["1.1"])
     elif refprog == "CNS 1.3 WITH DEN REFINEMENT":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["CNS 1.3"], ["CNS"], ["1.3"])
     elif refprog == "CNS 1.2 (USING XTAL_TWIN UTILITIES)":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["CNS 1.2"], ["CNS"], ["1.2"])
     elif refprog == "PHENIX.REFINE_REFMAC 5.5.0070":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["PHENIX.REFINE", "REFMAC 5.5.0070"],
                 ["PHENIX.REFINE", "REFMAC"],
                 ["-", "5.5.0070"])
     elif refprog == "PHENIX (CCI APPS 2007_04_06_1210)":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["PHENIX (PHENIX.REFINE: 2007_04_06_1210)"], ["PHENIX.REFINE"],
                 ["2007_04_06_1210"])
     elif refprog == "PHENIX VERSION 1.8_1069 (PHENIX.REFINE)":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["PHENIX (PHENIX.REFINE: 1.8_1069)"], ["PHENIX.REFINE"],
                 ["1.8_1069"])
     elif refprog == "PHENIX 1.6.2_432 - REFINE":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["PHENIX (PHENIX.REFINE: 1.6.2_432)"], ["PHENIX.REFINE"],
                 ["1.6.2_432"])
     elif refprog == "PHENIX REFINE" or refprog == "PHENIX, REFINE" or \
             refprog == "PHENIX AUTOREFINE":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["PHENIX.REFINE"], ["PHENIX.REFINE"], ["-"])
     elif refprog == "REFMAC 5.1.24/TLS":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["REFMAC 5.1.24"], ["REFMAC"], ["5.1.24"])
     elif refprog == "REFMAC 5.2.0005 24/04/2001":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["REFMAC 5.2.0005"], ["REFMAC"], ["5.2.0005"])
     elif refprog == "REFMAC 5.2.0019 24/04/2001":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["REFMAC 5.2.0019"], ["REFMAC"], ["5.2.0019"])
     elif refprog == "REFMAC X-PLOR 3.843":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["REFMAC", "X-PLOR 3.843"],
                 ["REFMAC", "X-PLOR"],
                 ["-", "3.843"])
     elif refprog == "REFMAC5 5.2.0019":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["REFMAC 5.2.0019"], ["REFMAC"], ["5.2.0019"])
     elif refprog == "REFMAC 5.5.0109 (AND PHENIX)":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["REFMAC 5.5.0109", "PHENIX.REFINE"],
                 ["REFMAC", "PHENIX.REFINE"],
                 ["5.5.0109", "-"])
     elif refprog == "BUSTER, BETA VERSION":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["BUSTER BETA"], ["BUSTER"], ["BETA"])
     elif refprog == "TNT BUSTER/TNT":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["TNT", "BUSTER/TNT"], ["TNT", "BUSTER"], ["-", "-"])
     elif refprog == "O, VERSION 9.0.7":
-        except_refprog_warn()
+        except_refprog_warn(refprog)
         return (["O 9.0.7"], ["O"], ["9.0.7"])
     prog_pat = re.compile(r"""
         ,
@@ -1327,6 +1469,8 @@ def parse_refprog(refprog):
                 prog_inter[i] = "OTHER"
                 vers[i] = "np"
         # Report
+        hit("parse_refprog", "program", prog_inter[i],
+            vers[i] if vers[i] in (None, "-", "np") else "version")
         if prog_inter[i] == "OTHER":
             _log.warn("{}: program {} could not (yet) be parsed.".format(
                 prog_inter[i], p))
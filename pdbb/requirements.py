@@ -17,13 +17,14 @@
 import logging
 _log = logging.getLogger(__name__)
 
+import pyconfig
 import subprocess
 import sys
 
 
-# CCP4 dependencies
+# CCP4 dependencies (pyconfig keys of the commands)
 ccp4_software = [
-    "tlsanl", ]
+    "TLSANL_CMD", ]
 
 # Other dependencies
 # None
@@ -39,10 +40,12 @@ def check_ccp4():
         program exists) before an OSError (raised if the program cannot be
         called), after our attempt to call the program with an invalid argument.
     """
-    for p in ccp4_software:
+    for key in ccp4_software:
+        cmd = pyconfig.get(key)
+        p = " ".join(cmd)
         try:
-            p = subprocess.check_call(
-                [p, "and_an_invalid_argument"],
+            subprocess.check_call(
+                cmd + ["and_an_invalid_argument"],
                 stdin=subprocess.PIPE,   # suppress output
                 stdout=subprocess.PIPE,  # suppress output
                 stderr=subprocess.PIPE)  # suppress output
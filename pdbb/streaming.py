@@ -0,0 +1,497 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+"""Analysis of the coordinate section from atom tables, per chain.
+
+A ChainAnalysis keeps only per-chain counts, a sample of residues, the
+segments of constant B-factor of the chains that can still be overall and,
+for the TLS residue ranges, one small row per residue. Its results are
+those of check_beq, determine_b_group, determine_b_group_chains,
+determine_b_segments, check_tls_range, check_tls_ranges and
+tls_group_stats, without a Biopython structure.
+
+analyze_atoms adds the atom table of a whole entry (pdbb.pdb.atoms) at
+once. analyze_chains bounds the memory instead: the coordinate records are
+split into blocks of consecutive records of one chain (iter_chain_blocks)
+and every block is read into a small atom table, so that peak memory is
+bounded by the largest chain instead of the whole entry.
+"""
+from __future__ import division
+
+import logging
+_log = logging.getLogger(__name__)
+
+import itertools
+
+from collections import OrderedDict
+
+from pdbb.check_beq import (AMINO_ACID_BACKBONE, BACKBONE_BITS,
+                            SUGAR_PHOSPHATE_BACKBONE, _group_by_chain,
+                            _useful_residues, b_group_from_votes,
+                            b_group_votes, b_segment_runs,
+                            merge_b_group_votes, overall_from_segments,
+                            segment_list)
+from pdbb.pdb.atoms import atom_table, first_model
+from pdbb.pdb.files import open_pdb_file
+from pdbb.tls import (WATERS, check_tls_ranges, compile_tls_groups,
+                      merge_tls_group_sums, residue_index, tls_group_masks,
+                      tls_group_sums, tls_stats_from_sums)
+
+
+def iter_chain_blocks(lines):
+    """Yield (model, lines) for the blocks of coordinate records.
+
+    A block is a run of ATOM, HETATM and ANISOU records of one chain. Blocks
+    end at a chain change, TER and ENDMDL. Models are numbered from 0 in
+    file order, as by Biopython.
+    """
+    model = 0
+    block = []
+    chain = None
+    for line in lines:
+        record = line[0:6]
+        if record == "ATOM  " or record == "HETATM":
+            if block and line[21] != chain:
+                yield model, block
+                block = []
+            chain = line[21]
+            block.append(line)
+        elif record == "ANISOU":
+            if block:
+                block.append(line)
+        elif record == "TER   " or record.rstrip() == "TER" or \
+                record == "ENDMDL":
+            if block:
+                yield model, block
+                block = []
+            if record == "ENDMDL":
+                model += 1
+    if block:
+        yield model, block
+
+
+def _residue_starts(atoms):
+    """Return the first row of every residue in atoms."""
+    import numpy as np
+
+    new_res = np.ones(len(atoms), dtype=bool)
+    new_res[1:] = (atoms["chain"][1:] != atoms["chain"][:-1]) | \
+        (atoms["resseq"][1:] != atoms["resseq"][:-1]) | \
+        (atoms["icode"][1:] != atoms["icode"][:-1]) | \
+        (atoms["hetero"][1:] != atoms["hetero"][:-1])
+    return np.flatnonzero(new_res)
+
+
+def _beq_counts(atoms):
+    """Return the numbers of atoms with ANISOU records of which the B-factor
+    is reproduced by the standard and by another combination of Uij values,
+    and the number of atoms of which it is not (see check_beq)."""
+    import numpy as np
+
+    margin = 0.015
+    has = atoms["has_anisou"]
+    if not has.any():
+        return 0, 0, 0
+    b = atoms["bfactor"][has]
+    # Uij as by Bio.PDB: single precision
+    u = np.rint(atoms["anisou"][has] * 10000).astype("f") / np.float32(10000)
+    u_sum = (u[:, 0].astype("f8") + u[:, 1]) + u[:, 2]
+    std = np.isclose(b, 8 * np.pi ** 2 * u_sum / 3, atol=margin)
+    other = np.zeros(len(b), dtype=bool)
+    for c in itertools.combinations(range(6), 3):
+        c_sum = ((u[:, c[0]] + u[:, c[1]]) + u[:, c[2]]).astype("f8")
+        other |= np.isclose(b, 8 * np.pi ** 2 * c_sum / 3, atol=margin)
+    other &= ~std
+    n_std = np.count_nonzero(std)
+    n_other = np.count_nonzero(other)
+    return n_std, n_other, len(b) - n_std - n_other
+
+
+def _chain_groups(atoms):
+    """Yield (model, chain ID, rows) for the chains of every model in the
+    atom table, in order of appearance. The rows of a chain that is split
+    into blocks are taken together, in file order."""
+    import numpy as np
+
+    if len(atoms) == 0:
+        return
+    key = atoms["model"].astype(np.int64) << 8 | \
+        atoms["chain"].view(np.uint8)
+    rows = np.arange(len(atoms))
+    order = _group_by_chain(rows, key)
+    if order is not rows:
+        atoms = atoms[order]
+        key = key[order]
+    bounds = np.append(np.flatnonzero(key[1:] != key[:-1]) + 1, len(atoms))
+    start = 0
+    for end in bounds:
+        yield int(atoms["model"][start]), str(atoms["chain"][start]), \
+            atoms[start:end]
+        start = end
+
+
+# Fields of the residues kept for the TLS residue ranges (see residue_index)
+RESIDUE_FIELDS = ("model", "chain", "resseq", "icode", "resname",
+                  "hetero")
+
+
+class ChainAnalysis(object):
+    """Accumulate the analysis of an entry from atom tables of its parts.
+
+    Use as
+        analysis = ChainAnalysis(tls_groups, tls_selections, pdb_file)
+        for model, lines in iter_chain_blocks(pdb_file):
+            analysis.add_block(model, atom_table(lines))
+        analysis.beq()
+    or add the atom table of the whole entry with add_atoms.
+
+    The Beq values and chain types are taken from all models, as by
+    check_beq and determine_b_group on a Biopython structure; the per-chain
+    B-factor groups, segments and TLS groups from the first model only (see
+    pdbb.pdb.atoms.first_model). TLS residue ranges that span chains only
+    include the chains that precede the block.
+
+    Only counts are kept per chain, and the segments of constant B-factor
+    of the chains that can still be overall (see overall_from_segments).
+    If a chain that was not becomes overall in a later block, its segments
+    are found again from source (the PDB file). One row per residue is kept
+    for the TLS residue ranges, only if there are tls_selections.
+    """
+
+    def __init__(self, tls_groups=None, tls_selections=None, source=None):
+        self.n_beq = [0, 0, 0]  # standard, other combination, not
+        self.chains = OrderedDict()  # (model, chain): chain type state
+        self.chain_ids = []  # first model, in order of appearance
+        self.votes = {}
+        self.segments = {}  # chain: segments state
+        self.segment_refs = {}  # chain: B-factor of the last segment
+        self.residues = [] if tls_selections else None
+        self.tls = compile_tls_groups(tls_groups or [])
+        self.tls_sums = None
+        self.source = source
+
+    def add_block(self, model, atoms):
+        """Add the atom table of a block of one chain of this model."""
+        atoms["model"] = model
+        self.add_atoms(atoms)
+
+    def add_atoms(self, atoms):
+        """Add an atom table of any chains and models (see
+        pdbb.pdb.atoms.atom_table), following the parts added before."""
+        if len(atoms) == 0:
+            return
+        for i, n in enumerate(_beq_counts(atoms)):
+            self.n_beq[i] += n
+        for model, chain_id, rows in _chain_groups(atoms):
+            self._add_chain_type(model, chain_id, rows)
+        atoms = first_model(atoms)
+        if len(atoms) > 0:
+            self._add_first_model(atoms)
+
+    def _add_chain_type(self, model, chain_id, atoms):
+        import numpy as np
+
+        check_max = 10
+        state = self.chains.get((model, chain_id))
+        if state is None:
+            state = self.chains[(model, chain_id)] = {
+                "chain_id": chain_id, "protein": True, "nucleic": True,
+                "protein_checked": 0, "nucleic_checked": 0, "residues": 0,
+                "atoms": 0, "ca": 0, "p": 0, "sample": [],
+                "sample_residues": 0}
+        state["atoms"] += len(atoms)
+        state["ca"] += np.count_nonzero(atoms["name"] == b"CA")
+        state["p"] += np.count_nonzero(atoms["name"] == b"P")
+
+        # Backbone bitmaps of the first residues (see classify_chain)
+        starts = _residue_starts(atoms)
+        ends = np.append(starts[1:], len(atoms))
+        for i, (start, end) in enumerate(itertools.izip(starts, ends),
+                                         state["residues"]):
+            check_protein = state["protein"] and \
+                state["protein_checked"] < check_max
+            check_nucleic = state["nucleic"] and \
+                state["nucleic_checked"] < check_max
+            if not check_protein and not check_nucleic:
+                break
+            if atoms["hetero"][start]:  # Exclude HETATM and waters
+                continue
+            # The first residue does not contain the phosphate
+            check_nucleic = check_nucleic and i > 0
+            bits = 0
+            for name in atoms["name"][start:end]:
+                bits |= BACKBONE_BITS.get(name.decode("ascii"), 0)
+            if check_protein:
+                state["protein"] = \
+                    bits & AMINO_ACID_BACKBONE == AMINO_ACID_BACKBONE
+                state["protein_checked"] += 1
+            if check_nucleic:
+                state["nucleic"] = bits & SUGAR_PHOSPHATE_BACKBONE == \
+                    SUGAR_PHOSPHATE_BACKBONE
+                state["nucleic_checked"] += 1
+        state["residues"] += len(starts)
+
+        # The first 10 useful residues (see determine_b_group_chain)
+        need = 10 - state["sample_residues"]
+        if need > 0:
+            useful, new_res = _useful_residues(atoms)
+            useful_starts = np.flatnonzero(new_res)
+            if len(useful_starts) > need:
+                useful = useful[:useful_starts[need]]
+            state["sample"].append(useful)
+            state["sample_residues"] += min(need, len(useful_starts))
+
+    def _add_first_model(self, atoms):
+        import numpy as np
+
+        chain_ids, first = np.unique(atoms["chain"], return_index=True)
+        for chain_id in chain_ids[np.argsort(first)]:
+            if str(chain_id) not in self.chain_ids:
+                self.chain_ids.append(str(chain_id))
+        for c, votes in b_group_votes(atoms).items():
+            self.votes[c] = merge_b_group_votes(self.votes[c], votes) \
+                if c in self.votes else votes
+        self._add_segments(atoms, self.segments, self.segment_refs,
+                           drop=True)
+        if self.residues is not None:
+            residues = atoms[_residue_starts(atoms)]
+            residues = residues[~np.in1d(residues["resname"], WATERS)]
+            self.residues.append(
+                np.array(residues[list(RESIDUE_FIELDS)], dtype=[
+                    (f, atoms.dtype[f]) for f in RESIDUE_FIELDS]))
+        if self.tls:
+            sums = tls_group_sums(
+                atoms, tls_group_masks(atoms, self.tls, self.chain_ids))
+            self.tls_sums = sums if self.tls_sums is None else \
+                merge_tls_group_sums(self.tls_sums, sums)
+
+    @staticmethod
+    def _add_segments(atoms, segments, refs, drop):
+        """Add the segments of constant B-factor of a part of an entry to
+        the segments states and reference B-factors (see b_segment_runs) of
+        the chains.
+
+        The segments of a chain are dropped if drop is True and the chain
+        is not overall so far.
+        """
+        useful, runs = b_segment_runs(atoms, refs)
+        for c, run in runs.items():
+            state = segments.get(c)
+            if state is None:
+                state = segments[c] = {
+                    "count": 0, "residues": 0,
+                    "b": useful["bfactor"][run["first"][0]],
+                    "segments": []}
+            new = len(run["first"]) - run["continued"]
+            state["count"] += new
+            state["residues"] += run["residues"]
+            if new > 0:
+                refs[c] = useful["bfactor"][run["first"][-1]]
+            if state["segments"] is None:
+                continue
+            if drop and overall_from_segments(
+                    state["count"], state["b"], state["residues"]) is None:
+                state["segments"] = None
+                continue
+            part = segment_list(useful, run)
+            if run["continued"]:
+                last = state["segments"][-1]
+                continued = part.pop(0)
+                last["last"] = continued["last"]
+                last["residues"] += continued["residues"]
+            state["segments"].extend(part)
+
+    def _find_segments(self, chain_ids):
+        """Return the segments states of these chains, from the blocks of
+        the first model of source."""
+        segments = {}
+        refs = {}
+        with open_pdb_file(self.source) as pdb_file:
+            for model, lines in iter_chain_blocks(pdb_file):
+                if model > 0:
+                    break
+                atoms = atom_table(lines)
+                if len(atoms) > 0 and str(atoms["chain"][0]) in chain_ids:
+                    self._add_segments(atoms, segments, refs, drop=False)
+        return segments
+
+    def chain_types(self):
+        """Return a list of (chain ID, type) tuples of the chains of all
+        models (see classify_chain)."""
+        types = []
+        for state in self.chains.values():
+            if state["protein"]:
+                chain_type = "protein"
+            elif state["nucleic"]:
+                chain_type = "nucleic"
+            elif state["ca"] / state["atoms"] >= 0.75:
+                chain_type = "calpha_trace"
+            elif state["p"] / state["atoms"] >= 0.75:
+                chain_type = "phos_trace"
+            else:
+                chain_type = None
+            types.append((state["chain_id"], chain_type))
+        return types
+
+    def beq(self):
+        """Return the result of check_beq."""
+        n_std, n_other, n_not = self.n_beq
+        n = n_std + n_other + n_not
+        if n == 0:
+            return {"beq_identical": None, "correct_uij": None}
+        if n_not > 0:
+            _log.debug("Beq not identical to B-factor in ATOM record for "
+                       "{0:d} atoms".format(n_not))
+        return {"beq_identical": (n_std + n_other) / n,
+                "correct_uij": n_other == 0}
+
+    def _b_group_chain(self, state):
+        import numpy as np
+
+        sample = np.concatenate(state["sample"])
+        votes = b_group_votes(sample)
+        if not votes:
+            return "individual"
+        return b_group_from_votes(votes.values()[0])
+
+    def b_group(self):
+        """Return the result of determine_b_group."""
+        group = {
+            "protein_b": None,
+            "nucleic_b": None,
+            "calpha_only": False,
+            "phos_only": False,
+        }
+        _log.info("Determining most likely B-factor group type")
+        for state, (c, chain_type) in zip(self.chains.values(),
+                                          self.chain_types()):
+            if chain_type in ("protein", "calpha_trace"):
+                if group["protein_b"] is None:
+                    if chain_type == "calpha_trace":
+                        group["calpha_only"] = True
+                        _log.info("Calpha-only chain(s) present")
+                    group["protein_b"] = self._b_group_chain(state)
+            elif chain_type in ("nucleic", "phos_trace"):
+                if group["nucleic_b"] is None:
+                    if chain_type == "phos_trace":
+                        group["phos_only"] = True
+                        _log.info("Backbone phosphorus-only chain(s) "
+                                  "present")
+                    group["nucleic_b"] = self._b_group_chain(state)
+            else:
+                _log.error("Chain {0:s}: no protein or nucleic acid chain "
+                           "found (of sufficient length).".format(c))
+        _log.info("Most likely B-factor group type protein: {0:s} | nucleic "
+                  "acid: {1:s}.".format(
+                      group["protein_b"] if group["protein_b"] is not None else
+                      "not present",
+                      group["nucleic_b"] if group["nucleic_b"] is not None else
+                      "not present",))
+        return group
+
+    def chain_b(self):
+        """Return the result of determine_b_group_chains."""
+        return dict((c, b_group_from_votes(v))
+                    for c, v in self.votes.items())
+
+    def b_segments(self):
+        """Return the result of determine_b_segments."""
+        segments = {"overall_segments": {}, "b_segments": {}}
+        lost = []
+        for c, state in self.segments.items():
+            group = overall_from_segments(state["count"], state["b"],
+                                          state["residues"])
+            segments["overall_segments"][c] = group
+            if group is not None:
+                if state["segments"] is None:
+                    lost.append(c)
+                else:
+                    segments["b_segments"][c] = state["segments"]
+        if lost:
+            _log.debug("Finding the segments of chain(s) {0:s} "
+                       "again".format(", ".join(lost)))
+            for c, state in self._find_segments(lost).items():
+                segments["b_segments"][c] = state["segments"]
+        return segments
+
+    def _residue_table(self):
+        import numpy as np
+
+        if self.residues is None:
+            raise ValueError("No TLS selections were given")
+        if not self.residues:
+            return atom_table([])
+        return np.concatenate(self.residues)
+
+    def check_tls_range(self, tls_selections):
+        """Return the result of check_tls_range."""
+        _log.info("Checking TLS group residues...")
+        residues = self._residue_table()
+        present = set(zip(residues["chain"][~residues["hetero"]],
+                          residues["resseq"][~residues["hetero"]],
+                          residues["icode"][~residues["hetero"]]))
+        for group in tls_selections:
+            first = (group["chain_1"], group["num_1"], group["ic_1"] or "")
+            last = (group["chain_2"], group["num_2"], group["ic_2"] or "")
+            if first not in present or last not in present:
+                _log.error("TLS group not (entirely) in structure:" +
+                           "{} {}{} --- {} {}{}".format(*(first + last)))
+                return False
+        return True
+
+    def tls_ranges(self, tls_selections):
+        """Return the result of check_tls_ranges."""
+        return check_tls_ranges(residue_index(self._residue_table()),
+                                tls_selections)
+
+    def tls_atoms(self):
+        """Return the result of tls_group_stats (None without TLS groups)."""
+        if not self.tls:
+            return None
+        if self.tls_sums is None:
+            self.tls_sums = tls_group_sums(
+                atom_table([]), tls_group_masks(atom_table([]), self.tls))
+        return tls_stats_from_sums(self.tls_sums,
+                                   [g["error"] for g in self.tls])
+
+
+def analyze_chains(pdb_file_path, tls_groups=None, tls_selections=None):
+    """Return the ChainAnalysis of this PDB file.
+
+    tls_groups and tls_selections are as returned by
+    pdbb.pdb.parser.parse_tls_groups and parse_tls_selection.
+    """
+    _log.info("Analyzing the coordinates one chain at a time...")
+    analysis = ChainAnalysis(tls_groups, tls_selections, pdb_file_path)
+    blocks = 0
+    with open_pdb_file(pdb_file_path) as pdb_file:
+        for model, lines in iter_chain_blocks(pdb_file):
+            analysis.add_block(model, atom_table(lines))
+            blocks += 1
+    _log.debug("Analyzed {0:d} chain blocks".format(blocks))
+    return analysis
+
+
+def analyze_atoms(atoms, tls_groups=None, tls_selections=None):
+    """Return the ChainAnalysis of the atom table of a whole entry (see
+    pdbb.pdb.atoms.read_atom_table).
+
+    tls_groups and tls_selections are as for analyze_chains.
+    """
+    _log.info("Analyzing the atom table...")
+    analysis = ChainAnalysis(tls_groups, tls_selections)
+    analysis.add_atoms(atoms)
+    return analysis
@@ -0,0 +1,194 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import logging
+_log = logging.getLogger(__name__)
+
+import gzip
+import json
+import os
+import pyconfig
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from mock import patch
+
+from pdbb.application import create_bdb_entry
+from pdbb.timings import StageTimer
+
+
+# Imported by the functions that need them, never at start-up
+HEAVY_MODULES = ("numpy", "Bio")
+
+# Prints a report in the format of python -X importtime (which is not
+# available on Python 2) to stdout, followed by the top-level names of all
+# modules in sys.modules.
+IMPORT_TIMER = r"""
+import sys
+import time
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+_import = builtins.__import__
+_stack = []
+_report = []
+
+
+def _timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return _import(name, *args, **kwargs)
+    _stack.append(0.0)
+    start = time.time()
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        cumulative = time.time() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += cumulative
+        _report.append((cumulative - children, cumulative, len(_stack), name))
+
+
+builtins.__import__ = _timed_import
+import {module}
+builtins.__import__ = _import
+for self_t, cumulative, depth, name in _report:
+    sys.stdout.write("import time: {{0:>9d}} | {{1:>10d}} | {{2}}{{3}}\n"
+                     .format(int(self_t * 1e6), int(cumulative * 1e6),
+                             "  " * depth, name))
+sys.stdout.write(" ".join(sorted(set(
+    name.split(".")[0] for name in sys.modules))))
+"""
+
+
+def import_time_report(module):
+    """Import the module in a fresh interpreter and time all its imports.
+
+    Return the report lines, a list of (self [us], cumulative [us], name)
+    tuples and the top-level names of all modules in sys.modules afterwards.
+    """
+    out = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_TIMER.format(module=module)])
+    lines = out.decode("ascii").splitlines()
+    report = []
+    for line in lines[:-1]:
+        self_t, cumulative, name = line[len("import time:"):].split("|")
+        report.append((int(self_t), int(cumulative), name.strip()))
+    return lines[:-1], report, lines[-1].split()
+
+
+def test_import_application():
+    """Reports the import times of mkbdb at start-up and tests that numpy
+    and Biopython are not imported."""
+    lines, report, modules = import_time_report("pdbb.application")
+    _log.info("Import times of pdbb.application:\n" + "\n".join(
+        ["import time: self [us] | cumulative | imported package"] + lines))
+    ok_("pdbb.application" in [name for _, _, name in report],
+        "\n".join(lines))
+    ok_("pdbb" in modules)
+    for name in HEAVY_MODULES:
+        ok_(name not in modules, "{0:s} imported".format(name))
+
+
+def run_create_bdb_entry(pdb_id, **kwargs):
+    """Create a bdb entry in a temporary directory.
+
+    Return the return value of create_bdb_entry and the json data.
+    """
+    out_dir = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    pyconfig.set("BDB_FILE_DIR_PATH", out_dir)
+    try:
+        created = create_bdb_entry(
+            "pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id), pdb_id, **kwargs)
+        with open(os.path.join(out_dir, pdb_id + ".json")) as f:
+            bdbd = json.load(f)
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        shutil.rmtree(out_dir)
+    return created, bdbd
+
+
+def test_create_bdb_entry():
+    """Tests that timings are absent if not requested."""
+    created, bdbd = run_create_bdb_entry("1crn")
+    eq_(created, True)
+    eq_(bdbd["assume_iso"], True)
+    eq_(bdbd["chain_b"], {"A": "individual"})
+    eq_(bdbd["overall_segments"], {"A": None})
+    eq_(bdbd["b_segments"], {})
+    eq_(bdbd["tls_ranges"], None)
+    eq_(bdbd["tls_atoms"], None)
+    ok_("timings" not in bdbd)
+
+
+def test_create_bdb_entry_timings():
+    """Tests that stage timings are written to the json file."""
+    timer = StageTimer()
+    created, bdbd = run_create_bdb_entry("1crn", stage_timer=timer)
+    eq_(created, True)
+    eq_(sorted(bdbd["timings"]["stages"].keys()),
+        ["check_tls_ranges", "copy_pdb_file", "determine_b_group",
+         "determine_b_group_chains", "determine_b_segments", "get_refi_data",
+         "get_structure", "parse_pdb_file", "parse_refprog",
+         "read_atom_table", "tls_group_masks"])
+    eq_(bdbd["timings"], timer.report())
+
+
+def test_create_bdb_entry_streaming():
+    """Tests that streaming creates the same json data."""
+    timer = StageTimer()
+    created, bdbd = run_create_bdb_entry("1crn", stage_timer=timer,
+                                         streaming=True)
+    eq_(created, True)
+    eq_(sorted(bdbd["timings"]["stages"].keys()),
+        ["analyze_chains", "copy_pdb_file", "get_refi_data",
+         "parse_pdb_file", "parse_refprog"])
+    del bdbd["timings"]
+    eq_(bdbd, run_create_bdb_entry("1crn")[1])
+
+
+def test_create_bdb_entry_compressed():
+    """Tests that a gzipped PDB file gives the same entry and is
+    decompressed once."""
+    tmp_dir = tempfile.mkdtemp()
+    out_dir = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    pyconfig.set("BDB_FILE_DIR_PATH", out_dir)
+    try:
+        gz = os.path.join(tmp_dir, "pdb1crn.ent.gz")
+        with open("pdbb/tests/pdb/files/1crn.pdb", "rb") as f:
+            data = f.read()
+        with gzip.open(gz, "wb") as f:
+            f.write(data)
+        with patch("pdbb.pdb.files.gzip.open", wraps=gzip.open) as gz_open:
+            eq_(create_bdb_entry(gz, "1crn"), True)
+        eq_(gz_open.call_count, 1)
+        with open(os.path.join(out_dir, "1crn.json")) as f:
+            bdbd = json.load(f)
+        with open(os.path.join(out_dir, "1crn.bdb"), "rb") as f:
+            eq_(f.read(), data)
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        shutil.rmtree(tmp_dir)
+        shutil.rmtree(out_dir)
+    eq_(bdbd, run_create_bdb_entry("1crn")[1])
@@ -0,0 +1,241 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import json
+import os
+import pyconfig
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+
+from pdbb.batch import (Prefetcher, find_pdb_files, find_pdb_sources,
+                        run_batch, run_redecide, tar_members)
+
+
+def test_find_pdb_files():
+    """Tests that PDB files are found in directories and file lists."""
+    found = list(find_pdb_files(["pdbb/tests/pdb/files"]))
+    eq_(len(found), 23)
+    eq_(found[0], ("pdbb/tests/pdb/files/100d.pdb", "100d"))
+
+    found = list(find_pdb_files(["pdbb/tests/pdb/files/1crn.pdb",
+                                 "pdbb/tests/pdb/files/ht.pdb"]))
+    eq_(found, [("pdbb/tests/pdb/files/1crn.pdb", "1crn")])
+
+
+def write_tar(tar_path, pdb_ids):
+    with tarfile.open(tar_path, "w:gz") as tar:
+        for pdb_id in pdb_ids:
+            tar.add("pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id),
+                    "{0:s}/pdb{1:s}.ent".format(pdb_id[1:3], pdb_id))
+        tar.add("pdbb/tests/pdb/files/ht.pdb", "README")
+
+
+def test_tar_members():
+    """Tests that PDB files are read from a tar file as a stream."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tar_path = os.path.join(tmp_dir, "pdb.tar.gz")
+        write_tar(tar_path, ["1crn", "1etu"])
+        members = list(tar_members(tar_path))
+        eq_([m[:2] for m in members],
+            [(os.path.join(tar_path, "cr/pdb1crn.ent"), "1crn"),
+             (os.path.join(tar_path, "et/pdb1etu.ent"), "1etu")])
+        with open("pdbb/tests/pdb/files/1crn.pdb", "rb") as f:
+            eq_(members[0][2], f.read())
+        eq_([m[:2] for m in find_pdb_sources([tar_path, "pdbb/tests/pdb/"
+                                              "files/3cw1.pdb"])],
+            [m[:2] for m in members] +
+            [("pdbb/tests/pdb/files/3cw1.pdb", "3cw1")])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_prefetcher():
+    """Tests that the files are read in order."""
+    pdb_files = [("pdbb/tests/pdb/files/{0:s}.pdb".format(p), p)
+                 for p in ("1crn", "1etu", "3cw1")]
+    prefetched = []
+    prefetcher = Prefetcher(pdb_files, 2, 1024 ** 3)
+    for key, path, pdb_id, data in prefetcher:
+        with open(path, "rb") as f:
+            eq_(data, f.read())
+        prefetched.append((path, pdb_id))
+        prefetcher.release(key)
+    eq_(prefetched, pdb_files)
+
+
+def test_prefetcher_budget():
+    """Tests that a file is only read when the budget allows."""
+    pdb_files = [("pdbb/tests/pdb/files/{0:s}.pdb".format(p), p)
+                 for p in ("1crn", "1etu")]
+    prefetcher = Prefetcher(pdb_files, 2, 1)
+    files = iter(prefetcher)
+    key, _, pdb_id, _ = next(files)
+    eq_(pdb_id, "1crn")
+    start = time.time()
+    threading.Timer(0.2, prefetcher.release, [key]).start()
+    eq_(next(files)[2], "1etu")
+    ok_(time.time() - start >= 0.15)
+
+
+def test_prefetcher_same_pdb_id():
+    """Tests that files with the same PDB ID are held separately."""
+    pdb_files = [("pdbb/tests/pdb/files/1crn.pdb", "1crn")] * 3
+    prefetcher = Prefetcher(pdb_files, 2, 1024 ** 3)
+    files = iter(prefetcher)
+    first = next(files)
+    second = next(files)
+    ok_(first[0] != second[0])
+    # Releasing the first file makes room for one file only
+    prefetcher.release(first[0])
+    next(files)
+    time.sleep(0.2)
+    eq_(len(prefetcher._held), 2)
+
+
+def test_prefetcher_missing_file():
+    """Tests that files that cannot be read are passed on without data."""
+    prefetcher = Prefetcher([("missing/1abc.pdb", "1abc")], 2, 1024)
+    eq_(list(prefetcher), [(0, "missing/1abc.pdb", "1abc", None)])
+
+
+def test_run_batch():
+    """Tests that a batch creates entries and writes the metrics files."""
+    bdb_root = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    try:
+        pdb_files = [("pdbb/tests/pdb/files/{0:s}.pdb".format(p), p)
+                     for p in ("1crn", "1etu", "3cw1")]
+        metrics = run_batch(bdb_root, pdb_files, jobs=2)
+        eq_(metrics.entries, 3)
+        eq_(dict(metrics.outcomes), {"bdb": 1, "whynot": 2})
+        eq_(dict(metrics.whynot), {
+            "No refinement program found": 1,
+            "Program(s) in REMARK 3 not interpreted as refinement "
+            "program(s)": 1})
+        ok_(os.path.isfile(os.path.join(bdb_root, "cr", "1crn", "1crn.bdb")))
+        ok_(os.path.isfile(os.path.join(bdb_root, "cr", "1crn", "1crn.log")))
+        ok_(os.path.isfile(os.path.join(bdb_root, "bdb_metrics.prom")))
+        ok_(os.path.isfile(os.path.join(bdb_root, "bdb_metrics.json")))
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        shutil.rmtree(bdb_root)
+
+
+def test_run_batch_parallel_parse():
+    """Tests that the workers parse large files in parallel."""
+    bdb_root = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    old_min = pyconfig.get("PARALLEL_PARSE_MIN_BYTES")
+    old_jobs = pyconfig.get("PARALLEL_PARSE_JOBS")
+    pyconfig.set("PARALLEL_PARSE_MIN_BYTES", 0)
+    pyconfig.set("PARALLEL_PARSE_JOBS", 2)
+    try:
+        metrics = run_batch(bdb_root, [("pdbb/tests/pdb/files/1crn.pdb",
+                                        "1crn")], jobs=1, verbose=True)
+        eq_(dict(metrics.outcomes), {"bdb": 1})
+        with open(os.path.join(bdb_root, "cr", "1crn", "1crn.log")) as f:
+            ok_("byte ranges in parallel" in f.read())
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        pyconfig.set("PARALLEL_PARSE_MIN_BYTES", old_min)
+        pyconfig.set("PARALLEL_PARSE_JOBS", old_jobs)
+        shutil.rmtree(bdb_root)
+
+
+def test_run_batch_tar():
+    """Tests that the entries of a tar file are created."""
+    bdb_root = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    old_prefetch = pyconfig.get("PREFETCH_FILES")
+    try:
+        tar_path = os.path.join(bdb_root, "pdb.tar.gz")
+        write_tar(tar_path, ["1crn", "1etu", "3cw1"])
+        for prefetch in (None, 0):
+            pyconfig.set("PREFETCH_FILES", prefetch)
+            metrics = run_batch(bdb_root, find_pdb_sources([tar_path]),
+                                jobs=2)
+            eq_(metrics.entries, 3)
+            eq_(dict(metrics.outcomes), {"bdb": 1, "whynot": 2})
+            ok_(os.path.isfile(os.path.join(bdb_root, "cr", "1crn",
+                                            "1crn.bdb")))
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        pyconfig.set("PREFETCH_FILES", old_prefetch)
+        shutil.rmtree(bdb_root)
+
+
+def test_run_batch_profile():
+    """Tests that per-entry and aggregate profiles are written."""
+    bdb_root = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    try:
+        pdb_files = [("pdbb/tests/pdb/files/{0:s}.pdb".format(p), p)
+                     for p in ("1crn", "1etu")]
+        run_batch(bdb_root, pdb_files, jobs=2, profile=True)
+        ok_(os.path.isfile(os.path.join(bdb_root, "cr", "1crn",
+                                        "1crn.pstats")))
+        ok_(os.path.isfile(os.path.join(bdb_root, "bdb_profile.pstats")))
+        with open(os.path.join(bdb_root, "bdb_profile.collapsed")) as f:
+            ok_("(create_bdb_entry)" in f.read())
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        shutil.rmtree(bdb_root)
+
+
+def test_run_batch_branch_profile():
+    """Tests that the branch hits of the entries are written."""
+    bdb_root = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    pyconfig.set("BRANCH_PROFILE", True)
+    try:
+        pdb_files = [("pdbb/tests/pdb/files/{0:s}.pdb".format(p), p)
+                     for p in ("1crn", "1etu", "3cw1")]
+        run_batch(bdb_root, pdb_files, jobs=2)
+        with open(os.path.join(bdb_root, "bdb_branches.json")) as f:
+            report = json.load(f)
+        eq_(report["entries"], 3)
+        eq_(report["hits"]["decide_refi_data"], [["no_refprog", 1]])
+        eq_(sum(n for _, n in report["hits"]["decide_refprog"]
+                if _.startswith("memo:")), 2)
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        pyconfig.set("BRANCH_PROFILE", False)
+        shutil.rmtree(bdb_root)
+
+
+def test_run_redecide():
+    """Tests that the features stored by a batch are decided again."""
+    bdb_root = tempfile.mkdtemp()
+    old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+    store_path = os.path.join(bdb_root, "features.db")
+    pyconfig.set("FEATURE_STORE", store_path)
+    try:
+        pdb_files = [("pdbb/tests/pdb/files/{0:s}.pdb".format(p), p)
+                     for p in ("1crn", "1etu", "3cw1")]
+        run_batch(bdb_root, pdb_files, jobs=2)
+        eq_(run_redecide(bdb_root, store_path), (3, {}))
+        with open(os.path.join(bdb_root, "bdb_redecide.json")) as f:
+            eq_(json.load(f), {"entries": 3, "changed": {}})
+    finally:
+        pyconfig.set("BDB_FILE_DIR_PATH", old_dir)
+        pyconfig.set("FEATURE_STORE", None)
+        shutil.rmtree(bdb_root)
@@ -16,7 +16,8 @@
 #    If not, see <http://www.gnu.org/licenses/>.
 from nose.tools import eq_, raises
 
-from pdbb.bdb_utils import (is_valid_directory, is_valid_file, is_valid_pdbid)
+from pdbb.bdb_utils import (get_pdb_id_from_file_name, is_valid_directory,
+                            is_valid_file, is_valid_pdbid)
 
 import argparse
 
@@ -99,3 +100,13 @@ def test_is_valid_pdbid_false():
 
     pdb_id = "(crn"
     is_valid_pdbid(parser, pdb_id)
+
+
+def test_get_pdb_id_from_file_name():
+    """Tests that PDB IDs are derived from PDB file names."""
+    eq_(get_pdb_id_from_file_name("pdbb/tests/pdb/files/1crn.pdb"), "1crn")
+    eq_(get_pdb_id_from_file_name("/data/pdb/cr/pdb1CRN.ent"), "1crn")
+    eq_(get_pdb_id_from_file_name("/data/pdb/cr/pdb1crn.ent.gz"), "1crn")
+    eq_(get_pdb_id_from_file_name("1crn.pdb.tar"), None)
+    eq_(get_pdb_id_from_file_name("pdbb/tests/pdb/files/ht.pdb"), None)
+    eq_(get_pdb_id_from_file_name("pdbb/tests/pdb/files/empty"), None)
@@ -0,0 +1,64 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+from pdbb.benchmarks.compare import bootstrap_speedup, compare_results
+
+
+def results(stages):
+    return {"options": {}, "results": [
+        {"atoms": 1000, "stages": dict(
+            (s, {"times": t}) for s, t in stages.items())}]}
+
+
+def test_bootstrap_speedup():
+    """Tests the speedup of the medians and its interval."""
+    speedup, low, high = bootstrap_speedup([2.0, 2.1, 1.9, 2.0, 2.0],
+                                           [1.0, 1.05, 0.95, 1.0, 1.0])
+    eq_(speedup, 2.0)
+    ok_(1.5 < low <= speedup <= high < 2.5)
+
+
+def test_compare_results():
+    """Tests that only tracked stages beyond the threshold regress."""
+    base = results({"check_beq": [1.0, 1.01, 0.99, 1.0, 1.0],
+                    "parse_pdb_file": [1.0, 1.01, 0.99, 1.0, 1.0],
+                    "get_structure": [1.0, 1.01, 0.99, 1.0, 1.0]})
+    new = results({"check_beq": [1.5, 1.51, 1.49, 1.5, 1.5],
+                   "parse_pdb_file": [1.05, 1.06, 1.04, 1.05, 1.05],
+                   "get_structure": [1.5, 1.51, 1.49, 1.5, 1.5]})
+    comparison = compare_results(base, new, threshold=0.1)
+    eq_([(c["stage"], c["tracked"], c["regression"]) for c in comparison],
+        [("check_beq", True, True),
+         ("get_structure", False, False),
+         ("parse_pdb_file", True, False)])
+
+
+def test_compare_results_missing():
+    """Tests that tracked stages and sizes missing from the new run
+    regress, and untracked stages are skipped."""
+    base = results({"check_beq": [1.0], "parse_refprog": [1.0],
+                    "get_structure": [1.0]})
+    base["results"].append({"atoms": 10,
+                            "stages": {"check_beq": {"times": [1.0]}}})
+    new = results({"check_beq": [1.0]})
+    comparison = compare_results(base, new)
+    eq_([(c["atoms"], c["stage"], c["missing"], c["regression"])
+         for c in comparison],
+        [(10, "check_beq", True, True),
+         (1000, "check_beq", False, False),
+         (1000, "parse_refprog", True, True)])
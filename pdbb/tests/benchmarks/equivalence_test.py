@@ -0,0 +1,88 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+from pdbb.benchmarks.equivalence import (diff_bdbd, diff_bytes,
+                                         run_equivalence, summarize)
+from pdbb.check_beq import determine_b_group
+from pdbb.fastpaths import FAST_PATHS, default_fast_paths, register_fast_path
+
+
+def same_b_group(structure):
+    return determine_b_group(structure)
+
+
+def wrong_b_group(structure):
+    group = determine_b_group(structure)
+    group["protein_b"] = "overall"
+    return group
+
+
+def test_diff_bdbd():
+    """Tests that differing and missing fields are reported."""
+    eq_(diff_bdbd({"a": 1, "b": 1.0, "c": "x", "timings": 1},
+                  {"a": 1, "b": 1.001, "d": None, "timings": 2},
+                  float_tol=0.01),
+        [("c", "x", "<missing>"), ("d", "<missing>", None)])
+    eq_(diff_bdbd({"a": [{"b": 1.0}]}, {"a": [{"b": 1.001}]}, 0.01), [])
+    eq_(diff_bdbd({"a": [1.0]}, {"a": [1.0, 2.0]}, 0.01),
+        [("a", [1.0], [1.0, 2.0])])
+
+
+def test_diff_bytes():
+    """Tests that the first differing line is reported."""
+    eq_(diff_bytes(b"a\nb\n", b"a\nb\n"), None)
+    eq_(diff_bytes(b"a\nb\n", b"a\nc\n"), "line 2: 'b' != 'c'")
+    eq_(diff_bytes(b"a\n", None), "file missing")
+
+
+def test_run_equivalence():
+    """Tests that mismatching fast paths are reported per entry."""
+    register_fast_path("test_same", same_b_group,
+                       ["pdbb.application.determine_b_group"])
+    register_fast_path("test_wrong", wrong_b_group,
+                       ["pdbb.application.determine_b_group"])
+    pdb_files = [("pdbb/tests/pdb/files/1crn.pdb", "1crn"),
+                 ("pdbb/tests/pdb/files/3zzw.pdb", "3zzw")]
+    try:
+        results = run_equivalence(pdb_files, names=["test_same"], jobs=2)
+        summary = summarize(results)
+        eq_(summary["entries"], 2)
+        eq_(summary["mismatched"], {})
+        ok_("determine_b_group" in summary["stages"])
+
+        results = run_equivalence(pdb_files, names=["test_wrong"], jobs=2)
+        eq_([r["pdb_id"] for r in results], ["1crn", "3zzw"])
+        eq_(results[0]["mismatches"],
+            [("protein_b", "individual", "overall")])
+    finally:
+        del FAST_PATHS["test_same"]
+        del FAST_PATHS["test_wrong"]
+
+
+def test_run_equivalence_registered():
+    """Tests that the registered fast paths equal their references."""
+    eq_(default_fast_paths(), ["b_group_votes", "b_segment_starts",
+                               "classify_chain", "parallel_parse",
+                               "tls_group_masks"])
+    pdb_files = [("pdbb/tests/pdb/files/1hlz.pdb", "1hlz"),
+                 ("pdbb/tests/pdb/files/2wnl.pdb", "2wnl"),
+                 ("pdbb/tests/pdb/files/3zzw.pdb", "3zzw")]
+    for names in (None, ["streaming"]):
+        results = run_equivalence(pdb_files, names=names, jobs=2,
+                                  float_tol=1e-9)
+        eq_(summarize(results)["mismatched"], {})
@@ -0,0 +1,68 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import json
+import shutil
+import tempfile
+
+from pdbb.benchmarks.stages import DEFAULT_SIZES, STAGES, run_benchmarks
+
+
+def test_run_benchmarks():
+    """Tests that all stages are timed for every size."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = run_benchmarks(work_dir, sizes=[50, 100], repeat=2,
+                                 anisou=True, tls_groups=1)
+    finally:
+        shutil.rmtree(work_dir)
+    eq_([r["atoms"] for r in results["results"]], [50, 100])
+    eq_(results["repeat"], 2)
+    eq_(results["options"]["tls_groups"], 1)
+    for r in results["results"]:
+        eq_(sorted(r["stages"].keys()), sorted(STAGES))
+        for s in r["stages"].values():
+            eq_(len(s["times"]), 2)
+            ok_(0 <= s["min"] <= s["median"])
+    json.dumps(results)
+
+
+def test_run_benchmarks_stages():
+    """Tests that only the requested stages are timed."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = run_benchmarks(work_dir, sizes=[50], repeat=1,
+                                 stages=["parse_pdb_file", "check_beq"],
+                                 program="NULL")
+    finally:
+        shutil.rmtree(work_dir)
+    eq_(sorted(results["results"][0]["stages"].keys()),
+        ["check_beq", "parse_pdb_file"])
+
+
+def test_run_benchmarks_default_sizes():
+    """Tests that files of the default sizes are written and timed."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = run_benchmarks(work_dir, sizes=DEFAULT_SIZES, repeat=1,
+                                 stages=["parse_pdb_file"])
+    finally:
+        shutil.rmtree(work_dir)
+    eq_([r["atoms"] for r in results["results"]], list(DEFAULT_SIZES))
+    for r in results["results"]:
+        eq_(list(r["stages"].keys()), ["parse_pdb_file"])
@@ -0,0 +1,87 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_, raises
+
+import os
+import shutil
+import tempfile
+
+from pdbb.benchmarks.synthetic import tls_ranges, write_synthetic_pdb
+from pdbb.check_beq import check_beq, determine_b_group, get_structure
+from pdbb.pdb.parser import (parse_num_tls_groups, parse_other_ref_remarks,
+                             parse_pdb_file, parse_ref_prog,
+                             parse_tls_selection, is_tls_residual)
+
+
+def test_tls_ranges():
+    """Tests that TLS groups are spread over chains and residues."""
+    eq_(tls_ranges([10, 5], 3),
+        [("A", 1, 5), ("A", 6, 10), ("B", 1, 5)])
+
+
+@raises(ValueError)
+def test_tls_ranges_too_many_groups():
+    """Tests that a chain needs at least one residue per TLS group."""
+    tls_ranges([1], 2)
+
+
+def test_write_synthetic_pdb():
+    """Tests that the synthetic file has the requested composition."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        pdb_file_path = os.path.join(out_dir, "9xyz.pdb")
+        atoms = write_synthetic_pdb(pdb_file_path, 98, n_chains=2,
+                                    anisou=True, tls_groups=3,
+                                    tls_residual=True, remark3_lines=4,
+                                    program="PHENIX (phenix.refine)")
+        eq_(atoms, 100)
+        records = parse_pdb_file(pdb_file_path)
+        eq_(len(records["ATOM  "]), 100)
+        eq_(len(records["ANISOU"]), 100)
+        eq_(len(records["TER   "]), 2)
+        eq_(parse_ref_prog(records), "PHENIX (phenix.refine)")
+        eq_(parse_num_tls_groups(records), 3)
+        eq_(len(parse_tls_selection(records)), 3)
+        ok_(is_tls_residual(records))
+        ok_(parse_other_ref_remarks(records).startswith(
+            "SYNTHETIC BENCHMARK ENTRY."))
+
+        structure = get_structure(pdb_file_path, "9xyz")
+        eq_([c.get_id() for c in structure.get_chains()], ["A", "B"])
+        eq_(check_beq(structure)["beq_identical"], 1.0)
+        eq_(determine_b_group(structure)["protein_b"], "individual")
+    finally:
+        shutil.rmtree(out_dir)
+
+
+@raises(ValueError)
+def test_write_synthetic_pdb_too_many_residues():
+    """Tests that residue numbers must fit the residue number field."""
+    write_synthetic_pdb(os.devnull, 50000 * 5, n_chains=1)
+
+
+def test_write_synthetic_pdb_chains():
+    """Tests that large files are split over chains by default."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        pdb_file_path = os.path.join(out_dir, "9xyz.pdb")
+        eq_(write_synthetic_pdb(pdb_file_path, 100000), 100000)
+        with open(pdb_file_path) as f:
+            chains = set(l[21] for l in f if l.startswith("ATOM"))
+        eq_(chains, set("ABC"))
+    finally:
+        shutil.rmtree(out_dir)
@@ -0,0 +1,91 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_
+
+import json
+import os
+import pyconfig
+import shutil
+import tempfile
+
+from collections import Counter
+
+from pdbb.branches import (branch_counts, branch_report, hit, recording,
+                           replay, reset_branch_counts, write_branch_counts)
+
+
+def setup():
+    pyconfig.set("BRANCH_PROFILE", True)
+    reset_branch_counts()
+
+
+def teardown():
+    pyconfig.set("BRANCH_PROFILE", False)
+    reset_branch_counts()
+
+
+def test_hit():
+    """Tests that hits are counted only with BRANCH_PROFILE, as it was set
+    at the last reset."""
+    reset_branch_counts()
+    hit("f", "a")
+    hit("f", "a")
+    pyconfig.set("BRANCH_PROFILE", False)
+    hit("f", "b", 1)
+    eq_(branch_counts(), Counter({("f", "a"): 2, ("f", "b", 1): 1}))
+    reset_branch_counts()
+    hit("f", "a")
+    eq_(branch_counts(), Counter())
+    pyconfig.set("BRANCH_PROFILE", True)
+    reset_branch_counts()
+    eq_(branch_counts(), Counter())
+
+
+def test_recording_replay():
+    """Tests that recorded branches are counted again by replay."""
+    pyconfig.set("BRANCH_PROFILE", False)
+    reset_branch_counts()
+    with recording() as outer:
+        hit("f", "a")
+        with recording() as inner:
+            hit("g", "b")
+    hit("f", "c")
+    pyconfig.set("BRANCH_PROFILE", True)
+    reset_branch_counts()
+    eq_(outer, [("f", "a"), ("g", "b")])
+    eq_(inner, [("g", "b")])
+    replay(outer)
+    replay(outer)
+    eq_(branch_counts(), Counter({("f", "a"): 2, ("g", "b"): 2}))
+
+
+def test_branch_report():
+    counts = Counter({("f", "a"): 1, ("f", "b", None): 3, ("g", "c", 2): 1,
+                      ("f", "d"): 1})
+    eq_(branch_report(counts), {"f": [["b:None", 3], ["a", 1], ["d", 1]],
+                                "g": [["c:2", 1]]})
+
+
+def test_write_branch_counts():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "branches.json")
+        write_branch_counts(path, Counter({("f", "a"): 2}), 2)
+        with open(path) as f:
+            eq_(json.load(f), {"entries": 2, "hits": {"f": [["a", 2]]}})
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -17,11 +17,15 @@
 from nose.tools import eq_, ok_, raises
 
 from pdbb.check_beq import (check_beq, check_combinations, check_tls_range,
-                            determine_b_group, get_structure, is_calpha_trace,
+                            classify_chain, classify_chains,
+                            determine_b_group, determine_b_group_chains,
+                            determine_b_segments, b_segment_starts,
+                            get_structure, is_calpha_trace,
                             is_phos_trace, has_amino_acid_backbone,
                             has_sugar_phosphate_backbone, is_heavy_backbone,
                             is_nucleic_chain, is_protein_chain,
                             multiply_bfactors_8pipi)
+from pdbb.pdb.atoms import ATOM_DTYPE, read_atom_table
 
 import numpy as np
 
@@ -39,6 +43,13 @@ def test_check_beq_identical():
     eq_(result["correct_uij"], True)
 
 
+def test_get_structure_buffer():
+    """Tests that a structure is read from a buffer."""
+    with open("pdbb/tests/pdb/files/3zzw.pdb", "rb") as f:
+        structure = get_structure(memoryview(f.read()), "3zzw")
+    eq_(check_beq(structure)["beq_identical"], 1.0)
+
+
 def test_check_beq_incorrect_uij():
     """Tests check_beq.
 
@@ -153,6 +164,44 @@ def test_check_tls_range_true():
     eq_(result, True)
 
 
+def test_classify_chains():
+    """Tests classify_chains."""
+    pdb_file_path = "pdbb/tests/pdb/files/1efg.pdb"
+    pdb_id = "1efg"
+    structure = get_structure(pdb_file_path, pdb_id)
+    result = [(c.get_id(), t) for c, t in classify_chains(structure)]
+    eq_(result, [("A", "calpha_trace"), ("B", "calpha_trace"),
+                 ("C", "calpha_trace")])
+
+
+def test_classify_chain_nucleic():
+    """Tests classify_chain with dna/rna."""
+    pdb_file_path = "pdbb/tests/pdb/files/100d.pdb"
+    pdb_id = "100d"
+    structure = get_structure(pdb_file_path, pdb_id)
+    result = classify_chain(structure.get_chains().next())
+    eq_(result, "nucleic")
+
+
+def test_classify_chain_same_as_is_chain():
+    """Tests that classify_chain agrees with the is_* chain tests."""
+    for pdb_id in ("100d", "1c0q", "1crn", "1efg", "1hlz", "3cw1"):
+        pdb_file_path = "pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id)
+        structure = get_structure(pdb_file_path, pdb_id)
+        for c in structure.get_chains():
+            if is_protein_chain(c):
+                expected = "protein"
+            elif is_nucleic_chain(c):
+                expected = "nucleic"
+            elif is_calpha_trace(c):
+                expected = "calpha_trace"
+            elif is_phos_trace(c):
+                expected = "phos_trace"
+            else:
+                expected = None
+            eq_(classify_chain(c), expected)
+
+
 def test_determine_b_group_protein_overall():
     """Tests that b_group is correctly determined."""
     pdb_file_path = "pdbb/tests/pdb/files/1etu.pdb"
@@ -367,6 +416,37 @@ def test_determine_b_group_nousefulres():
     eq_(result["phos_only"], False)
 
 
+def test_determine_b_group_chains():
+    """Tests that the b_group of all chains is determined."""
+    for pdb_id, expected in [
+            ("1crn", {"A": "individual"}),
+            ("1etu", {"A": "overall"}),
+            ("1hlz", {"A": "residue_1ADP", "B": "residue_1ADP",
+                      "C": "residue_2ADP", "D": "residue_2ADP"}),
+            ("1mcb", {"A": "no_b-factors", "B": "no_b-factors",
+                      "P": "residue_1ADP"}),
+            ("3zzt", {"A": "residue_2ADP", "B": "residue_2ADP"})]:
+        atoms = read_atom_table(
+            "pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id))
+        eq_(determine_b_group_chains(atoms), expected)
+
+
+def test_determine_b_group_chains_full():
+    """Tests that all residues are taken into account.
+
+        The first ten residues of 1av1 have the same B-factor, but the
+        B-factor differs per stretch of residues.
+    """
+    atoms = read_atom_table("pdbb/tests/pdb/files/1av1.pdb")
+    eq_(determine_b_group_chains(atoms)["A"], "residue_1ADP")
+
+
+def test_determine_b_group_chains_empty():
+    """Tests that chains without useful residues are not reported."""
+    atoms = read_atom_table("pdbb/tests/pdb/files/1crn.pdb")
+    eq_(determine_b_group_chains(atoms[:0]), {})
+
+
 @raises(IOError)
 def test_get_structure_invalid_path():
     """Tests get_structure."""
@@ -375,6 +455,132 @@ def test_get_structure_invalid_path():
     get_structure(pdb_file_path, pdb_id, verbose=True)
 
 
+def test_determine_b_segments_domains():
+    """Tests that chains with an overall B-factor per domain are found.
+
+    1efg chain A contains 6 protein domains (each with a different overall
+    B-factor).
+    """
+    atoms = read_atom_table("pdbb/tests/pdb/files/1efg.pdb")
+    result = determine_b_segments(atoms)
+    eq_(result["overall_segments"], {"A": "domain_overall", "B": "overall",
+                                     "C": "overall"})
+    segments = result["b_segments"]["A"]
+    eq_(len(segments), 6)
+    eq_(segments[0], {"first": "1", "last": "285", "residues": 261,
+                      "b": 29.29})
+    eq_([s["b"] for s in segments[1:]], [36.11, 50.04, 31.31, 44.86, 31.31])
+
+
+def test_determine_b_segments():
+    """Tests determine_b_segments."""
+    for pdb_id, expected in (("1crn", {"A": None}),
+                             ("1etu", {"A": "overall"}),
+                             ("1hlz", {"A": None, "B": None, "C": None,
+                                       "D": None}),
+                             ("1mcb", {"A": "no_b-factors",
+                                       "B": "no_b-factors",
+                                       "P": "no_b-factors"})):
+        atoms = read_atom_table(
+            "pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id))
+        result = determine_b_segments(atoms)
+        eq_(result["overall_segments"], expected)
+        eq_(sorted(result["b_segments"]),
+            sorted(c for c, g in expected.items() if g is not None))
+
+
+def test_determine_b_segments_empty():
+    """Tests determine_b_segments without atoms."""
+    atoms = read_atom_table("pdbb/tests/pdb/files/empty")
+    eq_(determine_b_segments(atoms),
+        {"overall_segments": {}, "b_segments": {}})
+
+
+def ca_atoms(chains, bfactors):
+    """Return an atom table of CA atoms, one per residue, numbered from 1
+    per chain."""
+    atoms = np.zeros(len(chains), dtype=ATOM_DTYPE)
+    atoms["chain"] = list(chains)
+    atoms["name"] = "CA"
+    atoms["occupancy"] = 1.0
+    atoms["bfactor"] = bfactors
+    for c in set(chains):
+        in_chain = atoms["chain"] == c
+        atoms["resseq"][in_chain] = np.arange(
+            1, np.count_nonzero(in_chain) + 1)
+    return atoms
+
+
+def test_determine_b_segments_drift():
+    """Tests that a slow drift of the B-factors is not one segment."""
+    atoms = ca_atoms("A" * 100, 10 + 0.0006 * np.arange(100))
+    result = determine_b_segments(atoms)
+    eq_(result["overall_segments"], {"A": "domain_overall"})
+    eq_([(s["first"], s["last"]) for s in result["b_segments"]["A"]],
+        [("1", "17"), ("18", "34"), ("35", "51"), ("52", "68"),
+         ("69", "85"), ("86", "100")])
+
+
+def test_determine_b_segments_split_chain():
+    """Tests that the blocks of a chain are segmented together."""
+    atoms = ca_atoms("A" * 20 + "B" * 20 + "A" * 20,
+                     [10.0] * 20 + [20.0] * 20 + [10.0] * 10 + [30.0] * 10)
+    result = determine_b_segments(atoms)
+    eq_(result["overall_segments"], {"A": "domain_overall", "B": "overall"})
+    eq_(result["b_segments"]["A"],
+        [{"first": "1", "last": "30", "residues": 30, "b": 10.0},
+         {"first": "31", "last": "40", "residues": 10, "b": 30.0}])
+
+
+def segment_starts(b, first, refs):
+    """Find the segment starts atom by atom."""
+    new_seg = np.zeros(len(b), dtype=bool)
+    chain = -1
+    for i, b_i in enumerate(b):
+        if first[i]:
+            chain += 1
+            seg_b = refs[chain]
+            if np.isnan(seg_b):
+                new_seg[i] = True
+                seg_b = b_i
+        if abs(b_i - seg_b) > 0.01:
+            new_seg[i] = True
+            seg_b = b_i
+    return new_seg
+
+
+def test_b_segment_starts():
+    """Tests that b_segment_starts finds the segments atom by atom."""
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        n = rng.randint(1, 200)
+        # Steps of 0 to 0.04, so that all cases occur
+        b = 20 + np.cumsum(rng.randint(-4, 5, n) * 0.01 *
+                           (rng.rand(n) < 0.7))
+        first = rng.rand(n) < 0.05
+        first[0] = True
+        refs = np.where(rng.rand(np.count_nonzero(first)) < 0.5, np.nan,
+                        b[first] + rng.randint(-2, 3) * 0.005)
+        eq_(b_segment_starts(b, first, refs).tolist(),
+            segment_starts(b, first, refs).tolist())
+        eq_(b_segment_starts(b, first).tolist(),
+            segment_starts(b, first, [np.nan] * len(refs)).tolist())
+
+
+def test_b_segment_starts_boundary():
+    """Tests b_segment_starts at three times the margin."""
+    first = np.array([True, False, False, False])
+    for b, expected in (([10.00, 9.99, 10.01, 10.00], [0]),
+                        ([10.00, 9.99, 10.02, 10.02], [0, 2]),
+                        ([10.00, 10.01, 9.98, 9.99], [0, 2]),
+                        ([10.00, 10.00, 10.031, 10.03], [0, 2]),
+                        ([10.00, 10.01, 10.01, 10.04], [0, 3])):
+        b = np.array(b)
+        eq_(np.flatnonzero(b_segment_starts(b, first)).tolist(), expected)
+        eq_(b_segment_starts(b, first).tolist(),
+            segment_starts(b, first, [np.nan]).tolist())
+
+
 def test_get_structure_pdbid_none():
     """Tests get_structure."""
     pdb_file_path = "pdbb/tests/pdb/files/1crn.pdb"
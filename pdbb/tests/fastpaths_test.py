@@ -0,0 +1,76 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_, raises
+
+import pdbb.check_beq
+
+from pdbb.fastpaths import (FAST_PATHS, default_fast_paths, fast_paths,
+                            reference_paths, register_fast_path)
+
+
+def fast_check_beq(structure):
+    return {"beq_identical": None, "correct_uij": None}
+
+
+def test_fast_paths():
+    """Tests that fast paths are patched in and restored."""
+    reference = pdbb.check_beq.check_beq
+    register_fast_path("test_check_beq", fast_check_beq,
+                       ["pdbb.check_beq.check_beq"])
+    try:
+        with fast_paths(["test_check_beq"]):
+            ok_(pdbb.check_beq.check_beq is fast_check_beq)
+        ok_(pdbb.check_beq.check_beq is reference)
+    finally:
+        del FAST_PATHS["test_check_beq"]
+
+
+def test_reference_paths():
+    """Tests that the reference of a default implementation is patched in
+    and that fast paths that are not default are left out."""
+    fast = pdbb.check_beq.check_beq
+    register_fast_path("test_check_beq", fast, ["pdbb.check_beq.check_beq"],
+                       reference=fast_check_beq, default=False)
+    try:
+        ok_("test_check_beq" not in default_fast_paths())
+        with reference_paths(["test_check_beq"]):
+            ok_(pdbb.check_beq.check_beq is fast_check_beq)
+        with fast_paths(["test_check_beq"]):
+            ok_(pdbb.check_beq.check_beq is fast)
+        ok_(pdbb.check_beq.check_beq is fast)
+    finally:
+        del FAST_PATHS["test_check_beq"]
+
+
+@raises(ValueError)
+def test_fast_paths_conflict():
+    """Tests that two fast paths for the same function are rejected."""
+    register_fast_path("test_a", fast_check_beq, ["pdbb.check_beq.check_beq"])
+    register_fast_path("test_b", lambda s: None, ["pdbb.check_beq.check_beq"])
+    try:
+        with fast_paths(["test_a", "test_b"]):
+            pass
+    finally:
+        del FAST_PATHS["test_a"]
+        del FAST_PATHS["test_b"]
+
+
+@raises(ValueError)
+def test_fast_paths_unknown():
+    """Tests that unknown fast paths are rejected."""
+    with fast_paths(["unknown"]):
+        pass
@@ -0,0 +1,99 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import os
+import pyconfig
+import shutil
+import tempfile
+
+from datetime import datetime
+
+from pdbb.application import create_bdb_entry
+from pdbb.features import FeatureStore, redecide, store_features
+from pdbb.refprog import DECISION_FIELDS, decide_refi_data
+
+
+FEATURES = {
+    "pdb_id": "1abc",
+    "dep_date": datetime(2012, 1, 1),
+    "b_type": None,
+    "has_anisou": False,
+    "format_date": datetime(2011, 7, 13),
+    "format_vers": 3.3,
+    "other_refinement_remarks": "HYDROGENS HAVE BEEN ADDED",
+    "b_msqav": False,
+    "refprog": "REFMAC 5.6.0117",
+    "tls_groups": None,
+    "tls_valid": None,
+    "tls_residual": False,
+    "tls_sum": False,
+    "beq_identical": None,
+    "correct_uij": None}
+
+
+class TestFeatureStore(object):
+    """Stores features in a temporary SQLite database."""
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.tmp_dir, "features.db")
+        self.old_dir = pyconfig.get("BDB_FILE_DIR_PATH")
+        pyconfig.set("BDB_FILE_DIR_PATH", self.tmp_dir)
+
+    def teardown(self):
+        pyconfig.set("BDB_FILE_DIR_PATH", self.old_dir)
+        pyconfig.set("FEATURE_STORE", None)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_put_get(self):
+        decisions = dict((f, None) for f in DECISION_FIELDS)
+        with FeatureStore(self.store_path) as store:
+            eq_(len(store), 0)
+            eq_(store.get("1abc"), None)
+            store.put(FEATURES, decisions)
+            store.put(FEATURES, decisions)
+            eq_(len(store), 1)
+        with FeatureStore(self.store_path) as store:
+            eq_(store.get("1abc"), (FEATURES, decisions))
+            eq_(list(store), [("1abc", FEATURES, decisions)])
+
+    def test_redecide(self):
+        pyconfig.set("FEATURE_STORE", self.store_path)
+        refi_data = decide_refi_data(FEATURES)
+        ok_(store_features(FEATURES, refi_data))
+        with FeatureStore(self.store_path) as store:
+            eq_(redecide(store), {})
+            decisions = store.get("1abc")[1]
+            decisions["is_bdb_includable"] = not refi_data["is_bdb_includable"]
+            store.put(FEATURES, decisions)
+            eq_(redecide(store), {"1abc": [
+                ("is_bdb_includable", decisions["is_bdb_includable"],
+                 refi_data["is_bdb_includable"])]})
+        eq_(os.listdir(self.tmp_dir), ["features.db"])
+
+    def test_create_bdb_entry(self):
+        pyconfig.set("FEATURE_STORE", self.store_path)
+        for pdb_id in ("1crn", "3cw1"):
+            create_bdb_entry("pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id),
+                             pdb_id)
+        with FeatureStore(self.store_path) as store:
+            eq_([pdb_id for pdb_id, _, _ in store], ["1crn", "3cw1"])
+            features, decisions = store.get("1crn")
+            eq_(features["refprog"], "PROLSQ")
+            ok_(decisions["is_bdb_includable"])
+            eq_(redecide(store), {})
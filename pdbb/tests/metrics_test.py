@@ -0,0 +1,82 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import json
+import os
+import shutil
+import tempfile
+
+from pdbb.metrics import BatchMetrics
+
+
+def result(pdb_id, outcome, wall, peak_mem_kb, whynot=None, tlsanl=None):
+    return {"pdb_id": pdb_id, "outcome": outcome, "whynot": whynot,
+            "tlsanl": tlsanl, "wall": wall, "peak_mem_kb": peak_mem_kb,
+            "stages": {"parse_pdb_file": wall / 2}}
+
+
+def make_metrics():
+    metrics = BatchMetrics(top_n=2)
+    metrics.add(result("1crn", "bdb", 0.2, 300))
+    metrics.add(result("1etu", "whynot", 0.4, 100,
+                       whynot="No refinement program found"))
+    metrics.add(result("2wnl", "bdb", 3.0, 200, tlsanl="success"))
+    metrics.add(result("3gg8", "whynot", 0.1, 400,
+                       whynot="TLSANL run timed out", tlsanl="timeout"))
+    return metrics
+
+
+def test_batch_metrics_summary():
+    """Tests the counters and top-N lists of the batch metrics."""
+    summary = make_metrics().summary()
+    eq_(summary["entries"], 4)
+    eq_(summary["outcomes"], {"bdb": 2, "whynot": 2})
+    eq_(summary["whynot_reasons"], {"No refinement program found": 1,
+                                    "TLSANL run timed out": 1})
+    eq_(summary["tlsanl"], {"success": 1, "timeout": 1})
+    eq_([e["pdb_id"] for e in summary["slowest"]], ["2wnl", "1etu"])
+    eq_([e["pdb_id"] for e in summary["largest_memory"]], ["3gg8", "1crn"])
+    stage = summary["stages"]["parse_pdb_file"]
+    eq_(stage["count"], 4)
+    eq_(stage["buckets"]["0.05"], 1)
+    eq_(stage["buckets"]["0.25"], 3)
+    eq_(stage["buckets"]["300.0"], 4)
+
+
+def test_batch_metrics_prometheus():
+    """Tests the Prometheus text format of the batch metrics."""
+    lines = make_metrics().prometheus().splitlines()
+    ok_('pdbb_entries_total{outcome="bdb"} 2' in lines)
+    ok_('pdbb_whynot_total{reason="TLSANL run timed out"} 1' in lines)
+    ok_('pdbb_tlsanl_runs_total{outcome="timeout"} 1' in lines)
+    ok_("# TYPE pdbb_stage_seconds histogram" in lines)
+    ok_('pdbb_stage_seconds_bucket{le="+Inf",stage="parse_pdb_file"} 4'
+        in lines)
+    ok_('pdbb_stage_seconds_count{stage="parse_pdb_file"} 4' in lines)
+
+
+def test_batch_metrics_write():
+    """Tests that the metrics files are written."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        make_metrics().write(out_dir, "m.prom", "m.json")
+        eq_(sorted(os.listdir(out_dir)), ["m.json", "m.prom"])
+        with open(os.path.join(out_dir, "m.json")) as f:
+            eq_(json.load(f)["entries"], 4)
+    finally:
+        shutil.rmtree(out_dir)
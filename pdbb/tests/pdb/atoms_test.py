@@ -0,0 +1,133 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import gzip
+import io
+import numpy as np
+import pyconfig
+
+from pdbb.pdb.atoms import (atom_table, coordinate_ranges, first_model,
+                            parallel_atom_table, read_atom_table)
+
+
+def test_read_atom_table():
+    """Tests that the ATOM records are read into the table."""
+    atoms = read_atom_table("pdbb/tests/pdb/files/1crn.pdb")
+    eq_(len(atoms), 327)
+    first = atoms[0]
+    eq_((first["chain"], first["resseq"], first["resname"], first["name"],
+         first["element"]), ("A", 1, "THR", "N", "N"))
+    ok_(np.allclose(first["coord"], [17.047, 14.099, 3.625]))
+    eq_(first["occupancy"], 1.0)
+    eq_(first["bfactor"], 13.79)
+    ok_(not atoms["hetero"].any())
+    ok_(not atoms["has_anisou"].any())
+
+
+def test_read_atom_table_anisou_altloc():
+    """Tests that ANISOU records are matched and altlocs are selected."""
+    atoms = read_atom_table("pdbb/tests/pdb/files/2a83.pdb")
+    eq_(len(atoms), 3897)
+    eq_(atoms["has_anisou"].sum(), 3892)
+    eq_((atoms["altloc"] != "").sum(), 254)
+    ok_(np.allclose(atoms[0]["anisou"],
+                    [0.2832, 0.3082, 0.311, -0.0112, -0.0102, -0.0088]))
+
+
+def test_atom_table_models():
+    """Tests the altloc with the highest occupancy and the models."""
+    lines = [
+        "MODEL        1",
+        "ATOM      1  CA ASER A   1       1.000   1.000   1.000  0.40 10.00"
+        "           C",
+        "ATOM      2  CA BSER A   1       1.000   1.000   1.000  0.60 20.00"
+        "           C",
+        "ATOM      3  CA CSER A   1       1.000   1.000   1.000  0.60 30.00"
+        "           C",
+        "HETATM    4  O   HOH A 101       1.000   1.000   1.000  1.00 40.00"
+        "           O",
+        "ENDMDL",
+        "MODEL        2",
+        "ATOM      1  CA  SER A   1       1.000   1.000   1.000  1.00 50.00"
+        "           C",
+    ]
+    atoms = atom_table(lines)
+    eq_(list(atoms["bfactor"]), [20.0, 40.0, 50.0])
+    eq_(list(atoms["model"]), [0, 0, 1])
+    eq_(list(atoms["hetero"]), [False, True, False])
+    eq_(list(first_model(atoms)["bfactor"]), [20.0, 40.0])
+
+
+def test_atom_table_empty():
+    """Tests that a file without atoms gives an empty table."""
+    eq_(len(atom_table(["HEADER", "END"])), 0)
+
+
+def test_coordinate_ranges():
+    """Tests that the ranges start at atoms and cover all models."""
+    with open("pdbb/tests/pdb/files/ht.pdb", "rb") as f:
+        data = f.read()
+    ranges = coordinate_ranges(data, 4)
+    ok_(1 < len(ranges) <= 4)
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        eq_(end, next_start)
+    for start, _ in ranges:
+        ok_(data[start:start + 6] in ("ATOM  ", "HETATM"))
+    eq_(ranges[-1][1], len(data))
+
+
+def check_parallel_atom_table(pdb_id, jobs):
+    path = "pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id)
+    with open(path) as f:
+        expected = atom_table(f)
+    atoms = parallel_atom_table(path, jobs)
+    eq_(atoms.tobytes(), expected.tobytes())
+
+
+def test_parallel_atom_table():
+    """Tests that the parallel atom table equals the serial one."""
+    for pdb_id in ("1crn", "2a83", "ht"):
+        for jobs in (1, 3, 8):
+            yield check_parallel_atom_table, pdb_id, jobs
+
+
+def test_parallel_atom_table_buffer():
+    """Tests that files in memory are parsed in parallel."""
+    with open("pdbb/tests/pdb/files/ht.pdb", "rb") as f:
+        data = f.read()
+    eq_(parallel_atom_table(memoryview(data), 3).tobytes(),
+        atom_table(data.splitlines(True)).tobytes())
+
+
+def test_read_atom_table_parallel():
+    """Tests that large files are parsed in parallel, also if compressed."""
+    with open("pdbb/tests/pdb/files/2a83.pdb", "rb") as f:
+        data = f.read()
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as f:
+        f.write(data)
+    old = pyconfig.get("PARALLEL_PARSE_MIN_BYTES")
+    pyconfig.set("PARALLEL_PARSE_MIN_BYTES", 0)
+    try:
+        atoms = read_atom_table("pdbb/tests/pdb/files/2a83.pdb")
+        gz_atoms = read_atom_table(memoryview(compressed.getvalue()))
+    finally:
+        pyconfig.set("PARALLEL_PARSE_MIN_BYTES", old)
+    eq_(len(atoms), 3897)
+    eq_(atoms["has_anisou"].sum(), 3892)
+    eq_(gz_atoms.tobytes(), atoms.tobytes())
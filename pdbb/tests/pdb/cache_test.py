@@ -0,0 +1,122 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from mock import patch
+from nose.tools import eq_, ok_
+
+import errno
+import gzip
+import numpy as np
+import os
+import pyconfig
+import shutil
+import tempfile
+import time
+
+from pdbb.pdb.atoms import read_atom_table
+from pdbb.pdb.cache import (cache_path, content_key, evict, load_atom_table,
+                            store_atom_table)
+from pdbb.pdb.files import preloaded
+
+
+PDB_FILE_PATH = "pdbb/tests/pdb/files/1crn.pdb"
+
+
+class TestCache(object):
+    """Saves and reads atom tables in a temporary cache directory."""
+
+    def setup(self):
+        self.atoms = read_atom_table(PDB_FILE_PATH)
+        self.cache_dir = tempfile.mkdtemp()
+        pyconfig.set("ATOM_CACHE_DIR", self.cache_dir)
+
+    def teardown(self):
+        pyconfig.set("ATOM_CACHE_DIR", None)
+        shutil.rmtree(self.cache_dir)
+
+    def test_content_key(self):
+        with open(PDB_FILE_PATH, "rb") as f:
+            data = f.read()
+        key = content_key(PDB_FILE_PATH)
+        eq_(content_key(memoryview(data)), key)
+        with preloaded("1abc.pdb", data):
+            eq_(content_key("1abc.pdb"), key)
+        ok_(content_key(bytearray(data + b"END\n")) != key)
+        with open(PDB_FILE_PATH, "rb") as f:
+            eq_(content_key(f), None)
+
+    def test_content_key_compressed(self):
+        with open(PDB_FILE_PATH, "rb") as f:
+            data = f.read()
+        gz_path = os.path.join(self.cache_dir, "1abc.pdb.gz")
+        with gzip.open(gz_path, "wb") as f:
+            f.write(data)
+        with open(gz_path, "rb") as f:
+            compressed = f.read()
+        key = content_key(PDB_FILE_PATH)
+        eq_(content_key(gz_path), key)
+        eq_(content_key(memoryview(compressed)), key)
+        with preloaded(gz_path, compressed):
+            eq_(content_key(gz_path), key)
+
+    def test_read_atom_table_compressed(self):
+        with open(PDB_FILE_PATH, "rb") as f:
+            data = f.read()
+        gz_path = os.path.join(self.cache_dir, "1abc.pdb.gz")
+        with gzip.open(gz_path, "wb") as f:
+            f.write(data)
+        ok_(not isinstance(read_atom_table(gz_path), np.memmap))
+        with preloaded(gz_path, data):
+            cached = read_atom_table(gz_path)
+        ok_(isinstance(cached, np.memmap))
+        eq_([name for name in os.listdir(self.cache_dir)
+             if name.endswith(".npy")],
+            [os.path.basename(cache_path(content_key(PDB_FILE_PATH)))])
+
+    def test_store_load(self):
+        eq_(load_atom_table("missing"), None)
+        ok_(store_atom_table("key", self.atoms))
+        cached = load_atom_table("key")
+        ok_(isinstance(cached, np.memmap))
+        eq_(cached.dtype, self.atoms.dtype)
+        ok_((cached == self.atoms).all())
+
+    def test_load_read_only(self):
+        store_atom_table("key", self.atoms)
+        with patch("os.utime", side_effect=OSError(errno.EROFS,
+                                                   "Read-only file system")):
+            cached = load_atom_table("key")
+        ok_(cached is not None)
+        ok_((cached == self.atoms).all())
+
+    def test_read_atom_table(self):
+        ok_(not isinstance(read_atom_table(PDB_FILE_PATH), np.memmap))
+        ok_(os.path.exists(cache_path(content_key(PDB_FILE_PATH))))
+        cached = read_atom_table(PDB_FILE_PATH)
+        ok_(isinstance(cached, np.memmap))
+        ok_((cached == self.atoms).all())
+
+    def test_evict(self):
+        for i, key in enumerate(("a", "b", "c")):
+            store_atom_table(key, self.atoms)
+            used = time.time() - 10 + i
+            os.utime(cache_path(key), (used, used))
+        size = os.path.getsize(cache_path("a"))
+        # "a" is used again and "b" is the least recently used table
+        load_atom_table("a")
+        eq_(evict(self.cache_dir, 2 * size), 1)
+        eq_(sorted(os.listdir(self.cache_dir)), ["a.npy", "c.npy"])
+        eq_(evict(self.cache_dir, 2 * size), 0)
@@ -0,0 +1,126 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from mock import patch
+from nose.tools import eq_, ok_, raises
+
+import bz2
+import gzip
+import os
+import pyconfig
+import shutil
+import tempfile
+
+from pdbb.pdb.files import (compression, copy_pdb_file, is_buffer,
+                            is_plain_file, materialized, open_pdb_file,
+                            preloaded, read_pdb_buffer)
+
+
+PDB_FILE_PATH = "pdbb/tests/pdb/files/1crn.pdb"
+
+
+class TestCompressed(object):
+    """Reads gzip and bzip2 compressed copies of a PDB file."""
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(PDB_FILE_PATH, "rb") as f:
+            self.data = f.read()
+        self.gz = os.path.join(self.tmp_dir, "pdb1crn.ent.gz")
+        with gzip.open(self.gz, "wb") as f:
+            f.write(self.data)
+        self.bz2 = os.path.join(self.tmp_dir, "pdb1crn.ent.bz2")
+        with open(self.bz2, "wb") as f:
+            f.write(bz2.compress(self.data))
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_compression(self):
+        eq_(compression(PDB_FILE_PATH), None)
+        eq_(compression(self.gz), "gzip")
+        eq_(compression(self.bz2), "bz2")
+        ok_(is_plain_file(PDB_FILE_PATH))
+        ok_(not is_plain_file(self.gz))
+
+    def test_open_pdb_file(self):
+        for path in (PDB_FILE_PATH, self.gz, self.bz2):
+            with open_pdb_file(path) as f:
+                eq_(f.read(), self.data)
+
+    def test_open_pdb_file_lines(self):
+        with open_pdb_file(self.gz) as f:
+            eq_(list(f), self.data.splitlines(True))
+
+    def test_open_preloaded(self):
+        for path in (self.gz, self.bz2):
+            with open(path, "rb") as f:
+                data = f.read()
+            with preloaded("1crn", data):
+                ok_(not is_plain_file("1crn"))
+                with open_pdb_file("1crn") as f:
+                    eq_(f.read(), self.data)
+
+    def test_read_pdb_buffer(self):
+        for path in (PDB_FILE_PATH, self.gz, self.bz2):
+            eq_(read_pdb_buffer(path)[:], self.data)
+        with open(self.gz, "rb") as f:
+            gz_data = f.read()
+        eq_(read_pdb_buffer(memoryview(gz_data)), self.data)
+        with open(self.gz, "rb") as f:
+            eq_(read_pdb_buffer(f), self.data)
+
+    def test_open_buffer(self):
+        for buf in (memoryview(self.data), bytearray(self.data)):
+            ok_(is_buffer(buf))
+            ok_(not is_plain_file(buf))
+            with open_pdb_file(buf) as f:
+                eq_(f.read(), self.data)
+        ok_(not is_buffer(PDB_FILE_PATH))
+
+    def test_open_compressed_buffer(self):
+        with open(self.gz, "rb") as f:
+            gz_data = f.read()
+        # The compressed contents are read in place, not copied
+        with patch("io.BytesIO", side_effect=AssertionError("copied")):
+            for buf in (memoryview(gz_data), bytearray(gz_data)):
+                with open_pdb_file(buf) as f:
+                    eq_(f.read(), self.data)
+
+    def test_copy_pdb_file(self):
+        dst = os.path.join(self.tmp_dir, "1crn.bdb")
+        copy_pdb_file(self.gz, dst)
+        with open(dst, "rb") as f:
+            eq_(f.read(), self.data)
+
+    def test_materialized(self):
+        old = pyconfig.get("SCRATCH_DIR")
+        pyconfig.set("SCRATCH_DIR", self.tmp_dir)
+        try:
+            with materialized(self.gz) as path:
+                eq_(os.path.dirname(path), self.tmp_dir)
+                with open(path, "rb") as f:
+                    eq_(f.read(), self.data)
+            ok_(not os.path.exists(path))
+            with materialized(PDB_FILE_PATH) as path:
+                eq_(path, PDB_FILE_PATH)
+        finally:
+            pyconfig.set("SCRATCH_DIR", old)
+
+
+@raises(IOError)
+def test_open_pdb_file_missing():
+    open_pdb_file("pdbb/tests/pdb/files/missing.pdb")
@@ -0,0 +1,101 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import os
+import pyconfig
+import shutil
+import tempfile
+
+from pdbb.pdb.index import (index_path, indexed_lines, is_indexable,
+                            read_index, write_index)
+from pdbb.pdb.parser import get_pdb_header_and_trailer, parse_pdb_file
+from pdbb.pdb.records import line_index
+
+
+PDB_FILE_PATH = "pdbb/tests/pdb/files/1crn.pdb"
+
+
+class TestIndex(object):
+    """Writes and reads the index of a copy of a PDB file."""
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pdb = os.path.join(self.tmp_dir, "1crn.pdb")
+        shutil.copy(PDB_FILE_PATH, self.pdb)
+        with open(self.pdb, "rb") as f:
+            self.data = f.read()
+        pyconfig.set("RECORD_INDEX", True)
+
+    def teardown(self):
+        pyconfig.set("RECORD_INDEX", False)
+        pyconfig.set("RECORD_INDEX_DIR", None)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_index_path(self):
+        eq_(index_path(self.pdb), self.pdb + ".idx")
+        pyconfig.set("RECORD_INDEX_DIR", "/idx")
+        eq_(index_path(self.pdb), "/idx/1crn.pdb.idx")
+
+    def test_is_indexable(self):
+        ok_(is_indexable(self.pdb))
+        ok_(not is_indexable(memoryview(self.data)))
+        ok_(not is_indexable(os.path.join(self.tmp_dir, "1abc.pdb")))
+        pyconfig.set("RECORD_INDEX", False)
+        ok_(not is_indexable(self.pdb))
+
+    def test_write_read(self):
+        expected = [list(a) for a in line_index(self.data)]
+        eq_(read_index(self.pdb), None)
+        ok_(write_index(self.pdb, *line_index(self.data)))
+        eq_([list(a) for a in read_index(self.pdb)], expected)
+
+    def test_stale(self):
+        write_index(self.pdb, *line_index(self.data))
+        with open(self.pdb, "ab") as f:
+            f.write(b"END\n")
+        eq_(read_index(self.pdb), None)
+
+    def test_corrupt(self):
+        with open(index_path(self.pdb), "wb") as f:
+            f.write(b"not an index")
+        eq_(read_index(self.pdb), None)
+
+    def test_indexed_lines(self):
+        expected = [list(a) for a in line_index(self.data)]
+        eq_([list(a) for a in indexed_lines(self.pdb, self.data)], expected)
+        ok_(os.path.exists(index_path(self.pdb)))
+        eq_([list(a) for a in indexed_lines(self.pdb, self.data)], expected)
+
+    def test_index_dir(self):
+        index_dir = os.path.join(self.tmp_dir, "idx")
+        os.mkdir(index_dir)
+        pyconfig.set("RECORD_INDEX_DIR", index_dir)
+        indexed_lines(self.pdb, self.data)
+        eq_(os.listdir(index_dir), ["1crn.pdb.idx"])
+
+    def test_parser(self):
+        pyconfig.set("RECORD_INDEX", False)
+        expected = parse_pdb_file(PDB_FILE_PATH)
+        header = parse_pdb_file(PDB_FILE_PATH, header_only=True)
+        header_and_trailer = get_pdb_header_and_trailer(PDB_FILE_PATH)
+        pyconfig.set("RECORD_INDEX", True)
+        eq_(parse_pdb_file(self.pdb), expected)
+        ok_(os.path.exists(index_path(self.pdb)))
+        eq_(parse_pdb_file(self.pdb), expected)
+        eq_(parse_pdb_file(self.pdb, header_only=True), header)
+        eq_(get_pdb_header_and_trailer(self.pdb), header_and_trailer)
@@ -17,10 +17,16 @@
 from datetime import datetime
 from nose.tools import eq_, raises
 
-from pdbb.pdb.parser import (parse_pdb_file, parse_dep_date, parse_exp_methods,
+import gzip
+import io
+
+from pdbb.pdb.files import compression, preloaded
+from pdbb.pdb.parser import (PdbFileReader, parse_pdb_file, parse_dep_date,
+                             parse_exp_methods,
                              parse_btype, parse_other_ref_remarks, is_bmsqav,
                              parse_format_date_version, parse_num_tls_groups,
-                             parse_tls_selection, parse_ref_prog,
+                             parse_tls_selection, parse_tls_groups,
+                             parse_ref_prog,
                              is_tls_residual, is_tls_sum,
                              get_pdb_header_and_trailer)
 
@@ -37,6 +43,81 @@ def test_parser():
     eq_(len(pdb_records["EXPDTA"]), 1)
     eq_(len(pdb_records["ATOM  "]), 327)
     eq_(len(pdb_records["REMARK"]), 224)
+    eq_(pdb_records.count("ATOM  "), 327)
+
+
+def test_parser_header_only():
+    pdb_records = parse_pdb_file("pdbb/tests/pdb/files/1crn.pdb",
+                                 header_only=True)
+    eq_(len(pdb_records["REMARK"]), 224)
+    eq_("ATOM  " in pdb_records, False)
+    eq_("MASTER" in pdb_records, False)
+
+
+def test_pdb_file_reader():
+    """Tests that the records after the header equal those of a full parse,
+    and that a compressed file is kept in memory until the end."""
+    with open("pdbb/tests/pdb/files/1crn.pdb", "rb") as f:
+        data = f.read()
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as f:
+        f.write(data)
+    header = parse_pdb_file("pdbb/tests/pdb/files/1crn.pdb", header_only=True)
+    expected = parse_pdb_file("pdbb/tests/pdb/files/1crn.pdb")
+    with preloaded("1crn.gz", compressed.getvalue()):
+        for pdb_file in ("pdbb/tests/pdb/files/1crn.pdb", "1crn.gz",
+                         memoryview(compressed.getvalue())):
+            with PdbFileReader(pdb_file, keep=True) as reader:
+                eq_(reader.parse_header(), header)
+                eq_(reader.parse(), expected)
+                if pdb_file == "1crn.gz":
+                    eq_(compression(pdb_file), None)
+        eq_(compression("1crn.gz"), "gzip")
+
+
+def test_pdb_file_reader_source():
+    """Tests that the coordinates of a compressed file are read again after
+    its decompressed contents are released."""
+    with open("pdbb/tests/pdb/files/1crn.pdb", "rb") as f:
+        data = f.read()
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as f:
+        f.write(data)
+    expected = parse_pdb_file("pdbb/tests/pdb/files/1crn.pdb")
+    with preloaded("1crn.gz", compressed.getvalue()):
+        with PdbFileReader("1crn.gz", keep=True) as reader:
+            pdb_records = reader.parse()
+        eq_(compression("1crn.gz"), "gzip")
+        eq_(pdb_records, expected)
+        eq_(parse_pdb_file("1crn.gz"), expected)
+
+
+def test_parser_buffer():
+    with open("pdbb/tests/pdb/files/1crn.pdb", "rb") as f:
+        data = f.read()
+    expected = parse_pdb_file("pdbb/tests/pdb/files/1crn.pdb")
+    for buf in (memoryview(data), bytearray(data)):
+        eq_(parse_pdb_file(buf), expected)
+        eq_(get_pdb_header_and_trailer(buf), get_pdb_header_and_trailer(
+            "pdbb/tests/pdb/files/1crn.pdb"))
+    with open("pdbb/tests/pdb/files/1crn.pdb", "rb") as f:
+        eq_(parse_pdb_file(f), expected)
+
+
+def test_parser_short_lines():
+    pdb_records = parse_pdb_file(bytearray(b"HEADER    TEST\nTER\nEND"))
+    eq_(pdb_records, {"HEADER": ["   TEST\n"], "TER\n": [""], "END": [""]})
+
+
+def test_parser_preloaded():
+    with open("pdbb/tests/pdb/files/1crn.pdb", "rb") as f:
+        data = f.read()
+    with preloaded("1crn.pdb", data):
+        pdb_records = parse_pdb_file("1crn.pdb")
+        header, trailer = get_pdb_header_and_trailer("1crn.pdb")
+        eq_(len(pdb_records["ATOM  "]), 327)
+    eq_(header[0][:6], "HEADER")
+    eq_(trailer[-1][:6], "MASTER")
 
 
 def test_parse_dep_date():
@@ -433,6 +514,52 @@ def test_parse_tls_selections():
     eq_(tls_range, expected)
 
 
+def test_parse_tls_groups_refmac():
+    records = {"REMARK": [
+        "  3   NUMBER OF TLS GROUPS  :    2",
+        "  3   TLS GROUP :     1",
+        "  3    NUMBER OF COMPONENTS GROUP :    2",
+        "  3    COMPONENTS        C SSSEQI   TO  C SSSEQI",
+        "  3    RESIDUE RANGE :   A     1        A    50",
+        "  3    RESIDUE RANGE :   A    60        A    80",
+        "  3    ORIGIN FOR THE GROUP (A):   1.0000   2.0000   3.0000",
+        "  3   TLS GROUP :     2",
+        "  3    RESIDUE RANGE :   B    10A       B    99",
+    ]}
+    groups = parse_tls_groups(records)
+    eq_(len(groups), 2)
+    eq_([(r["chain_1"], r["num_1"], r["num_2"]) for r in groups[0]["ranges"]],
+        [("A", 1, 50), ("A", 60, 80)])
+    eq_(groups[1]["ranges"][0]["ic_1"], "A")
+    eq_([g["selection"] for g in groups], [None, None])
+
+
+def test_parse_tls_groups_phenix():
+    records = {"REMARK": [
+        "  3   FREE R VALUE TEST SET SELECTION  : RANDOM",
+        "  3   NUMBER OF TLS GROUPS  : 2",
+        "  3   TLS GROUP : 1",
+        "  3    SELECTION: CHAIN A AND RESID 1:50",
+        "  3    ORIGIN FOR THE GROUP (A):  13.4523  39.2219  25.7440",
+        "  3    T TENSOR",
+        "  3      T11:   0.1408 T22:   0.0871",
+        "  3   TLS GROUP : 2",
+        "  3    SELECTION: (CHAIN A AND RESID 51:100) OR (CHAIN B AND",
+        "  3               RESID 5:20)",
+        "  3    ORIGIN FOR THE GROUP (A):  13.4523  39.2219  25.7440",
+    ]}
+    groups = parse_tls_groups(records)
+    eq_([g["selection"] for g in groups],
+        ["CHAIN A AND RESID 1:50",
+         "(CHAIN A AND RESID 51:100) OR (CHAIN B AND RESID 5:20)"])
+    eq_([g["ranges"] for g in groups], [[], []])
+
+
+def test_parse_tls_groups_none():
+    records = {"REMARK": ["  3   NUMBER OF TLS GROUPS  : NULL ", ]}
+    eq_(parse_tls_groups(records), [])
+
+
 def test_parse_no_ref_prog():
     records = {"REMARK": ["  3                  ", ]}
     ref_prog = parse_ref_prog(records)
@@ -0,0 +1,90 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_
+
+from pdbb.pdb.records import (PdbRecords, coordinate_start, line_index,
+                              startswith)
+
+
+def test_line_index():
+    data = b"HEADER    TEST\nEND\n\nATOM      1\r\nTER"
+    starts, ends, names = line_index(data)
+    eq_(list(starts), [0, 15, 19, 20, 33])
+    eq_(list(ends), [15, 19, 20, 33, 36])
+    eq_(list(names), ["HEADER", "END\n", "\n", "ATOM  ", "TER"])
+    eq_([data[s:e] for s, e in zip(starts, ends)],
+        data.splitlines(True))
+
+
+def test_line_index_start():
+    data = b"HEADER    TEST\nEND\n\nATOM      1\r\nTER"
+    eq_([list(a) for a in line_index(data, 19)],
+        [list(a)[2:] for a in line_index(data)])
+    eq_([len(a) for a in line_index(data, len(data))], [0, 0, 0])
+
+
+def test_line_index_buffers():
+    data = b"REMARK   1\nATOM      1\n"
+    expected = [list(a) for a in line_index(data)]
+    for buf in (memoryview(data), bytearray(data)):
+        eq_([list(a) for a in line_index(buf)], expected)
+
+
+def test_line_index_empty():
+    eq_([len(a) for a in line_index(b"")], [0, 0, 0])
+
+
+def test_startswith():
+    _, _, names = line_index(b"ATOM  \nATOMS\nHETATM\nAT\n")
+    eq_(list(startswith(names, "ATOM")), [True, True, False, False])
+    eq_(coordinate_start(names), 0)
+    eq_(coordinate_start(line_index(b"HEADER\nEND\n")[2]), 2)
+
+
+def test_pdb_records():
+    data = b"REMARK   1 A\nATOM  1\nREMARK   2 B\nATOM      2 CA\n"
+    records = PdbRecords(data, *line_index(data))
+    eq_(records, {"REMARK": ["  1 A\n", "  2 B\n"],
+                  "ATOM  ": ["\n", "   2 CA\n"]})
+    eq_(len(records), 2)
+    eq_("ATOM  " in records, True)
+    eq_("ANISOU" in records, False)
+    eq_(records.count("ATOM  "), 2)
+    eq_(records.count("ANISOU"), 0)
+    eq_(records.nbytes(), 16)
+
+
+def test_pdb_records_buffers():
+    data = b"HEADER    TEST\nHETATM    1\nEND\n"
+    expected = PdbRecords(data, *line_index(data))
+    for buf in (memoryview(data), bytearray(data)):
+        eq_(PdbRecords(buf, *line_index(buf)), expected)
+
+
+def test_pdb_records_source():
+    """Tests that the offset records are read again from the source, not
+    from the buffer, which is not kept."""
+    data = b"HEADER    TEST\nATOM      1 CA\nEND\n"
+    expected = PdbRecords(data, *line_index(data))
+    buf = bytearray(data)
+    records = PdbRecords(buf, *line_index(buf), source=memoryview(data))
+    buf[:] = b" " * len(buf)
+    eq_(records, expected)
+
+
+def test_pdb_records_empty():
+    eq_(PdbRecords(b"", *line_index(b"")), {})
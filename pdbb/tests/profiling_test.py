@@ -0,0 +1,101 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import os
+import shutil
+import tempfile
+
+from pdbb.profiling import (collapsed_stacks, merge_pstats, profile_call,
+                            write_collapsed_stacks)
+
+
+def leaf(n):
+    return sum(range(n))
+
+
+def branch(n):
+    return leaf(n) + leaf(2 * n)
+
+
+def recurse(n):
+    return leaf(n) if n == 0 else recurse(n - 1)
+
+
+def test_profile_call():
+    """Tests that the profile is saved and the return value is passed."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(out_dir, "test.pstats")
+        eq_(profile_call(path, branch, 10), 235)
+        ok_(os.path.getsize(path) > 0)
+    finally:
+        shutil.rmtree(out_dir)
+
+
+def test_merge_pstats():
+    """Tests that call counts of merged profiles are summed."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(out_dir, "{0:d}.pstats".format(i))
+                 for i in range(2)]
+        for p in paths:
+            profile_call(p, branch, 10)
+        stats = merge_pstats(paths)
+        calls = [v[1] for k, v in stats.stats.items() if k[2] == "leaf"]
+        eq_(calls, [4])
+    finally:
+        shutil.rmtree(out_dir)
+
+
+def test_collapsed_stacks():
+    """Tests that stacks are reconstructed from the call graph."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(out_dir, "test.pstats")
+        profile_call(path, branch, 100000)
+        stats = merge_pstats([path])
+        stacks = collapsed_stacks(stats)
+        names = [[label.split("(")[-1] for label in s] for s in stacks]
+        ok_(["branch)", "leaf)"] in [n[:2] for n in names])
+
+        # The sum of the self times is the total time
+        total = sum(v[2] for v in stats.stats.values())
+        ok_(abs(sum(stacks.values()) - total) < 1e-3)
+
+        collapsed = os.path.join(out_dir, "test.collapsed")
+        write_collapsed_stacks(stats, collapsed)
+        with open(collapsed) as f:
+            for line in f:
+                stack, us = line.rsplit(" ", 1)
+                ok_(int(us) > 0)
+    finally:
+        shutil.rmtree(out_dir)
+
+
+def test_collapsed_stacks_recursion():
+    """Tests that recursive calls do not lead to endless stacks."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(out_dir, "test.pstats")
+        profile_call(path, recurse, 50)
+        stacks = collapsed_stacks(merge_pstats([path]))
+        counts = [len([label for label in s if "(recurse)" in label])
+                  for s in stacks]
+        eq_(max(counts), 1)
+    finally:
+        shutil.rmtree(out_dir)
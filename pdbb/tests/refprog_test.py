@@ -14,12 +14,17 @@
 #    You should have received a copy of the GNU General Public License in the
 #    LICENSE file that should have been included as part of this package.
 #    If not, see <http://www.gnu.org/licenses/>.
+import pyconfig
+
+from collections import Counter
 from datetime import datetime
 from mock import patch
 from nose.tools import eq_, raises
 
+from pdbb.branches import branch_counts, reset_branch_counts
 from pdbb.check_beq import get_structure
-from pdbb.refprog import (decide_refprog, decide_refprog_restrain,
+from pdbb.refprog import (clear_decisions, decide_refprog,
+                          decide_refprog_restrain, decision_key,
                           except_refprog_warn, filter_progs, last_used,
                           is_bdb_includable_refprog, one_of_the_two,
                           parse_refprog, get_refi_data)
@@ -1152,6 +1157,90 @@ def test_decide_refprog_nonincludable_refprog(*args):
     eq_(result, expected)
 
 
+NOTLS_INFO = {"prog_last": ["CNS"], "pdb_id": "test", "has_anisou": False,
+              "b_msqav": False, "b_type": None, "tls_groups": None,
+              "tls_valid": None, "tls_residual": False, "tls_sum": False,
+              "format_vers": 3.30, "dep_date": datetime(2012, 1, 1),
+              "other_refinement_remarks": None}
+
+
+def test_decision_key():
+    key = decision_key(NOTLS_INFO)
+    eq_(decision_key(dict(NOTLS_INFO, pdb_id="1abc")), key)
+    eq_(decision_key(dict(NOTLS_INFO, other_refinement_remarks="")), key)
+    eq_(decision_key(dict(NOTLS_INFO, tls_groups=0)), key)
+    eq_(decision_key(dict(NOTLS_INFO, dep_date=datetime(2013, 1, 1))), key)
+    eq_(decision_key(dict(NOTLS_INFO, tls_groups=2)) != key, True)
+    eq_(decision_key(dict(NOTLS_INFO,
+                          other_refinement_remarks="TLS USED")) != key, True)
+    eq_(decision_key({"prog_last": ["CNS"], "pdb_id": "test"}), None)
+
+
+@patch("pdbb.refprog.write_whynot")
+@patch("pdbb.refprog.decide_refprog_notls",
+       return_value=(True, True, False, "Probably full B-factors: CNS"))
+def test_decide_refprog_memoized(decide_notls, write_whynot):
+    clear_decisions()
+    try:
+        expected = (True, True, False, "Probably full B-factors: CNS")
+        eq_(decide_refprog(dict(NOTLS_INFO)), expected)
+        eq_(decide_refprog(dict(NOTLS_INFO, pdb_id="1abc")), expected)
+        eq_(decide_notls.call_count, 1)
+        eq_(write_whynot.call_count, 0)
+    finally:
+        clear_decisions()
+
+
+@patch("pdbb.refprog.write_whynot")
+def test_decide_refprog_report(write_whynot):
+    pdb_info = dict(NOTLS_INFO, tls_residual=True, tls_sum=True)
+    expected = (False, False, False,
+                "Residual and full B-factors (REMARK 3): CNS")
+    eq_(decide_refprog(pdb_info, report=False), expected)
+    eq_(write_whynot.call_count, 0)
+    eq_(decide_refprog(pdb_info), expected)
+    write_whynot.assert_called_once_with("test", expected[3])
+
+
+def test_decide_refprog_branches():
+    """Tests that memoized decisions count the branches of the deciders."""
+    clear_decisions()
+    pyconfig.set("BRANCH_PROFILE", True)
+    reset_branch_counts()
+    try:
+        for _ in range(3):
+            decide_refprog(dict(NOTLS_INFO), report=False)
+        eq_(branch_counts(), Counter({
+            ("decide_refprog", "memo", "miss"): 1,
+            ("decide_refprog", "memo", "hit"): 2,
+            ("decide_refprog", "notls"): 3,
+            ("decide_refprog_notls", "full"): 3}))
+    finally:
+        pyconfig.set("BRANCH_PROFILE", False)
+        reset_branch_counts()
+        clear_decisions()
+
+
+def test_parse_refprog_branches():
+    pyconfig.set("BRANCH_PROFILE", True)
+    reset_branch_counts()
+    try:
+        parse_refprog("CNS 1.1 & 1.3")
+        parse_refprog("REFMAC 5.5, CNS, FOO")
+        last_used(["X-PLOR", "CNS", "CORELS"], ["-", "-", "-"])
+        eq_(branch_counts(), Counter({
+            ("parse_refprog", "exception", "CNS 1.1 & 1.3"): 1,
+            ("parse_refprog", "program", "REFMAC", "version"): 1,
+            ("parse_refprog", "program", "CNS", "-"): 1,
+            ("parse_refprog", "program", "OTHER", "np"): 1,
+            ("last_used", "corels"): 1,
+            ("last_used", "combination", "X-PLOR", "CNS"): 1,
+            ("last_used", "programs", 1): 1}))
+    finally:
+        pyconfig.set("BRANCH_PROFILE", False)
+        reset_branch_counts()
+
+
 def test_except_refprog_warn():
     eq_(except_refprog_warn(), None)
 
@@ -0,0 +1,145 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+from pdbb.check_beq import (check_beq, check_tls_range, determine_b_group,
+                            determine_b_group_chains, determine_b_segments,
+                            get_structure)
+from pdbb.pdb.atoms import read_atom_table
+from pdbb.pdb.parser import (parse_pdb_file, parse_tls_groups,
+                             parse_tls_selection)
+from pdbb.streaming import analyze_atoms, analyze_chains, iter_chain_blocks
+from pdbb.tls import (check_tls_ranges, compile_tls_groups, residue_index,
+                      tls_group_masks, tls_group_stats)
+
+
+def pdb_path(pdb_id):
+    return "pdbb/tests/pdb/files/{0:s}.pdb".format(pdb_id)
+
+
+def test_iter_chain_blocks():
+    lines = [
+        "MODEL        1\n",
+        "ATOM      1  CA  ALA A   1\n",
+        "ANISOU    1  CA  ALA A   1\n",
+        "ATOM      2  CA  ALA A   2\n",
+        "ATOM      3  CA  ALA B   1\n",
+        "TER       4      ALA B   1\n",
+        "HETATM    5  O   HOH B 101\n",
+        "ENDMDL\n",
+        "MODEL        2\n",
+        "ATOM      1  CA  ALA A   1\n",
+        "ENDMDL\n",
+    ]
+    blocks = list(iter_chain_blocks(lines))
+    eq_([(m, [l[6:11] for l in b]) for m, b in blocks],
+        [(0, ["    1", "    1", "    2"]), (0, ["    3"]), (0, ["    5"]),
+         (1, ["    1"])])
+
+
+def check_same_as_structure(pdb_id, whole):
+    pdb_records = parse_pdb_file(pdb_path(pdb_id))
+    structure = get_structure(pdb_path(pdb_id), pdb_id)
+    atoms = read_atom_table(pdb_path(pdb_id))
+    tls_groups = parse_tls_groups(pdb_records)
+    tls_selections = parse_tls_selection(pdb_records)
+    if whole:
+        analysis = analyze_atoms(atoms, tls_groups, tls_selections)
+    else:
+        analysis = analyze_chains(pdb_path(pdb_id), tls_groups,
+                                  tls_selections)
+
+    eq_(analysis.beq(), check_beq(structure))
+    eq_(analysis.b_group(), determine_b_group(structure))
+    eq_(analysis.chain_b(), determine_b_group_chains(atoms))
+    eq_(analysis.b_segments(), determine_b_segments(atoms))
+    if tls_selections:
+        eq_(analysis.check_tls_range(tls_selections),
+            check_tls_range(structure, tls_selections))
+        eq_(analysis.tls_ranges(tls_selections),
+            check_tls_ranges(residue_index(atoms), tls_selections))
+    if tls_groups:
+        compiled = compile_tls_groups(tls_groups)
+        expected = tls_group_stats(atoms, tls_group_masks(atoms, compiled),
+                                   [g["error"] for g in compiled])
+        result = analysis.tls_atoms()
+        # The B-factors are summed per chain
+        for group, expected_group in zip(result["groups"],
+                                         expected["groups"]):
+            ok_(abs(group.pop("mean_b") - expected_group.pop("mean_b")) <
+                1e-9)
+        eq_(result, expected)
+    else:
+        eq_(analysis.tls_atoms(), None)
+
+
+def test_same_as_structure():
+    """Tests that the streaming and atom table results equal those of the
+    structure and the whole entry."""
+    for pdb_id in ("100d", "1efg", "1g8t", "1hlz", "2a83", "2wnl", "3cw1",
+                   "3zzw"):
+        for whole in (False, True):
+            yield check_same_as_structure, pdb_id, whole
+
+
+def ca_records(chain_id, bfactors, first=1):
+    return ["ATOM  {0:5d}  CA  ALA {1:1s}{2:4d}       0.000   0.000   0.000"
+            "  1.00{3:6.2f}           C\n".format(i, chain_id, i, b)
+            for i, b in enumerate(bfactors, first)]
+
+
+def test_segments_dropped():
+    """Tests that the segments of chains that are not overall are dropped
+    and found again if a later block makes the chain overall."""
+    data = "".join(
+        ca_records("A", [10.0 + i for i in range(20)]) + ["TER\n"] +
+        ca_records("B", [20.0] * 20) + ["TER\n"] +
+        ca_records("C", [10.0 + i for i in range(20)]) + ["TER\n"] +
+        ca_records("A", [30.0] * 500, first=21) + ["END\n"])
+    analysis = analyze_chains(memoryview(data))
+    eq_(analysis.segments["A"]["segments"], None)
+    eq_(analysis.segments["B"]["segments"], [
+        {"first": "1", "last": "20", "residues": 20, "b": 20.0}])
+    eq_(analysis.segments["C"]["segments"], None)
+    eq_(analysis.residues, None)
+    result = analysis.b_segments()
+    eq_(result["overall_segments"], {"A": "domain_overall", "B": "overall",
+                                     "C": None})
+    eq_(len(result["b_segments"]["A"]), 21)
+    eq_(result, determine_b_segments(read_atom_table(memoryview(data))))
+
+
+def test_models_same_as_structure():
+    """Tests that the Beq values and chain types are taken from all models
+    and the chain B-factor groups from the first model."""
+    model_2 = ca_records("B", [20.0] * 15)
+    anisou = ["ANISOU" + l[6:28] + "   2533   2533   2533      0      0"
+              "      0       C\n" for l in model_2]
+    data = "".join(
+        ["MODEL        1\n"] + ca_records("A", [10.0 + i for i in range(15)]) +
+        ["ENDMDL\n", "MODEL        2\n"] +
+        [l for pair in zip(model_2, anisou) for l in pair] +
+        ["ENDMDL\n", "END\n"])
+    structure = get_structure(memoryview(data), "9xyz")
+    atoms = read_atom_table(memoryview(data))
+    for analysis in (analyze_chains(memoryview(data)), analyze_atoms(atoms)):
+        eq_(analysis.beq(), check_beq(structure))
+        eq_(analysis.b_group(), determine_b_group(structure))
+        eq_(analysis.chain_b(), determine_b_group_chains(atoms))
+        eq_(analysis.b_segments(), determine_b_segments(atoms))
+    eq_(analysis.beq(), {"beq_identical": 1.0, "correct_uij": True})
+    eq_(sorted(analysis.chain_b()), ["A"])
@@ -0,0 +1,72 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose import SkipTest
+from nose.tools import eq_, ok_, raises
+
+from pdbb.timings import NULL_TIMER, StageTimer
+
+
+def test_stage_timer():
+    """Tests that stages are recorded and accumulated."""
+    timer = StageTimer()
+    with timer.stage("a"):
+        with timer.stage("b"):
+            sum(range(1000))
+    with timer.stage("b"):
+        pass
+    report = timer.report()
+    eq_(sorted(report["stages"].keys()), ["a", "b"])
+    eq_(report["stages"]["a"]["calls"], 1)
+    eq_(report["stages"]["b"]["calls"], 2)
+    for s in report["stages"].values():
+        ok_(s["wall"] >= 0)
+        ok_(s["cpu"] >= 0)
+        ok_(s["peak_mem_kb"] >= 0)
+    ok_(report["memory"] in ("tracemalloc", "vmhwm", "ru_maxrss"))
+
+
+def test_stage_timer_peak_per_stage():
+    """Tests that a stage does not report the peak of an earlier stage."""
+    timer = StageTimer()
+    if timer.memory == "ru_maxrss":
+        raise SkipTest("peak memory cannot be reset")
+    with timer.stage("a"):
+        data = " " * (64 * 1024 * 1024)
+        del data
+    with timer.stage("b"):
+        pass
+    stages = timer.report()["stages"]
+    ok_(stages["a"]["peak_mem_kb"] >= 64 * 1024)
+    ok_(stages["b"]["peak_mem_kb"] < stages["a"]["peak_mem_kb"] - 32 * 1024)
+
+
+@raises(ValueError)
+def test_stage_timer_exception():
+    """Tests that exceptions propagate and the stage is still recorded."""
+    timer = StageTimer()
+    try:
+        with timer.stage("a"):
+            raise ValueError()
+    finally:
+        eq_(timer.report()["stages"]["a"]["calls"], 1)
+
+
+def test_null_timer():
+    """Tests that the disabled timer records nothing."""
+    with NULL_TIMER.stage("a"):
+        pass
+    eq_(NULL_TIMER.report(), None)
@@ -0,0 +1,200 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_, raises
+
+import json
+
+from pdbb.pdb.atoms import atom_table, read_atom_table
+from pdbb.pdb.parser import (parse_pdb_file, parse_tls_groups,
+                             parse_tls_selection)
+from pdbb.tls import (check_tls_ranges, compile_selection,
+                      compile_tls_groups, merge_tls_group_sums, range_mask,
+                      residue_index, tls_group_masks, tls_group_stats,
+                      tls_group_sums, tls_stats_from_sums)
+
+
+def selection(chain_1, num_1, chain_2, num_2, ic_1=None, ic_2=None):
+    return {"chain_1": chain_1, "num_1": num_1, "ic_1": ic_1,
+            "chain_2": chain_2, "num_2": num_2, "ic_2": ic_2}
+
+
+def atom_line(record, serial, resname, chain, resseq, icode=" "):
+    return "{0:6s}{1:5d}  CA  {2:3s} {3:1s}{4:4d}{5:1s}   " \
+        "{6:8.3f}{6:8.3f}{6:8.3f}  1.00 10.00           C\n".format(
+            record, serial, resname, chain, resseq, icode, 1.0)
+
+
+def test_residue_index():
+    """Tests that residues are sorted per chain and waters are excluded."""
+    lines = [atom_line("ATOM", 1, "ALA", "B", 5),
+             atom_line("ATOM", 2, "ALA", "B", 3),
+             atom_line("ATOM", 3, "ALA", "B", 3, "A"),
+             atom_line("ATOM", 4, "ALA", "A", 1),
+             atom_line("HETATM", 5, "GOL", "B", 101),
+             atom_line("HETATM", 6, "HOH", "B", 201)]
+    index = residue_index(atom_table(lines))
+    eq_(index["chains"], ["B", "A"])
+    eq_(list(index["resseq"]), [3, 3, 5, 101, 1])
+    eq_(list(index["icode"]), ["", "A", "", "", ""])
+    eq_(list(index["hetero"]), [False, False, False, True, False])
+    eq_(list(index["std_sum"]), [0, 1, 2, 3, 3, 4])
+    eq_(list(index["gap_pos"]), [1, 2])
+
+
+def test_check_tls_ranges_valid():
+    """Tests a TLS group that covers all residues but a numbering gap."""
+    atoms = read_atom_table("pdbb/tests/pdb/files/4aph.pdb")
+    result = check_tls_ranges(residue_index(atoms),
+                              [selection("A", 40, "A", 625)])
+    eq_(result["groups"], [{"first": "A 40", "last": "A 625",
+                            "first_found": True, "last_found": True,
+                            "residues": 582, "hetero": 0,
+                            "gaps": [["A 434", "A 439"]]}])
+    eq_(result["overlaps"], [])
+    eq_(result["residues"], 582)
+    ok_(0.98 < result["coverage"] < 0.99)
+
+
+def test_check_tls_ranges_missing():
+    """Tests TLS groups with residues that are not in the structure."""
+    pdb_file_path = "pdbb/tests/pdb/files/3gg8.pdb"
+    tls_selections = parse_tls_selection(parse_pdb_file(pdb_file_path))
+    eq_(len(tls_selections), 29)
+    result = check_tls_ranges(residue_index(read_atom_table(pdb_file_path)),
+                              tls_selections)
+    eq_(len(result["groups"]), 29)
+    group = result["groups"][0]
+    eq_((group["first"], group["first_found"], group["last_found"]),
+        ("A 21", False, True))
+    group = [g for g in result["groups"] if g["first"] == "D 20"][0]
+    eq_((group["first_found"], group["last_found"], group["residues"]),
+        (False, False, 0))
+    eq_(result["overlaps"], [])
+    json.dumps(result)
+
+
+def test_check_tls_ranges_overlaps():
+    """Tests that overlapping TLS groups and unknown chains are reported."""
+    atoms = read_atom_table("pdbb/tests/pdb/files/4aph.pdb")
+    result = check_tls_ranges(residue_index(atoms),
+                              [selection("A", 40, "A", 100),
+                               selection("A", 90, "A", 200),
+                               selection("A", 95, "A", 96),
+                               selection("Z", 1, "Z", 10)])
+    eq_(result["overlaps"], [[1, 2], [1, 3], [2, 3]])
+    eq_(result["groups"][3]["residues"], 0)
+    eq_(result["residues"], result["groups"][0]["residues"] +
+        result["groups"][1]["residues"] - 11)
+
+
+def test_range_mask():
+    """Tests that residue ranges select whole residues in order."""
+    lines = [atom_line("ATOM", 1, "ALA", "A", 1),
+             atom_line("ATOM", 2, "ALA", "A", 2),
+             atom_line("ATOM", 3, "ALA", "A", 2, "A"),
+             atom_line("ATOM", 4, "ALA", "A", 3),
+             atom_line("ATOM", 5, "ALA", "B", 1)]
+    atoms = atom_table(lines)
+    eq_(list(range_mask(atoms, [selection("A", 2, "A", 2)])),
+        [False, True, False, False, False])
+    eq_(list(range_mask(atoms, [selection("A", 2, "A", 2, ic_2="A")])),
+        [False, True, True, False, False])
+    eq_(list(range_mask(atoms, [selection("A", 3, "B", 1)])),
+        [False, False, False, True, True])
+    eq_(list(range_mask(atoms, [selection("Z", 1, "Z", 3)])),
+        [False] * 5)
+
+
+def test_compile_selection():
+    """Tests PHENIX-style selections."""
+    lines = [atom_line("ATOM", 1, "ALA", "A", 1),
+             atom_line("ATOM", 2, "GLY", "A", 2),
+             atom_line("ATOM", 3, "GLY", "A", 2, "A"),
+             atom_line("ATOM", 4, "ALA", "A", 3),
+             atom_line("ATOM", 5, "ALA", "b", 1),
+             atom_line("HETATM", 6, "HOH", "A", 4)]
+    atoms = atom_table(lines)
+    for text, expected in (
+            ("chain A and resid 1:2", [1, 1, 1, 0, 0, 0]),
+            ("CHAIN A AND RESID 2A:3", [0, 0, 1, 1, 0, 0]),
+            ("chain 'A' and (resseq 2 through 3)", [0, 1, 1, 1, 0, 0]),
+            ("resid :1", [1, 0, 0, 0, 1, 0]),
+            ("chain b or resname gly", [0, 1, 1, 0, 1, 0]),
+            ("chain B", [0, 0, 0, 0, 0, 0]),
+            ("not resname HOH and name CA", [1, 1, 1, 1, 1, 0]),
+            ("all", [1, 1, 1, 1, 1, 1])):
+        eq_(list(compile_selection(text)(atoms)),
+            [bool(e) for e in expected])
+
+
+@raises(ValueError)
+def test_compile_selection_unsupported():
+    """Tests that unsupported selections raise a ValueError."""
+    compile_selection("chain A and within 5 of resname HEM")
+
+
+@raises(ValueError)
+def test_compile_selection_incomplete():
+    """Tests that incomplete selections raise a ValueError."""
+    compile_selection("(chain A and resid 1:10")
+
+
+def test_tls_group_stats():
+    """Tests the statistics and overlaps of TLS group masks."""
+    atoms = read_atom_table("pdbb/tests/pdb/files/4aph.pdb")
+    tls_groups = [
+        {"ranges": [], "selection": "chain A and resid 40:100"},
+        {"ranges": [selection("A", 90, "A", 120)], "selection": None},
+        {"ranges": [], "selection": "chain A and nonsense"},
+        {"ranges": [], "selection": "chain A and resid 95:96"}]
+    compiled = compile_tls_groups(tls_groups)
+    errors = [g["error"] for g in compiled]
+    masks = tls_group_masks(atoms, compiled)
+    eq_(masks.shape, (4, len(atoms)))
+    eq_([e is None for e in errors], [True, True, False, True])
+    result = tls_group_stats(atoms, masks, errors)
+    eq_([g["atoms"] for g in result["groups"]], [504, 259, 0, 16])
+    eq_(result["groups"][2]["mean_b"], None)
+    ok_(result["groups"][0]["mean_b"] > 0)
+    eq_(result["overlaps"], [[1, 2], [1, 4], [2, 4]])
+    eq_(result["atoms_in_groups"], int(masks.any(axis=0).sum()))
+    json.dumps(result)
+
+    # The statistics of parts of the atom table add up
+    half = len(atoms) // 2
+    sums = merge_tls_group_sums(
+        tls_group_sums(atoms[:half], masks[:, :half]),
+        tls_group_sums(atoms[half:], masks[:, half:]))
+    merged = tls_stats_from_sums(sums, errors)
+    eq_([g["atoms"] for g in merged["groups"]], [504, 259, 0, 16])
+    eq_(merged["overlaps"], result["overlaps"])
+    eq_(merged["atoms_outside"], result["atoms_outside"])
+
+
+def test_tls_group_masks_refmac():
+    """Tests that REFMAC-style groups cover the atoms of the ranges."""
+    pdb_file_path = "pdbb/tests/pdb/files/2wnl.pdb"
+    tls_groups = parse_tls_groups(parse_pdb_file(pdb_file_path))
+    atoms = read_atom_table(pdb_file_path)
+    compiled = compile_tls_groups(tls_groups)
+    eq_([g["error"] for g in compiled], [None] * 10)
+    result = tls_group_stats(atoms, tls_group_masks(atoms, compiled))
+    eq_(result["overlaps"], [])
+    for i, chain in enumerate("ABCDEFGHIJ"):
+        in_chain = (atoms["chain"] == chain) & (atoms["resseq"] >= -4) & \
+            (atoms["resseq"] <= 207)
+        eq_(result["groups"][i]["atoms"], int(in_chain.sum()))
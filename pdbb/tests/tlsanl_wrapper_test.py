@@ -0,0 +1,130 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from nose.tools import eq_, ok_
+
+import gzip
+import json
+import os
+import pyconfig
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from pdbb.application import create_bdb_entry
+from pdbb.benchmarks.synthetic import write_synthetic_pdb
+from pdbb.tlsanl_wrapper import (TLSANL_TIMEOUT_MSG, parse_skttls_summ,
+                                 run_tlsanl)
+
+
+STUB_CMD = [sys.executable, "-m", "pdbb.benchmarks.tlsanl_stub"]
+
+
+class TestStub(object):
+    """Runs TLSANL with the stub on a synthetic REFMAC TLS entry."""
+
+    def setup(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.saved = dict((k, pyconfig.get(k)) for k in (
+            "BDB_FILE_DIR_PATH", "TLSANL_CMD", "TLSANL_TIMEOUT"))
+        pyconfig.set("BDB_FILE_DIR_PATH", self.out_dir)
+        pyconfig.set("TLSANL_CMD", STUB_CMD)
+        self.pdb_file_path = os.path.join(self.out_dir, "9xyz.pdb")
+        write_synthetic_pdb(self.pdb_file_path, 200, n_chains=2,
+                            tls_groups=2, tls_residual=True)
+        self.xyzout = os.path.join(self.out_dir, "9xyz.bdb")
+
+    def teardown(self):
+        for k, v in self.saved.items():
+            pyconfig.set(k, v)
+        os.environ.pop("TLSANL_STUB_MODE", None)
+        shutil.rmtree(self.out_dir)
+
+    def run_stub(self, mode):
+        os.environ["TLSANL_STUB_MODE"] = mode
+        return run_tlsanl(self.pdb_file_path, self.xyzout, "9xyz",
+                          log_out_dir=self.out_dir)
+
+    def whynot(self):
+        with open(os.path.join(self.out_dir, "9xyz.whynot")) as f:
+            return f.readline()
+
+    def test_ok(self):
+        """Tests that the stub writes full B-factors and a log."""
+        ok_(self.run_stub("ok"))
+        with open(self.xyzout) as f:
+            lines = f.readlines()
+        atoms = [l for l in lines if l.startswith("ATOM")]
+        eq_(len(atoms), 200)
+        eq_(len([l for l in lines if l.startswith("ANISOU")]), 200)
+        with open(self.pdb_file_path) as f:
+            b_in = float([l for l in f if l.startswith("ATOM")][0][60:66])
+        eq_(float(atoms[0][60:66]), b_in + 20.0)
+        skttls = parse_skttls_summ(os.path.join(
+            self.out_dir, pyconfig.get("TLSANL_LOG")))
+        eq_(skttls, {"skttls_tot": 38, "skttls_95th": 1, "skttls_99th": 0})
+
+    def test_ok_compressed(self):
+        """Tests that compressed input is decompressed for TLSANL."""
+        with open(self.pdb_file_path, "rb") as f, \
+                gzip.open(self.pdb_file_path + ".gz", "wb") as gz:
+            gz.write(f.read())
+        os.environ["TLSANL_STUB_MODE"] = "ok"
+        ok_(run_tlsanl(self.pdb_file_path + ".gz", self.xyzout, "9xyz",
+                       log_out_dir=self.out_dir))
+        with open(self.xyzout) as f:
+            eq_(len([l for l in f if l.startswith("ANISOU")]), 200)
+
+    def test_fail(self):
+        """Tests that a failing run gives a WHY NOT entry."""
+        ok_(not self.run_stub("fail"))
+        eq_(self.whynot(), "COMMENT: Problem with TLS group definitions "
+                           "(TLSANL run unsuccessful)\n")
+
+    def test_small(self):
+        """Tests that a truncated XYZOUT gives a WHY NOT entry."""
+        ok_(not self.run_stub("small"))
+        eq_(self.whynot(), "COMMENT: TLSANL problem\n")
+
+    def test_stderr(self):
+        """Tests that errors on stderr give a WHY NOT entry."""
+        ok_(not self.run_stub("stderr"))
+        eq_(self.whynot(), "COMMENT: Problem with TLS group definitions "
+                           "(TLSANL run unsuccessful)\n")
+
+    def test_hang(self):
+        """Tests that a hanging run is killed after the time limit."""
+        pyconfig.set("TLSANL_TIMEOUT", 0.5)
+        ok_(not self.run_stub("hang"))
+        eq_(self.whynot(), "COMMENT: {0:s}\n".format(TLSANL_TIMEOUT_MSG))
+
+    def test_create_bdb_entry(self):
+        """Tests the TLSANL path of the pipeline with the stub."""
+        ok_(create_bdb_entry(self.pdb_file_path, "9xyz"))
+        with open(os.path.join(self.out_dir, "9xyz.json")) as f:
+            bdbd = json.load(f)
+        eq_(bdbd["req_tlsanl"], True)
+        eq_(bdbd["skttls_tot"], 38)
+
+
+def test_stub_invalid_argument():
+    """Tests that the stub fails on the argument used by check_ccp4."""
+    p = subprocess.Popen(STUB_CMD + ["and_an_invalid_argument"],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    p.communicate()
+    ok_(p.returncode != 0)
@@ -0,0 +1,188 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+import logging
+_log = logging.getLogger(__name__)
+
+import re
+import resource
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+try:
+    _cpu_time = time.process_time
+except AttributeError:  # Python < 3.3
+    _cpu_time = time.clock
+
+
+# Linux: writing 5 to clear_refs resets the peak resident set size (VmHWM)
+_CLEAR_REFS = "/proc/self/clear_refs"
+_STATUS = "/proc/self/status"
+_RE_VMHWM = re.compile(r"^VmHWM:\s*(\d+)\s*kB", re.MULTILINE)
+
+
+def _reset_peak_rss():
+    """Reset the peak resident set size of the process.
+
+    Return False if this is not supported.
+    """
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _peak_rss_kb():
+    """Return the peak resident set size (kB) since the last reset."""
+    with open(_STATUS) as f:
+        return int(_RE_VMHWM.search(f.read()).group(1))
+
+
+def memory_mode():
+    """Return how StageTimer measures peak memory in this process.
+
+    "tracemalloc" : peak traced memory during the stage
+    "vmhwm"       : peak resident set size during the stage (Linux)
+    "ru_maxrss"   : peak resident set size of the process so far, which
+                    includes everything the process did before the stage
+    """
+    if tracemalloc is not None:
+        return "tracemalloc"
+    if _reset_peak_rss():
+        return "vmhwm"
+    return "ru_maxrss"
+
+
+class StageTimer(object):
+    """Record wall time, CPU time and peak memory of pipeline stages.
+
+    Use as
+        timer = StageTimer()
+        with timer.stage("parse_pdb_file"):
+            ...
+        timer.report()
+
+    Peak memory is the peak traced memory (kB) during the stage if tracemalloc
+    is available. Otherwise it is the peak resident set size (kB) during the
+    stage if the process can reset it (Linux), or else the peak resident set
+    size of the process at the end of the stage, which includes all previous
+    stages (see memory_mode).
+
+    Stages may be nested (e.g. check_beq in get_refi_data); the time of a
+    nested stage is included in the time of the enclosing stage. Stages that
+    are entered more than once are accumulated.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.memory = memory_mode()
+        self._open = []  # [name, peak of nested stages] of running stages
+        self._started_tracing = False
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def _peak_kb(self):
+        if self.memory == "tracemalloc":
+            return tracemalloc.get_traced_memory()[1] // 1024
+        elif self.memory == "vmhwm":
+            return _peak_rss_kb()
+        # Linux reports kB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def _start(self, name):
+        if self.memory == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.memory != "ru_maxrss":
+            if self._open:
+                # Keep the peak of the enclosing stage before resetting it
+                self._open[-1][1] = max(self._open[-1][1], self._peak_kb())
+            if self.memory == "vmhwm":
+                _reset_peak_rss()
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        self._open.append([name, 0])
+        return time.time(), _cpu_time()
+
+    def _stop(self, name, wall_start, cpu_start):
+        cpu = _cpu_time() - cpu_start
+        wall = time.time() - wall_start
+        _, nested_peak = self._open.pop()
+        peak_kb = max(nested_peak, self._peak_kb())
+        if self.memory != "ru_maxrss" and self._open:
+            self._open[-1][1] = max(self._open[-1][1], peak_kb)
+        elif self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        s = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0,
+                                          "peak_mem_kb": 0})
+        s["calls"] += 1
+        s["wall"] += wall
+        s["cpu"] += cpu
+        s["peak_mem_kb"] = max(s["peak_mem_kb"], peak_kb)
+        _log.debug("Stage {0:s}: {1:.3f} s wall, {2:.3f} s cpu, "
+                   "{3:d} kB peak memory".format(name, wall, cpu, peak_kb))
+
+    def report(self):
+        """Return the recorded stages as a dict that can be dumped to json."""
+        return {"memory": self.memory,
+                "stages": dict((k, dict(v)) for k, v in self.stages.items())}
+
+
+class _Stage(object):
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.timer._start(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.timer._stop(self.name, *self.start)
+        return False
+
+
+class NullStageTimer(object):
+    """A StageTimer that records nothing (instrumentation disabled)."""
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def report(self):
+        return None
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+NULL_TIMER = NullStageTimer()
@@ -0,0 +1,494 @@
+#    BDB: A databank of PDB entries with full isotropic B-factors.
+#    Copyright (C) 2014  Wouter G. Touw  (<wouter.touw@radboudumc.nl>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License in the
+#    LICENSE file that should have been included as part of this package.
+#    If not, see <http://www.gnu.org/licenses/>.
+from __future__ import division
+
+import logging
+_log = logging.getLogger(__name__)
+
+import heapq
+import re
+
+from pdbb.pdb.atoms import first_model
+
+
+WATERS = (b"HOH", b"WAT", b"DOD")
+
+RE_SEL_TOKEN = re.compile(r"\(|\)|'[^']*'|\"[^\"]*\"|[^\s()'\"]+")
+RE_SEL_RESID = re.compile(r"^(?P<num>-?\d+)(?P<ic>[A-Za-z]?)$")
+RE_SEL_RESID_RANGE = re.compile(
+    r"^(?P<first>-?\d+[A-Za-z]?)?:(?P<last>-?\d+[A-Za-z]?)?$")
+
+
+def _residue_keys(chain_pos, resseq, icode):
+    """Pack chain position, residue number and insertion code in an int64.
+
+    The keys sort as the residues within a chain; a blank insertion code
+    sorts before A-Z.
+    """
+    import numpy as np
+
+    icode = np.asarray(icode, dtype="S1").view(np.uint8)
+    return (np.asarray(chain_pos, dtype=np.int64) << 32) | \
+        ((np.asarray(resseq, dtype=np.int64) + (1 << 23)) << 8) | icode
+
+
+def _chain_positions(atoms, chains=None):
+    """Return the chain IDs in order of appearance, or chains if given, and
+    the chain position of every atom in them (chains that are not in chains
+    get position len(chains))."""
+    import numpy as np
+
+    chain_ids, first, inverse = np.unique(
+        atoms["chain"], return_index=True, return_inverse=True)
+    if chains is None:
+        chains = [str(c) for c in chain_ids[np.argsort(first)]]
+    pos = dict((c, i) for i, c in enumerate(chains))
+    chain_pos = np.array([pos.get(str(c), len(chains)) for c in chain_ids],
+                         dtype=np.int64)
+    return chains, chain_pos[inverse]
+
+
+def residue_index(atoms):
+    """Return a sorted index of the residues in the atom table.
+
+    Only the first model is indexed (see pdbb.pdb.atoms.first_model) and
+    waters are not included. The index is a dict with
+    chains  : the chain IDs in order of appearance
+    keys    : sorted int64 keys of the residues (see _residue_keys)
+    hetero  : True for the HETATM residues in keys
+    resseq  : residue numbers of keys
+    icode   : insertion codes of keys
+    std_sum : the number of non-HETATM residues before each position (the
+              last element is the total)
+    gap_pos : positions i in keys where the numbering of the chain jumps
+              between residue i and residue i + 1
+    """
+    import numpy as np
+
+    atoms = first_model(atoms)
+    atoms = atoms[~np.in1d(atoms["resname"], WATERS)]
+    chains, chain_pos = _chain_positions(atoms)
+    keys, rows = np.unique(
+        _residue_keys(chain_pos, atoms["resseq"], atoms["icode"]),
+        return_index=True)
+    hetero = atoms["hetero"][rows]
+    resseq = atoms["resseq"][rows]
+    same_chain = (keys[1:] >> 32) == (keys[:-1] >> 32)
+    return {
+        "chains": chains,
+        "keys": keys,
+        "hetero": hetero,
+        "resseq": resseq,
+        "icode": atoms["icode"][rows],
+        "std_sum": np.append(0, np.cumsum(~hetero)),
+        "gap_pos": np.flatnonzero(same_chain &
+                                  (resseq[1:] - resseq[:-1] > 1)),
+    }
+
+
+def _label(index, pos):
+    chain = index["chains"][index["keys"][pos] >> 32]
+    return "{0:s} {1:d}{2:s}".format(chain, int(index["resseq"][pos]),
+                                     str(index["icode"][pos]))
+
+
+def _find(index, chain, num, ic):
+    """Return the insertion position of a residue and whether it exists."""
+    import numpy as np
+
+    if chain not in index["chains"]:
+        return None, False
+    key = _residue_keys(index["chains"].index(chain), num, ic or "")
+    pos = int(np.searchsorted(index["keys"], key))
+    return pos, bool(pos < len(index["keys"]) and index["keys"][pos] == key)
+
+
+def check_tls_ranges(index, tls_selections):
+    """Check the TLS residue ranges against the residue index.
+
+    Every range is an interval query on the sorted residue keys, so the cost
+    is O(groups log residues) plus the reported gaps and overlaps.
+
+    Return a dict with
+    groups    : a dict per TLS group (in order) with the first and last
+                residue of the range, whether these exist ("first_found",
+                "last_found"), the number of ATOM ("residues") and HETATM
+                ("hetero") residues in the range and the jumps in the
+                residue numbering in the range ("gaps", as pairs of residues)
+    overlaps  : pairs of TLS group numbers (from 1) that share residues
+    residues  : the number of non-HETATM residues in any TLS group
+    coverage  : residues as a fraction of all non-HETATM residues (None if
+                there are none)
+    """
+    import numpy as np
+
+    groups = []
+    intervals = []
+    for n, group in enumerate(tls_selections, 1):
+        lo, first_found = _find(index, group["chain_1"], group["num_1"],
+                                group["ic_1"])
+        hi, last_found = _find(index, group["chain_2"], group["num_2"],
+                               group["ic_2"])
+        hi = hi + 1 if last_found else hi
+        result = {
+            "first": "{0:s} {1:d}{2:s}".format(
+                group["chain_1"], group["num_1"], group["ic_1"] or ""),
+            "last": "{0:s} {1:d}{2:s}".format(
+                group["chain_2"], group["num_2"], group["ic_2"] or ""),
+            "first_found": first_found,
+            "last_found": last_found,
+            "residues": 0,
+            "hetero": 0,
+            "gaps": [],
+        }
+        if lo is not None and hi is not None and lo < hi:
+            std = int(index["std_sum"][hi] - index["std_sum"][lo])
+            result["residues"] = std
+            result["hetero"] = hi - lo - std
+            gap_pos = index["gap_pos"]
+            for i in gap_pos[np.searchsorted(gap_pos, lo):
+                             np.searchsorted(gap_pos, hi - 1)]:
+                result["gaps"].append([_label(index, i),
+                                       _label(index, i + 1)])
+            intervals.append((lo, hi, n))
+        else:
+            _log.warn("TLS group {0:d} ({1:s} --- {2:s}) has no residues in "
+                      "the structure".format(n, result["first"],
+                                             result["last"]))
+        groups.append(result)
+
+    # Sweep over the ranges sorted by start, keeping the open ranges
+    overlaps = []
+    residues = 0
+    covered_to = 0
+    active = []
+    for lo, hi, n in sorted(intervals):
+        while active and active[0][0] <= lo:
+            heapq.heappop(active)
+        overlaps.extend(sorted([m, n] for _, m in active))
+        heapq.heappush(active, (hi, n))
+        start = max(lo, covered_to)
+        if hi > start:
+            residues += int(index["std_sum"][hi] - index["std_sum"][start])
+            covered_to = hi
+    if overlaps:
+        _log.warn("Overlapping TLS groups: {0}".format(overlaps))
+
+    total = int(index["std_sum"][-1])
+    return {
+        "groups": groups,
+        "overlaps": overlaps,
+        "residues": residues,
+        "coverage": residues / total if total > 0 else None,
+    }
+
+
+def range_mask(atoms, tls_ranges, chains=None):
+    """Return a boolean mask of the atoms in REFMAC-style residue ranges.
+
+    tls_ranges are dicts as returned by pdbb.pdb.parser.parse_tls_selection.
+    Ranges run over the chains in order of appearance, as in residue_index,
+    or in the order of chains if given (e.g. for a part of the atom table).
+    """
+    import numpy as np
+
+    chains, chain_pos = _chain_positions(atoms, chains)
+    keys = _residue_keys(chain_pos, atoms["resseq"], atoms["icode"])
+    mask = np.zeros(len(atoms), dtype=bool)
+    for r in tls_ranges:
+        if r["chain_1"] not in chains or r["chain_2"] not in chains:
+            continue
+        lo = _residue_keys(chains.index(r["chain_1"]), r["num_1"],
+                           r["ic_1"] or "")
+        hi = _residue_keys(chains.index(r["chain_2"]), r["num_2"],
+                           r["ic_2"] or "")
+        mask |= (keys >= lo) & (keys <= hi)
+    return mask
+
+
+def _tokenize(selection):
+    return [t.strip("'\"") if t[0] in "'\"" else t
+            for t in RE_SEL_TOKEN.findall(selection)]
+
+
+def _resid_key(token, last=False):
+    """Return the residue key (number and insertion code) of a resid.
+
+    Without insertion code, the last key of a range includes all insertion
+    codes of the residue.
+    """
+    m = RE_SEL_RESID.match(token)
+    if m is None:
+        raise ValueError("Invalid residue number {0:s}".format(token))
+    ic = ord(m.group("ic").upper()) if m.group("ic") else (255 if last else 0)
+    return (int(m.group("num")) << 8) | ic
+
+
+class _SelectionParser(object):
+    """Recursive descent parser of PHENIX-style atom selections.
+
+    expression := term ("or" term)*
+    term       := factor ("and" factor)*
+    factor     := "not" factor | "(" expression ")" | "all"
+                | ("chain" | "resname" | "name" | "element") word
+                | ("resid" | "resseq") resids
+
+    resids are a residue number (with optional insertion code), first:last
+    (either can be left out) or first through last. The result is a tree
+    of tuples.
+    """
+
+    def __init__(self, selection):
+        self.tokens = _tokenize(selection)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos].lower()
+        return None
+
+    def next(self):
+        if self.pos >= len(self.tokens):
+            raise ValueError("Unexpected end of selection")
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def parse(self):
+        tree = self.expression()
+        if self.peek() is not None:
+            raise ValueError("Unexpected {0:s}".format(self.next()))
+        return tree
+
+    def expression(self):
+        tree = self.term()
+        while self.peek() == "or":
+            self.next()
+            tree = ("or", tree, self.term())
+        return tree
+
+    def term(self):
+        tree = self.factor()
+        while self.peek() == "and":
+            self.next()
+            tree = ("and", tree, self.factor())
+        return tree
+
+    def factor(self):
+        keyword = self.next().lower()
+        if keyword == "not":
+            return ("not", self.factor())
+        if keyword == "(":
+            tree = self.expression()
+            if self.next() != ")":
+                raise ValueError("Missing )")
+            return tree
+        if keyword == "all":
+            return ("all",)
+        if keyword in ("chain", "resname", "name", "element"):
+            return (keyword, self.next())
+        if keyword in ("resid", "resseq"):
+            return self.resids()
+        raise ValueError("Unsupported keyword {0:s}".format(keyword))
+
+    def resids(self):
+        token = self.next()
+        m = RE_SEL_RESID_RANGE.match(token)
+        if m is not None:
+            first = m.group("first")
+            last = m.group("last")
+            return ("resid",
+                    _resid_key(first) if first else None,
+                    _resid_key(last, last=True) if last else None)
+        if self.peek() == "through":
+            self.next()
+            return ("resid", _resid_key(token),
+                    _resid_key(self.next(), last=True))
+        return ("resid", _resid_key(token), _resid_key(token, last=True))
+
+
+def _evaluate(tree, atoms, resid_keys):
+    import numpy as np
+
+    op = tree[0]
+    if op == "or":
+        return _evaluate(tree[1], atoms, resid_keys) | \
+            _evaluate(tree[2], atoms, resid_keys)
+    if op == "and":
+        return _evaluate(tree[1], atoms, resid_keys) & \
+            _evaluate(tree[2], atoms, resid_keys)
+    if op == "not":
+        return ~_evaluate(tree[1], atoms, resid_keys)
+    if op == "all":
+        return np.ones(len(atoms), dtype=bool)
+    if op == "resid":
+        mask = np.ones(len(atoms), dtype=bool)
+        if tree[1] is not None:
+            mask &= resid_keys >= tree[1]
+        if tree[2] is not None:
+            mask &= resid_keys <= tree[2]
+        return mask
+    if op == "chain":
+        return atoms["chain"] == tree[1].encode("ascii")
+    return np.char.upper(atoms[op]) == tree[1].upper().encode("ascii")
+
+
+def compile_selection(selection):
+    """Compile a PHENIX-style atom selection (see _SelectionParser).
+
+    Keywords are case-insensitive. Return a function that returns the
+    boolean mask of the selected atoms of an atom table.
+
+    Raise a ValueError if the selection is not supported.
+    """
+    import numpy as np
+
+    tree = _SelectionParser(selection).parse()
+
+    def mask(atoms):
+        icode = np.char.upper(atoms["icode"]).view(np.uint8)
+        resid_keys = (atoms["resseq"].astype(np.int64) << 8) | icode
+        return _evaluate(tree, atoms, resid_keys)
+    return mask
+
+
+def compile_tls_groups(tls_groups):
+    """Compile the selections of the TLS groups.
+
+    tls_groups are dicts as returned by pdbb.pdb.parser.parse_tls_groups.
+
+    Return a list with a dict per group with the REFMAC-style "ranges", the
+    compiled PHENIX-style "selection" (see compile_selection; None if the
+    group has none) and the "error" message if the selection could not be
+    compiled (None otherwise).
+    """
+    compiled = []
+    for i, group in enumerate(tls_groups):
+        selection = None
+        error = None
+        if group["selection"] is not None:
+            try:
+                selection = compile_selection(group["selection"])
+            except ValueError as ex:
+                error = "{0}".format(ex)
+                _log.warn("TLS group {0:d}: could not compile selection "
+                          "{1:s}: {2:s}".format(i + 1, group["selection"],
+                                                error))
+        compiled.append({"ranges": group["ranges"], "selection": selection,
+                         "error": error})
+    return compiled
+
+
+def tls_group_masks(atoms, compiled, chains=None):
+    """Return the atom masks of the compiled TLS groups.
+
+    The mask of a group selects the atoms in its REFMAC-style residue ranges
+    (see range_mask for chains) and in its PHENIX-style selection. Groups of
+    which the selection could not be compiled select no atoms. Only the
+    first model is selected from (see pdbb.pdb.atoms.first_model).
+
+    Return a 2D boolean array with a row per group and a column per atom of
+    the first model.
+    """
+    import numpy as np
+
+    atoms = first_model(atoms)
+    masks = np.zeros((len(compiled), len(atoms)), dtype=bool)
+    for i, group in enumerate(compiled):
+        if group["error"] is not None:
+            continue
+        if group["ranges"]:
+            masks[i] = range_mask(atoms, group["ranges"], chains)
+        if group["selection"] is not None:
+            masks[i] |= group["selection"](atoms)
+    return masks
+
+
+def tls_group_sums(atoms, masks):
+    """Return the additive statistics of TLS group masks.
+
+    The sums of parts of the atom table can be combined with
+    merge_tls_group_sums and turned into statistics with tls_stats_from_sums.
+    masks are as returned by tls_group_masks, for the first model.
+    """
+    import numpy as np
+
+    atoms = first_model(atoms)
+    membership = masks.sum(axis=0) if len(masks) > 0 else \
+        np.zeros(len(atoms), dtype=int)
+
+    # Only the atoms in more than one group are needed for the pairs
+    shared = np.ascontiguousarray(masks[:, membership > 1].T)
+    overlaps = set()
+    if shared.size > 0:
+        # The distinct group combinations, as bytes
+        for column in np.unique(shared.view(
+                "S{0:d}".format(len(masks))).ravel()):
+            g = np.flatnonzero(np.frombuffer(
+                column.ljust(len(masks), b"\0"), dtype=bool)) + 1
+            overlaps.update((int(a), int(b)) for a in g for b in g if a < b)
+
+    water = np.in1d(atoms["resname"], WATERS)
+    return {
+        "atoms": [int(n) for n in masks.sum(axis=1)],
+        "b_sums": [float(b) for b in masks.dot(atoms["bfactor"])]
+        if len(atoms) > 0 else [0.0] * len(masks),
+        "overlaps": overlaps,
+        "atoms_in_groups": int(np.count_nonzero(membership)),
+        "atoms_outside": int(np.count_nonzero((membership == 0) & ~water)),
+    }
+
+
+def merge_tls_group_sums(sums, other):
+    """Return the tls_group_sums of two parts of the atom table combined."""
+    return {
+        "atoms": [a + b for a, b in zip(sums["atoms"], other["atoms"])],
+        "b_sums": [a + b for a, b in zip(sums["b_sums"], other["b_sums"])],
+        "overlaps": sums["overlaps"] | other["overlaps"],
+        "atoms_in_groups": sums["atoms_in_groups"] +
+        other["atoms_in_groups"],
+        "atoms_outside": sums["atoms_outside"] + other["atoms_outside"],
+    }
+
+
+def tls_stats_from_sums(sums, errors):
+    """Return the tls_group_stats from tls_group_sums."""
+    return {
+        "groups": [{"atoms": n,
+                    "mean_b": b / n if n > 0 else None,
+                    "error": e}
+                   for n, b, e in zip(sums["atoms"], sums["b_sums"], errors)],
+        "overlaps": sorted([a, b] for a, b in sums["overlaps"]),
+        "atoms_in_groups": sums["atoms_in_groups"],
+        "atoms_outside": sums["atoms_outside"],
+    }
+
+
+def tls_group_stats(atoms, masks, errors=None):
+    """Return statistics of the TLS group atom masks.
+
+    Return a dict with
+    groups          : a dict per group with the number of atoms, their mean
+                      B-factor (the residual B-factor if the ATOM records
+                      contain residual B-factors only; None without atoms)
+                      and the selection error (None if compiled)
+    overlaps        : pairs of group numbers (from 1) that share atoms
+    atoms_in_groups : the number of atoms in any group
+    atoms_outside   : the number of atoms, not waters, in no group
+    """
+    if errors is None:
+        errors = [None] * len(masks)
+    return tls_stats_from_sums(tls_group_sums(atoms, masks), errors)
@@ -23,8 +23,13 @@ import os
 import pyconfig
 import re
 import subprocess
+import threading
 
 from pdbb.bdb_utils import write_whynot
+from pdbb.pdb.files import materialized
+
+
+TLSANL_TIMEOUT_MSG = "TLSANL run timed out"
 
 
 def run_tlsanl(pdb_file_path, xyzout, pdb_id, log_out_dir=".",
@@ -41,14 +46,36 @@ def run_tlsanl(pdb_file_path, xyzout, pdb_id, log_out_dir=".",
 
     Detailed documentation for TLSANL can be found at
     http://www.ccp4.ac.uk/html/tlsanl.html.
+
+    TLSANL is run with the TLSANL_CMD command and killed if it runs longer
+    than TLSANL_TIMEOUT seconds (pyconfig). Compressed or preloaded input is
+    written to an uncompressed file in SCRATCH_DIR for the run.
     """
     _log.info("Preparing TLSANL run...")
     success = False
     keyworded_input = "BINPUT t\nBRESID t\nISOOUT FULL\nNUMERIC\nEND\n"
-    p = subprocess.Popen(["tlsanl", "XYZIN", pdb_file_path, "XYZOUT", xyzout],
-                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-    (stdout, stderr) = p.communicate(input=keyworded_input)
+    with materialized(pdb_file_path) as xyzin:
+        p = subprocess.Popen(pyconfig.get("TLSANL_CMD") +
+                             ["XYZIN", xyzin, "XYZOUT", xyzout],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        timeout = pyconfig.get("TLSANL_TIMEOUT")
+        timed_out = threading.Event()
+        if timeout is not None:
+            def kill():
+                if p.poll() is None:
+                    timed_out.set()
+                    try:
+                        p.kill()
+                    except OSError:  # exited in the meantime
+                        pass
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+        try:
+            (stdout, stderr) = p.communicate(input=keyworded_input)
+        finally:
+            if timeout is not None:
+                timer.cancel()
     try:
         with open(os.path.join(log_out_dir, pyconfig.get("TLSANL_LOG")),
                   "w") as tlsanl_log:
@@ -62,7 +89,11 @@ def run_tlsanl(pdb_file_path, xyzout, pdb_id, log_out_dir=".",
                 print(stderr)
     except IOError as ex:
         _log.error(ex)
-    if p.returncode != 0:
+    if timed_out.is_set():
+        message = TLSANL_TIMEOUT_MSG
+        write_whynot(pdb_id, message)
+        _log.error("{0:s} (limit {1} s)".format(message, timeout))
+    elif p.returncode != 0:
         message = "Problem with TLS group definitions (TLSANL run unsuccessful)"
         write_whynot(pdb_id, message)
         _log.error("{0:s}".format(message))
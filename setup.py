@@ -36,9 +36,11 @@ setup(
     ],
     packages=[
         'pdbb',
+        'pdbb.benchmarks',
         'pdbb.pdb',
         'pdbb.tests',
+        'pdbb.tests.benchmarks',
         'pdbb.tests.pdb',
     ],
-    scripts=['scripts/mkbdb', ],
+    scripts=['scripts/mkbdb', 'scripts/mkbdb-batch', 'scripts/tlsanl-stub', ],
 )